@@ -0,0 +1,621 @@
+"""
+Pipeline async: la misma secuencia que pipeline.process_source (descarga ->
+compresión -> transcripción -> clasificación -> notas) sin ocupar un hilo por
+trabajo, de modo que un solo event loop (job_runner.py) lleva muchos a la vez.
+Las decisiones de cada etapa (caché, reanudación, plan de audio, modo de
+transcripción, prompts de notas) son las funciones de yt_helper y pipeline;
+este módulo solo sustituye las llamadas de E/S por sus esperas async.
+
+- Cobalt va por httpx, ffmpeg/ffprobe (también silencedetect, compactación y
+  cortes de fragmentos) son subprocesos asyncio y las esperas de Gemini (cola
+  del limitador, archivo ACTIVE, clasificación) son asyncio: cancelar la tarea
+  corta la etapa en curso y mata el ffmpeg que estuviera corriendo.
+- Cada etapa tiene un plazo (STAGE_DEADLINES). Si vence, el trabajo falla con
+  StageTimeout en lugar de retener recursos durante minutos.
+- Solo lo que no tiene versión async (hash del archivo, subtítulos con yt-dlp,
+  lectura de subtítulos, cliente síncrono de la caché de contexto) va a hilos
+  con asyncio.to_thread; son pasos cortos que no lanzan procesos.
+"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+import rate_limiter
+import tracing
+from audio_chunks import extract_clip_async, split_audio_async, stitch_transcripts
+from audio_compact import COMPACT_ENABLED, compact_audio_async
+from audio_profiles import AudioProfile, choose_profile
+from captions import CAPTIONS_ENABLED, fetch_youtube_captions, is_caption_file, read_caption_file
+from cobalt_client import CobaltError, get_async_cobalt_client
+from config_loader import AsyncSpeculativeDetector, ContextDetector, PromptBuilder, estimate_tokens, get_model_name
+from context_cache import get_context_cache
+from job_store import JobStore
+from media_input import extract_audio_async, probe_media_async
+from model_registry import get_model
+from pipeline import (full_notes_prompt, generate_notes, is_remote_source, open_source_job, reduce_groups,
+                      section_prompts, start_source_trace)
+from upload_cache import get_upload_cache
+from yt_helper import (CHUNK_PROMPT, MAX_TRANSCRIBE_WORKERS, MIN_TRANSCRIPT_CHARS, SPECULATIVE_PREVIEW_SECONDS,
+                       TRANSCRIBE_PROMPT, ProgressCallback, cached_transcript, compact_path, discard_partial,
+                       finish_compact, finish_compress, notify_partial, pending_parts, plan_compress,
+                       preview_path, print_progress, record_download, record_part, resume_audio,
+                       save_transcript, source_key, transcription_mode, youtube_audio_path)
+
+# --- PLAZOS POR ETAPA (segundos; 0 = sin plazo) ---
+DEFAULT_STAGE_DEADLINES = {
+    "captions": 60,
+    "cobalt_resolve": 60,
+    "download": 900,
+    "compress": 600,
+    "compact": 600,
+    "transcribe": 1800,
+    "classify": 180,
+    "generate": 600,
+}
+
+
+def _stage_deadlines() -> Dict[str, float]:
+    """CONTENTNOTES_STAGE_DEADLINES="download=600,transcribe=1200" ajusta los plazos"""
+    deadlines = dict(DEFAULT_STAGE_DEADLINES)
+    for item in os.getenv("CONTENTNOTES_STAGE_DEADLINES", "").split(","):
+        name, _, seconds = item.partition("=")
+        if name.strip() and seconds.strip():
+            deadlines[name.strip()] = float(seconds)
+    return deadlines
+
+
+STAGE_DEADLINES = _stage_deadlines()
+
+
+class StageTimeout(TimeoutError):
+    """Una etapa superó su plazo"""
+
+    def __init__(self, stage: str, seconds: float):
+        super().__init__(f"La etapa '{stage}' superó su plazo de {seconds:g}s")
+        self.stage = stage
+        self.seconds = seconds
+
+
+@asynccontextmanager
+async def deadline(name: str, seconds: Optional[float] = None):
+    """
+    Cancela lo que haya dentro del bloque si tarda más que el plazo de la etapa.
+    Equivale a asyncio.timeout (3.11), que no usamos para seguir en Python 3.10.
+    """
+    seconds = STAGE_DEADLINES.get(name) if seconds is None else seconds
+    if not seconds:
+        yield
+        return
+
+    task = asyncio.current_task()
+    expired = False
+
+    def expire():
+        nonlocal expired
+        expired = True
+        task.cancel()
+
+    handle = asyncio.get_running_loop().call_later(seconds, expire)
+    try:
+        yield
+    except asyncio.CancelledError:
+        # Solo el vencimiento del plazo se convierte en StageTimeout; otra cancelación sigue su curso
+        if not expired:
+            raise
+        if hasattr(task, "uncancel"):
+            task.uncancel()
+        raise StageTimeout(name, seconds) from None
+    finally:
+        handle.cancel()
+
+
+@asynccontextmanager
+async def stage(name: str, **attrs):
+    """tracing.span + deadline: la etapa queda medida y acotada"""
+    with tracing.span(name, deadline=STAGE_DEADLINES.get(name), **attrs) as span:
+        async with deadline(name):
+            yield span
+
+
+async def run_all(coros) -> List:
+    """Como asyncio.gather, pero si una falla se cancelan las demás y se relanza su error"""
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        # Las que siguen en marcha no deben sobrevivir al fallo (ni a una cancelación)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# DESCARGA
+
+async def stream_to_ffmpeg_async(chunks: AsyncIterator[bytes], output_path: str,
+                                 progress: ProgressCallback = print_progress,
+                                 profile: AudioProfile | None = None) -> bool:
+    """
+    Versión async de yt_helper.stream_to_ffmpeg: los bytes pasan al stdin de
+    ffmpeg según llegan, respetando su ritmo (drain). Cancelar mata ffmpeg.
+    """
+    profile = profile or choose_profile()
+    proc = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-i', 'pipe:0', *profile.ffmpeg_args(), '-y', output_path,
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+    )
+
+    # Vaciamos stderr en paralelo para que ffmpeg nunca se bloquee escribiendo logs
+    stderr_tail = []
+    async def drain():
+        async for line in proc.stderr:
+            stderr_tail.append(line)
+            del stderr_tail[:-20]
+    reader = asyncio.create_task(drain())
+
+    try:
+        try:
+            async for chunk in chunks:
+                if chunk:
+                    proc.stdin.write(chunk)
+                    await proc.stdin.drain()
+                    tracing.add(bytes_in=len(chunk))
+            proc.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg terminó antes de tiempo; el código de salida lo explica
+            pass
+        await proc.wait()
+        await reader
+    except BaseException:
+        if proc.returncode is None:
+            proc.kill()
+        # wait() no vuelve mientras quede alguna tubería abierta (también la nuestra)
+        proc.stdin.close()
+        await asyncio.shield(proc.wait())
+        reader.cancel()
+        discard_partial(output_path)
+        raise
+    finally:
+        # Cierra la respuesta HTTP si la descarga se abandonó a medias
+        aclose = getattr(chunks, "aclose", None)
+        if aclose:
+            await aclose()
+
+    if proc.returncode != 0:
+        discard_partial(output_path)
+        progress("error", f"❌ FFmpeg falló: {b''.join(stderr_tail).decode(errors='ignore')[-300:]}")
+        tracing.fail(f"ffmpeg salió con código {proc.returncode}")
+        return False
+
+    if not os.path.exists(output_path):
+        return False
+    tracing.annotate(bytes_out=os.path.getsize(output_path))
+    return os.path.getsize(output_path) > 0
+
+
+async def download_with_cobalt_async(url: str, output_path: str, progress: ProgressCallback = print_progress,
+                                     profile: AudioProfile | None = None) -> bool:
+    """Versión async de yt_helper.download_with_cobalt (resolver + descargar/transcodificar)"""
+    client = get_async_cobalt_client()
+    profile = profile or choose_profile()
+
+    try:
+        async with stage("cobalt_resolve"):
+            download_url = await client.resolve(url)
+
+        async with stage("download", profile=profile.name):
+            return await stream_to_ffmpeg_async(client.iter_download(download_url), output_path,
+                                                progress=progress, profile=profile)
+
+    except StageTimeout:
+        raise
+    except CobaltError as e:
+        progress("error", f"Error en Cobalt API: {str(e)}")
+        return False
+    except Exception as e:
+        progress("error", f"Error de conexión: {str(e)}")
+        return False
+
+
+# TRANSCRIPCIÓN
+
+async def _transcribe_file_async(model, audio_path: str, prompt: str, job=None) -> str:
+    """Versión async de yt_helper._transcribe_file (misma caché de subidas)"""
+    with tracing.span("upload"):
+        uploaded = await get_upload_cache().get_or_upload_async(audio_path)
+    if job:
+        job.done("upload", {"name": uploaded.name, "path": audio_path})
+
+    with tracing.span("transcribe_call"):
+        response = await rate_limiter.get_rate_limiter().acall(
+            model.generate_content_async, [prompt, uploaded], tokens=len(prompt) // 4 + 1
+        )
+        tracing.record_usage(response, prompt=prompt)
+    return response.text.strip() if response.text else ""
+
+
+async def transcribe_chunked_async(model, audio_path: str, temp_dir: str, duration: float,
+                                   max_workers: int = MAX_TRANSCRIBE_WORKERS,
+                                   on_partial: Optional[Callable[[str], None]] = None, job=None) -> str:
+    """Versión async de yt_helper.transcribe_chunked: si un fragmento falla se cancelan los demás"""
+    chunks = await split_audio_async(audio_path, temp_dir, duration)
+    parts, pending, on_partial = pending_parts(chunks, job, on_partial)
+    limit = asyncio.Semaphore(max_workers)
+
+    async def transcribe_part(index: int):
+        async with limit:
+            text = await _transcribe_file_async(
+                model, chunks[index], CHUNK_PROMPT.format(index=index + 1, total=len(chunks))
+            )
+        record_part(parts, index, text, job, on_partial)
+
+    try:
+        await run_all(transcribe_part(i) for i in pending)
+    finally:
+        for chunk in chunks:
+            if os.path.exists(chunk):
+                os.unlink(chunk)
+
+    return stitch_transcripts(parts)
+
+
+async def transcribe_with_preview_async(model, audio_path: str, temp_dir: str,
+                                        on_partial: Callable[[str], None], job=None) -> str:
+    """Versión async de yt_helper.transcribe_with_preview"""
+    try:
+        preview = await extract_clip_async(
+            audio_path, preview_path(audio_path, temp_dir), 0, SPECULATIVE_PREVIEW_SECONDS
+        )
+    except RuntimeError as e:
+        print(f"Sin vista previa, se transcribe solo el audio completo: {e}")
+        return await _transcribe_file_async(model, audio_path, TRANSCRIBE_PROMPT, job=job)
+
+    full = asyncio.create_task(_transcribe_file_async(model, audio_path, TRANSCRIBE_PROMPT, job))
+    try:
+        try:
+            notify_partial(on_partial, await _transcribe_file_async(model, preview, TRANSCRIBE_PROMPT))
+        except Exception as e:
+            print(f"Error transcribiendo la vista previa: {e}")
+        return await full
+    finally:
+        full.cancel()
+        await asyncio.gather(full, return_exceptions=True)
+        if os.path.exists(preview):
+            os.unlink(preview)
+
+
+async def download_and_transcribe_async(source: str, is_youtube: bool = False, chunked: bool | None = None,
+                                        on_partial: Optional[Callable[[str], None]] = None,
+                                        progress: ProgressCallback = print_progress, job=None,
+                                        compact: bool | None = None, audio_profile: str | None = None,
+                                        captions: bool | None = None) -> str | None:
+    """
+    Versión async de yt_helper.download_and_transcribe (mismos argumentos y resultado).
+    Las decisiones (caché, reanudación, plan de audio, modo) son las mismas
+    funciones de yt_helper; aquí solo cambian las esperas de E/S.
+    Una etapa que vence su plazo termina el trabajo con un error; una cancelación
+    marca el trabajo como fallido (reanudable) y se propaga a quien lo lanzó.
+    """
+    temp_dir = "/tmp/contentnotes"
+    os.makedirs(temp_dir, exist_ok=True)
+    step = "download"
+
+    def fail(message: str):
+        progress("error", message)
+        if job:
+            job.fail(step, message)
+        return None
+
+    try:
+        # Caché de transcripciones: por ID de video o por hash del archivo
+        cache_key = job.source_key if job else await asyncio.to_thread(source_key, source, is_youtube)
+        transcript = cached_transcript(cache_key, job, progress)
+        if transcript:
+            return transcript
+
+        # Vía rápida: subtítulos ya existentes en lugar de transcribir el audio
+        if is_caption_file(source):
+            step = "transcribe"
+            progress("captions", "💬 Leyendo subtítulos...")
+            async with stage("captions", origin="file", bytes_in=os.path.getsize(source)) as span:
+                transcript = await asyncio.to_thread(read_caption_file, source)
+                span.set(chars=len(transcript or ""))
+            if not transcript:
+                return fail("❌ No se pudieron leer los subtítulos.")
+            save_transcript(transcript, cache_key, job, origin="captions")
+            return transcript
+
+        if is_youtube and (CAPTIONS_ENABLED if captions is None else captions):
+            progress("captions", "💬 Buscando subtítulos...")
+            try:
+                async with stage("captions", origin="youtube") as span:
+                    transcript = await asyncio.to_thread(fetch_youtube_captions, source)
+                    span.set(found=bool(transcript), chars=len(transcript or ""))
+            except StageTimeout as e:
+                # Sin subtítulos a tiempo se sigue con el audio
+                print(f"{e}: se transcribe el audio")
+                transcript = None
+            if transcript:
+                progress("captions", "⚡ Subtítulos encontrados: se omite la transcripción del audio")
+                save_transcript(transcript, cache_key, job, origin="captions")
+                return transcript
+
+        known_duration = None   # Duración ya medida del audio a transcribir (evita otro ffprobe)
+        resumed = resume_audio(job, progress)
+        if resumed:
+            audio_path, profile, compacted = resumed
+
+        elif is_youtube:
+            compacted = False
+            profile = choose_profile(name=audio_profile)
+            audio_path = youtube_audio_path(source, temp_dir, profile)
+
+            progress("download", "🚀 Procesando con Cobalt API + FFmpeg...")
+            if not await download_with_cobalt_async(source, audio_path, progress=progress, profile=profile):
+                # download_with_cobalt_async ya informó del motivo
+                if job:
+                    job.fail(step, "Cobalt/FFmpeg")
+                return None
+            if not record_download(audio_path, profile, job):
+                return fail("❌ El archivo de audio parece estar vacío.")
+        else:
+            compacted = False
+            if job:
+                job.done("download", {"path": source})
+
+            step = "compress"
+            async with stage("compress", bytes_in=os.path.getsize(source)) as span:
+                info = await probe_media_async(source)
+                known_duration = info["duration"] if info else None
+                profile, attempts = plan_compress(source, info, audio_profile, temp_dir)
+                span.set(profile=profile.name)
+
+                action, output = "skip", None
+                for action, path, message in attempts:
+                    progress("compress", message)
+                    if await extract_audio_async(source, path, action, profile, info):
+                        output = path
+                        break
+                    discard_partial(path)
+                audio_path = finish_compress(span, source, action, output, profile, job, progress)
+
+        # Compactar: menos audio = subida, tokens y transcripción más rápidos
+        if (COMPACT_ENABLED if compact is None else compact) and not compacted:
+            step = "compact"
+            progress("compact", "✂️ Buscando silencios...")
+            async with stage("compact", bytes_in=os.path.getsize(audio_path)) as span:
+                result = await compact_audio_async(
+                    audio_path, compact_path(audio_path, temp_dir, profile), profile.ffmpeg_args()
+                )
+                audio_path = finish_compact(span, result, audio_path, source, profile, job, progress)
+            if result:
+                known_duration = None
+
+        # Transcribir con Gemini
+        step = "transcribe"
+        duration = None
+        if chunked is None or chunked or on_partial:
+            if not known_duration:
+                info = await probe_media_async(audio_path)
+                known_duration = info["duration"] if info else None
+            duration = known_duration
+        mode = transcription_mode(chunked, on_partial, duration)
+
+        progress("transcribe", f"🎙️ Transcribiendo ({os.path.getsize(audio_path) / (1024 * 1024):.1f}MB)...")
+        model = get_model(get_model_name("transcribe"))  # config.json -> "models"
+
+        try:
+            async with stage("transcribe", mode=mode, audio_seconds=duration, bytes_in=os.path.getsize(audio_path)):
+                if mode == "chunked":
+                    transcript = await transcribe_chunked_async(model, audio_path, temp_dir, duration,
+                                                                on_partial=on_partial, job=job)
+                elif mode == "preview":
+                    transcript = await transcribe_with_preview_async(model, audio_path, temp_dir,
+                                                                     on_partial, job=job)
+                else:
+                    transcript = await _transcribe_file_async(model, audio_path, TRANSCRIBE_PROMPT, job=job)
+
+            if not transcript or len(transcript) < MIN_TRANSCRIPT_CHARS:
+                return fail("⚠️ La transcripción fue muy corta o falló.")
+            save_transcript(transcript, cache_key, job)
+
+            # Limpieza local (nunca el archivo original del usuario)
+            if audio_path != source and os.path.exists(audio_path):
+                os.unlink(audio_path)
+
+            return transcript
+
+        except StageTimeout:
+            raise
+        except Exception as e:
+            return fail(f"⚠️ Error Gemini: {str(e)[:100]}")
+
+    except StageTimeout as e:
+        return fail(f"⏱️ {e}")
+    except asyncio.CancelledError:
+        # Lo completado queda en el trabajo: reintentarlo reanuda desde aquí
+        if job:
+            job.fail(step, "cancelado")
+        raise
+    except Exception as e:
+        return fail(f"❌ Error General: {str(e)}")
+
+
+# NOTAS
+
+async def generate_notes_async(prompt: str, on_chunk: Optional[Callable[[str], None]] = None, cached=None) -> str:
+    """Versión async de pipeline.generate_notes (mismo streaming por on_chunk)"""
+    if cached is not None:
+        # La caché de contexto solo tiene cliente síncrono
+        return await asyncio.to_thread(generate_notes, prompt, on_chunk, cached)
+
+    model = get_model(get_model_name("notes"))
+    limiter = rate_limiter.get_rate_limiter()
+    with tracing.span("generate", cached=False, stream=on_chunk is not None):
+        if on_chunk is None:
+            response = await limiter.acall(model.generate_content_async, prompt, tokens=estimate_tokens(prompt))
+            tracing.record_usage(response, prompt=prompt)
+            return response.text if response.text else ""
+
+        text = ""
+        chunk = None
+        stream = await limiter.acall(model.generate_content_async, prompt,
+                                     tokens=estimate_tokens(prompt), stream=True)
+        async for chunk in stream:
+            piece = getattr(chunk, "text", "") or ""
+            if piece:
+                text += piece
+                on_chunk(text)
+        # En streaming el uso de tokens llega con el último fragmento
+        tracing.record_usage(chunk, prompt=prompt, text=text)
+        return text
+
+
+async def generate_notes_map_reduce_async(transcript: str, prompt_key: str, prompt_builder: PromptBuilder,
+                                          on_chunk: Optional[Callable[[str], None]] = None,
+                                          progress: ProgressCallback = print_progress) -> str:
+    """Versión async de pipeline.generate_notes_map_reduce"""
+    limit = asyncio.Semaphore(prompt_builder.max_workers)
+
+    async def generate(prompt: str) -> str:
+        async with limit:
+            return await generate_notes_async(prompt)
+
+    async def reduce(group: List[str]) -> str:
+        if len(group) == 1:
+            return group[0]
+        return await generate(prompt_builder.build_reduce_prompt(group, prompt_key))
+
+    sections = await run_all(generate(prompt)
+                             for prompt in section_prompts(transcript, prompt_key, prompt_builder, progress))
+
+    # Si las notas parciales aún no caben en un solo prompt, reducimos por grupos
+    while True:
+        groups = reduce_groups(sections, prompt_builder)
+        if groups is None:
+            break
+        sections = await run_all(reduce(group) for group in groups)
+
+    if len(sections) == 1:
+        if on_chunk:
+            on_chunk(sections[0])
+        return sections[0]
+
+    progress("generate", "🧩 Unificando notas...")
+    return await generate_notes_async(prompt_builder.build_reduce_prompt(sections, prompt_key), on_chunk=on_chunk)
+
+
+async def generate_analysis_async(transcript: str, context: Dict, prompt_builder: PromptBuilder,
+                                  on_notes_chunk: Optional[Callable[[str], None]] = None,
+                                  progress: ProgressCallback = print_progress) -> str:
+    """Versión async de pipeline.generate_analysis"""
+    prompt_key = context.get('prompt_key', 'general')
+    if prompt_builder.needs_map_reduce(transcript):
+        return await generate_notes_map_reduce_async(transcript, prompt_key, prompt_builder,
+                                                     on_chunk=on_notes_chunk, progress=progress)
+
+    progress("generate", "📝 Generando notas...")
+    # La transcripción ya registrada (p.ej. al clasificar) no se vuelve a enviar; para
+    # una sola llamada de notas no compensa crear la caché
+    cached = await asyncio.to_thread(get_context_cache().handle_for, get_model_name("notes"), transcript,
+                                     create=False)
+    if cached is not None:
+        try:
+            analysis = await generate_notes_async(prompt_builder.build_cached_prompt(prompt_key),
+                                                  on_chunk=on_notes_chunk, cached=cached)
+            if analysis:
+                return analysis
+        except Exception as e:
+            print(f"Caché de contexto falló, se envía la transcripción completa: {e}")
+
+    return await generate_notes_async(full_notes_prompt(transcript, context, prompt_builder), on_chunk=on_notes_chunk)
+
+
+async def process_source_async(source: str, context_detector: ContextDetector, prompt_builder: PromptBuilder,
+                               is_youtube: Optional[bool] = None,
+                               progress: ProgressCallback = print_progress,
+                               job_store: Optional[JobStore] = None, finish_job: bool = True,
+                               on_notes_chunk: Optional[Callable[[str], None]] = None,
+                               compact: Optional[bool] = None,
+                               audio_profile: Optional[str] = None,
+                               captions: Optional[bool] = None) -> Optional[Dict]:
+    """
+    Versión async de pipeline.process_source (mismos argumentos y resultado).
+    Cancelar la tarea detiene el trabajo en la etapa en curso: la traza queda
+    como "cancelled" y el trabajo del job_store, reanudable.
+    """
+    if is_youtube is None:
+        is_youtube = is_remote_source(source)
+
+    job = await asyncio.to_thread(open_source_job, job_store, source, is_youtube, prompt_builder)
+    trace = start_source_trace(source, progress)
+
+    # Durante la descarga y transcripción los fallos (y la cancelación) los
+    # registra download_and_transcribe_async con su propia etapa
+    step = None
+    speculative = AsyncSpeculativeDetector(context_detector)
+    try:
+        # La clasificación arranca con el primer fragmento transcrito
+        transcript = await download_and_transcribe_async(source, is_youtube=is_youtube,
+                                                         on_partial=speculative.feed, progress=progress,
+                                                         job=job, compact=compact, audio_profile=audio_profile,
+                                                         captions=captions)
+        if not transcript:
+            tracing.finish_trace(trace, status="error")
+            return None
+
+        try:
+            step = "classify"
+            classified = job.get("classify") if job else None
+            if classified:
+                context = classified["context"]
+            else:
+                progress("classify", "📊 Detectando tipo de contenido...")
+                async with deadline("classify"):
+                    context = await speculative.result_async(transcript)
+                if job:
+                    job.done("classify", {"context": context})
+
+            step = "generate"
+            generated = job.get("generate") if job else None
+            if generated:
+                analysis = generated["analysis"]
+            else:
+                async with deadline("generate"):
+                    analysis = await generate_analysis_async(transcript, context, prompt_builder,
+                                                             on_notes_chunk, progress)
+                if job and analysis:
+                    job.done("generate", {"analysis": analysis})
+        except StageTimeout as e:
+            progress("error", f"⏱️ {e}")
+            if job:
+                job.fail(step, str(e))
+            tracing.finish_trace(trace, status="error")
+            return None
+        except Exception as e:
+            progress("error", f"⚠️ Error Gemini: {str(e)[:100]}")
+            if job:
+                job.fail(step, str(e))
+            tracing.finish_trace(trace, status="error")
+            return None
+
+    except asyncio.CancelledError:
+        if job and step:
+            job.fail(step, "cancelado")
+        tracing.finish_trace(trace, status="cancelled")
+        raise
+    finally:
+        speculative.cancel()
+
+    if job and finish_job:
+        job.finish()
+    if finish_job:
+        tracing.finish_trace(trace)
+
+    return {
+        "transcript": transcript,
+        "context": context,
+        "analysis": analysis,
+        "job": job,
+        "trace": trace
+    }
@@ -0,0 +1,218 @@
+import asyncio
+import os
+import re
+import subprocess
+from collections import Counter
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from media_input import run_command_async
+
+# --- CONFIGURACIÓN DE FRAGMENTOS ---
+CHUNK_SECONDS = 600          # 10 minutos por fragmento
+CHUNK_OVERLAP_SECONDS = 15   # Solapamiento para no cortar frases
+MATCH_WINDOW_WORDS = 250     # Palabras que se comparan en cada borde
+MIN_MATCH_WORDS = 4          # Coincidencia mínima para considerar que hay solape
+
+SPEAKER_RE = re.compile(r'\[HABLANTE\s+([^\]]+)\]')
+TOKEN_RE = re.compile(r'\[HABLANTE\s+[^\]]+\]\s*|\S+\s*')
+
+
+def _duration_command(path: str) -> List[str]:
+    return ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+            '-of', 'default=noprint_wrappers=1:nokey=1', path]
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """Duración del audio en segundos usando ffprobe"""
+    try:
+        result = subprocess.run(_duration_command(path), capture_output=True, text=True, timeout=60)
+        return float(result.stdout.strip())
+    except Exception:
+        return None
+
+
+async def probe_duration_async(path: str) -> Optional[float]:
+    """probe_duration sin bloquear el event loop"""
+    try:
+        _, stdout, _ = await run_command_async(_duration_command(path), timeout=60)
+        return float(stdout.decode(errors="ignore").strip())
+    except (OSError, ValueError, asyncio.TimeoutError):
+        return None
+
+
+def _clip_command(path: str, output_path: str, start: float, length: float) -> List[str]:
+    return ['ffmpeg', '-ss', f"{start:.3f}", '-t', f"{length:.3f}",
+            '-i', path, '-c', 'copy', '-y', output_path]
+
+
+def _check_clip(output_path: str, start: float, length: float) -> str:
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        raise RuntimeError(f"No se pudo extraer el tramo {start:.0f}s-{start + length:.0f}s")
+    return output_path
+
+
+def extract_clip(path: str, output_path: str, start: float, length: float) -> str:
+    """Copia un tramo del audio sin recodificar"""
+    subprocess.run(_clip_command(path, output_path, start, length), capture_output=True, timeout=300)
+    return _check_clip(output_path, start, length)
+
+
+async def extract_clip_async(path: str, output_path: str, start: float, length: float) -> str:
+    """extract_clip con un subproceso asyncio: cancelar la tarea mata ffmpeg y borra el tramo a medias"""
+    try:
+        await run_command_async(_clip_command(path, output_path, start, length))
+    except BaseException:
+        if os.path.exists(output_path):
+            os.unlink(output_path)
+        raise
+    return _check_clip(output_path, start, length)
+
+
+def _chunk_spans(path: str, output_dir: str, duration: float, chunk_seconds: int,
+                 overlap_seconds: int) -> List[Tuple[str, float, float]]:
+    """(ruta, inicio, longitud) de cada fragmento"""
+    stem = Path(path).stem
+    spans = []
+    start = 0.0
+    index = 0
+
+    while start < duration:
+        chunk_path = os.path.join(output_dir, f"{stem}_part{index:03d}{Path(path).suffix}")
+        spans.append((chunk_path, start, chunk_seconds + overlap_seconds))
+        start += chunk_seconds
+        index += 1
+        # Un fragmento que empezaría dentro del solapamiento final sería texto
+        # repetido y demasiado corto para encontrar el solape al unir; el
+        # anterior (chunk + overlap) ya llega hasta el final
+        if duration - start <= overlap_seconds:
+            break
+
+    return spans
+
+
+def split_audio(path: str, output_dir: str, duration: float,
+                chunk_seconds: int = CHUNK_SECONDS,
+                overlap_seconds: int = CHUNK_OVERLAP_SECONDS) -> List[str]:
+    """
+    Divide el audio en fragmentos de longitud fija con un pequeño solapamiento.
+    Usa copia de stream (sin recodificar), así que es casi instantáneo.
+    """
+    return [extract_clip(path, chunk_path, start, length)
+            for chunk_path, start, length in _chunk_spans(path, output_dir, duration, chunk_seconds, overlap_seconds)]
+
+
+async def split_audio_async(path: str, output_dir: str, duration: float,
+                            chunk_seconds: int = CHUNK_SECONDS,
+                            overlap_seconds: int = CHUNK_OVERLAP_SECONDS) -> List[str]:
+    """split_audio con subprocesos asyncio; si se cancela a medias no deja fragmentos sueltos"""
+    chunks = []
+    try:
+        for chunk_path, start, length in _chunk_spans(path, output_dir, duration, chunk_seconds, overlap_seconds):
+            chunks.append(await extract_clip_async(path, chunk_path, start, length))
+    except BaseException:
+        for chunk in chunks:
+            if os.path.exists(chunk):
+                os.unlink(chunk)
+        raise
+    return chunks
+
+
+def _normalize(token: str) -> Optional[str]:
+    """Palabra normalizada para comparar; None para etiquetas de hablante"""
+    if SPEAKER_RE.match(token):
+        return None
+    return re.sub(r'[^\w]', '', token.lower())
+
+
+def _speaker_at(tokens: List[str], index: int) -> Optional[str]:
+    """Última etiqueta de hablante activa en la posición dada"""
+    for i in range(index, -1, -1):
+        match = SPEAKER_RE.match(tokens[i])
+        if match:
+            return match.group(1).strip()
+    return None
+
+
+def _relabel(tokens: List[str], mapping: Dict[str, str]) -> List[str]:
+    def replace(match):
+        label = match.group(1).strip()
+        return f"[HABLANTE {mapping.get(label, label)}]"
+    return [SPEAKER_RE.sub(replace, t) if SPEAKER_RE.match(t) else t for t in tokens]
+
+
+def _speaker_mapping(prev_tokens: List[str], next_tokens: List[str],
+                     pairs: List[tuple]) -> Dict[str, str]:
+    """
+    Deduce qué etiqueta del fragmento anterior corresponde a cada etiqueta
+    del siguiente, usando las palabras que coinciden en el solape.
+    """
+    votes = {}
+    for a_idx, b_idx in pairs:
+        a_label = _speaker_at(prev_tokens, a_idx)
+        b_label = _speaker_at(next_tokens, b_idx)
+        if a_label and b_label:
+            votes.setdefault(b_label, Counter())[a_label] += 1
+
+    mapping = {b: counter.most_common(1)[0][0] for b, counter in votes.items()}
+
+    # Las etiquetas sin pareja conservan su número salvo que ya esté ocupado
+    taken = set(mapping.values())
+    labels = [m.group(1).strip() for t in next_tokens for m in [SPEAKER_RE.match(t)] if m]
+    for label in dict.fromkeys(labels):
+        if label in mapping:
+            continue
+        if label not in taken:
+            mapping[label] = label
+        else:
+            n = 1
+            while str(n) in taken:
+                n += 1
+            mapping[label] = str(n)
+        taken.add(mapping[label])
+
+    return mapping
+
+
+def merge_transcripts(prev: str, nxt: str) -> str:
+    """Une dos transcripciones consecutivas eliminando el texto solapado"""
+    a_tokens = TOKEN_RE.findall(prev)
+    b_tokens = TOKEN_RE.findall(nxt)
+    if not a_tokens:
+        return nxt
+    if not b_tokens:
+        return prev
+
+    a_words = [(i, w) for i, t in enumerate(a_tokens) for w in [_normalize(t)] if w][-MATCH_WINDOW_WORDS:]
+    b_words = [(i, w) for i, t in enumerate(b_tokens) for w in [_normalize(t)] if w][:MATCH_WINDOW_WORDS]
+
+    matcher = SequenceMatcher(None, [w for _, w in a_words], [w for _, w in b_words], autojunk=False)
+    match = matcher.find_longest_match(0, len(a_words), 0, len(b_words))
+
+    if match.size < MIN_MATCH_WORDS:
+        # Sin solape reconocible: concatenamos manteniendo etiquetas coherentes
+        mapping = _speaker_mapping(a_tokens, b_tokens, [])
+        return prev.rstrip() + "\n" + "".join(_relabel(b_tokens, mapping))
+
+    pairs = [(a_words[match.a + k][0], b_words[match.b + k][0]) for k in range(match.size)]
+    mapping = _speaker_mapping(a_tokens, b_tokens, pairs)
+
+    # Nos quedamos con A hasta el final del solape y con B a partir de ahí
+    a_cut = pairs[-1][0] + 1
+    b_cut = pairs[-1][1] + 1
+    head = "".join(a_tokens[:a_cut])
+    tail = "".join(_relabel(b_tokens[b_cut:], mapping))
+
+    # Si B cambia de hablante justo en el corte, la etiqueta ya va incluida en la cola
+    if tail and not head.endswith((" ", "\n")):
+        head += " "
+    return head + tail
+
+
+def stitch_transcripts(parts: List[str]) -> str:
+    """Une las transcripciones de todos los fragmentos en orden"""
+    result = ""
+    for part in parts:
+        result = merge_transcripts(result, part.strip()) if result else part.strip()
+    return result.strip()
@@ -0,0 +1,238 @@
+import bisect
+import os
+import re
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+from audio_chunks import probe_duration, probe_duration_async
+from media_input import run_command_async
+
+# --- CONFIGURACIÓN DE COMPACTACIÓN ---
+# Desactivada por defecto: se activa por trabajo o con CONTENTNOTES_COMPACT=1
+COMPACT_ENABLED = os.getenv("CONTENTNOTES_COMPACT", "0") == "1"
+SILENCE_THRESHOLD_DB = float(os.getenv("CONTENTNOTES_SILENCE_DB", "-35"))  # Por debajo = silencio
+MIN_SILENCE_SECONDS = float(os.getenv("CONTENTNOTES_MIN_SILENCE", "1.0"))   # Pausas más cortas se respetan
+KEEP_SILENCE_SECONDS = 0.3   # Pausa que se conserva en cada corte (la voz no queda pegada)
+COMPACT_TEMPO = float(os.getenv("CONTENTNOTES_TEMPO", "1.0"))  # 1.0 = sin acelerar
+MAX_TEMPO = 1.5              # Aceleración "modesta": más allá se degrada la transcripción
+
+SILENCE_START_RE = re.compile(r'silence_start:\s*(-?[\d.]+)')
+SILENCE_END_RE = re.compile(r'silence_end:\s*(-?[\d.]+)')
+
+
+class OffsetMap:
+    """
+    Correspondencia entre tiempos del audio compactado y del original.
+    segments: lista de (inicio_compactado, inicio_original, duración) antes de aplicar tempo.
+    """
+
+    def __init__(self, segments: List[Tuple[float, float, float]], tempo: float = 1.0):
+        self.segments = segments
+        self.tempo = tempo
+        self._starts = [segment[0] for segment in segments]
+
+    def to_original(self, seconds: float) -> float:
+        """Segundo del audio compactado -> segundo del audio original"""
+        if not self.segments:
+            return seconds
+        t = seconds * self.tempo
+        index = max(0, bisect.bisect_right(self._starts, t) - 1)
+        compact_start, original_start, length = self.segments[index]
+        return original_start + min(t - compact_start, length)
+
+    def to_dict(self) -> Dict:
+        return {"segments": [list(segment) for segment in self.segments], "tempo": self.tempo}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "OffsetMap":
+        return cls([tuple(segment) for segment in data.get("segments", [])], data.get("tempo", 1.0))
+
+
+def _silence_command(path: str, threshold_db: float, min_silence: float) -> List[str]:
+    return ['ffmpeg', '-hide_banner', '-nostats', '-i', path,
+            '-af', f"silencedetect=noise={threshold_db}dB:d={min_silence}",
+            '-f', 'null', '-']
+
+
+def detect_silences(path: str, threshold_db: float = SILENCE_THRESHOLD_DB,
+                    min_silence: float = MIN_SILENCE_SECONDS,
+                    duration: Optional[float] = None) -> List[Tuple[float, float]]:
+    """Intervalos (inicio, fin) de silencio según el filtro silencedetect de ffmpeg"""
+    result = subprocess.run(_silence_command(path, threshold_db, min_silence),
+                            capture_output=True, text=True, timeout=600)
+    return _parse_silences(result.stderr, duration)
+
+
+async def detect_silences_async(path: str, threshold_db: float = SILENCE_THRESHOLD_DB,
+                                min_silence: float = MIN_SILENCE_SECONDS,
+                                duration: Optional[float] = None) -> List[Tuple[float, float]]:
+    """detect_silences con un subproceso asyncio (cancelar la tarea mata ffmpeg)"""
+    _, _, stderr = await run_command_async(_silence_command(path, threshold_db, min_silence))
+    return _parse_silences(stderr.decode(errors="ignore"), duration)
+
+
+def _parse_silences(stderr: str, duration: Optional[float]) -> List[Tuple[float, float]]:
+    silences = []
+    start = None
+    for line in stderr.splitlines():
+        match = SILENCE_START_RE.search(line)
+        if match:
+            start = max(0.0, float(match.group(1)))
+            continue
+        match = SILENCE_END_RE.search(line)
+        if match and start is not None:
+            silences.append((start, float(match.group(1))))
+            start = None
+
+    # Silencio hasta el final del archivo (no llega silence_end)
+    if start is not None and duration:
+        silences.append((start, duration))
+    return silences
+
+
+def build_segments(silences: List[Tuple[float, float]], duration: float,
+                   keep: float = KEEP_SILENCE_SECONDS) -> List[Tuple[float, float, float]]:
+    """Tramos con voz (inicio_compactado, inicio_original, duración) tras quitar los silencios"""
+    segments = []
+    position = 0.0
+    compact = 0.0
+    for start, end in silences:
+        # En los extremos del archivo no hace falta conservar pausa
+        cut_start = start + keep / 2 if start > 0 else 0.0
+        cut_end = end - keep / 2 if end < duration else duration
+        if cut_end <= cut_start:
+            continue
+        if cut_start > position:
+            segments.append((compact, position, cut_start - position))
+            compact += cut_start - position
+        position = max(position, cut_end)
+    if duration > position:
+        segments.append((compact, position, duration - position))
+    return segments
+
+
+def compact_audio(path: str, output_path: str, audio_args: List[str],
+                  tempo: float = COMPACT_TEMPO,
+                  threshold_db: float = SILENCE_THRESHOLD_DB,
+                  min_silence: float = MIN_SILENCE_SECONDS) -> Optional[Dict]:
+    """
+    Quita silencios largos y, opcionalmente, acelera la voz con atempo.
+    Devuelve {"path", "original_seconds", "compact_seconds", "removed_seconds",
+    "offset_map"} o None si no hay nada que quitar o ffmpeg falla.
+    """
+    duration = probe_duration(path)
+    if not duration:
+        return None
+
+    tempo = min(max(tempo, 1.0), MAX_TEMPO)
+    segments = build_segments(detect_silences(path, threshold_db, min_silence, duration), duration)
+    filters = _compact_filters(segments, duration, tempo)
+    if filters is None:
+        return None
+
+    script = _write_filter_script(output_path, filters)
+    try:
+        subprocess.run(_compact_command(path, output_path, script, audio_args), capture_output=True, timeout=600)
+    finally:
+        os.unlink(script)
+    return _compact_result(path, output_path, duration, segments, tempo)
+
+
+async def compact_audio_async(path: str, output_path: str, audio_args: List[str],
+                              tempo: float = COMPACT_TEMPO,
+                              threshold_db: float = SILENCE_THRESHOLD_DB,
+                              min_silence: float = MIN_SILENCE_SECONDS) -> Optional[Dict]:
+    """compact_audio con subprocesos asyncio: cancelar la tarea mata ffmpeg y borra la salida a medias"""
+    duration = await probe_duration_async(path)
+    if not duration:
+        return None
+
+    tempo = min(max(tempo, 1.0), MAX_TEMPO)
+    segments = build_segments(await detect_silences_async(path, threshold_db, min_silence, duration), duration)
+    filters = _compact_filters(segments, duration, tempo)
+    if filters is None:
+        return None
+
+    script = _write_filter_script(output_path, filters)
+    try:
+        await run_command_async(_compact_command(path, output_path, script, audio_args))
+    except BaseException:
+        if os.path.exists(output_path):
+            os.unlink(output_path)
+        raise
+    finally:
+        os.unlink(script)
+    return _compact_result(path, output_path, duration, segments, tempo)
+
+
+def _compact_filters(segments: List[Tuple[float, float, float]], duration: float,
+                     tempo: float) -> Optional[List[str]]:
+    """Filtros de ffmpeg que quitan los silencios y aplican el tempo; None si no hay nada que hacer"""
+    kept = sum(length for _, _, length in segments)
+    nothing_cut = kept >= duration - 0.05
+    if not segments or (nothing_cut and tempo == 1.0):
+        return None
+
+    filters = []
+    if not nothing_cut:
+        filters += [f"aselect='{_select_expression(segments)}'", "asetpts=N/SR/TB"]
+    if tempo != 1.0:
+        filters.append(f"atempo={tempo:g}")
+    return filters
+
+
+def _select_expression(segments: List[Tuple[float, float, float]]) -> str:
+    """
+    Expresión de aselect que deja pasar los tramos con voz. Es un árbol de
+    if(lt(t, ...)) sobre los inicios de los tramos (ordenados y disjuntos), así
+    que cada frame evalúa O(log n) comparaciones en lugar de un between por tramo.
+    """
+    spans = [(original, original + length) for _, original, length in segments]
+
+    def node(lo: int, hi: int) -> str:
+        if hi - lo == 1:
+            start, end = spans[lo]
+            return f"between(t,{start:.3f},{end:.3f})"
+        mid = (lo + hi) // 2
+        return f"if(lt(t,{spans[mid][0]:.3f}),{node(lo, mid)},{node(mid, hi)})"
+
+    return node(0, len(spans))
+
+
+def _write_filter_script(output_path: str, filters: List[str]) -> str:
+    """
+    Guarda el filtro en un archivo para -filter_script: con miles de pausas la
+    expresión supera el límite de tamaño de un argumento (E2BIG)
+    """
+    script = output_path + ".filter"
+    with open(script, 'w', encoding='utf-8') as f:
+        f.write(",".join(filters))
+    return script
+
+
+def _compact_command(path: str, output_path: str, script: str, audio_args: List[str]) -> List[str]:
+    return ['ffmpeg', '-i', path, '-filter_script:a', script, *audio_args, '-y', output_path]
+
+
+def _compact_result(path: str, output_path: str, duration: float,
+                    segments: List[Tuple[float, float, float]], tempo: float) -> Optional[Dict]:
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        print(f"Error compactando audio: {path}")
+        return None
+
+    compact_seconds = sum(length for _, _, length in segments) / tempo
+    return {
+        "path": output_path,
+        "original_seconds": duration,
+        "compact_seconds": compact_seconds,
+        "removed_seconds": duration - compact_seconds,
+        "offset_map": OffsetMap(segments, tempo).to_dict()
+    }
+
+
+def compaction_report(result: Dict) -> str:
+    """Resumen legible de lo que se quitó"""
+    removed = result["removed_seconds"]
+    share = 100 * removed / result["original_seconds"] if result["original_seconds"] else 0
+    return (f"✂️ Audio compactado: {result['original_seconds'] / 60:.1f} → "
+            f"{result['compact_seconds'] / 60:.1f} min (−{removed:.0f}s, {share:.0f}%)")
@@ -0,0 +1,95 @@
+import os
+from typing import Dict, List, Optional
+
+# --- PERFILES DE CODIFICACIÓN ---
+# Todos a 16 kHz mono: es lo que Gemini usa internamente para el audio.
+# "auto" (por defecto) elige según la duración; se puede fijar con CONTENTNOTES_AUDIO_PROFILE.
+DEFAULT_PROFILE = os.getenv("CONTENTNOTES_AUDIO_PROFILE", "auto")
+STREAM_PROFILE = "mp3_48k"   # Descargas en streaming: la duración no se conoce de antemano
+TARGET_SAMPLE_RATE = 16000
+BITRATE_TOLERANCE = 1.15     # Un archivo algo por encima del bitrate del perfil se acepta tal cual
+
+
+class AudioProfile:
+    """Formato de salida de ffmpeg: argumentos del códec, contenedor y extensión"""
+
+    def __init__(self, name: str, args: List[str], container: str, extension: str, description: str,
+                 codec: str, kbps: Optional[int] = None):
+        self.name = name
+        self.args = args
+        self.container = container
+        self.extension = extension
+        self.description = description
+        self.codec = codec   # Nombre del códec según ffprobe
+        self.kbps = kbps     # None = sin pérdida
+
+    def ffmpeg_args(self) -> List[str]:
+        """
+        Argumentos de salida (solo audio + códec + contenedor), listos para añadir
+        antes del destino. Sin -vn ffmpeg decodificaría también el video (y MP3/Ogg
+        admiten una pista de imagen, así que intentaría codificarla).
+        """
+        return ['-vn', '-sn', '-dn', *self.args, '-f', self.container]
+
+    def matches(self, info: Dict) -> bool:
+        """True si un archivo (media_input.probe_media) ya tiene este formato: no hace falta recodificar"""
+        if not info or info.get("has_video") or info.get("audio_codec") != self.codec:
+            return False
+        if self.container not in (info.get("format") or "").split(","):
+            return False
+        if (info.get("channels") or 0) != 1 or (info.get("sample_rate") or 0) > TARGET_SAMPLE_RATE:
+            return False
+        kbps = info.get("kbps")
+        return self.kbps is None or (kbps is not None and kbps <= self.kbps * BITRATE_TOLERANCE)
+
+    def output_name(self, stem: str) -> str:
+        return f"{stem}{self.extension}"
+
+    def __repr__(self):
+        return f"AudioProfile({self.name!r})"
+
+
+PROFILES: Dict[str, AudioProfile] = {
+    profile.name: profile for profile in [
+        AudioProfile("mp3_48k", ['-acodec', 'libmp3lame', '-b:a', '48k', '-ar', '16000', '-ac', '1'],
+                     "mp3", ".mp3", "MP3 48 kbps (compatibilidad máxima, perfil histórico)", "mp3", 48),
+        AudioProfile("opus_24k", ['-acodec', 'libopus', '-b:a', '24k', '-application', 'voip',
+                                  '-ar', '16000', '-ac', '1'],
+                     "ogg", ".ogg", "Opus 24 kbps (la mitad que MP3 con calidad de voz similar)", "opus", 24),
+        AudioProfile("opus_16k", ['-acodec', 'libopus', '-b:a', '16k', '-application', 'voip',
+                                  '-ar', '16000', '-ac', '1'],
+                     "ogg", ".ogg", "Opus 16 kbps (audios muy largos)", "opus", 16),
+        AudioProfile("flac", ['-acodec', 'flac', '-compression_level', '5', '-ar', '16000', '-ac', '1'],
+                     "flac", ".flac", "FLAC sin pérdida (clips cortos: el tamaño no importa)", "flac"),
+    ]
+}
+
+# Elección automática: (duración máxima en segundos, perfil), la primera que encaje
+AUTO_RULES = [
+    (120, "flac"),
+    (3600, "mp3_48k"),
+    (4 * 3600, "opus_24k"),
+    (float("inf"), "opus_16k"),
+]
+
+
+def get_profile(name: str) -> AudioProfile:
+    if name not in PROFILES:
+        raise ValueError(f"Perfil de audio desconocido: {name} (opciones: {', '.join(PROFILES)})")
+    return PROFILES[name]
+
+
+def choose_profile(duration: Optional[float] = None, name: Optional[str] = None) -> AudioProfile:
+    """
+    Perfil explícito (por trabajo o variable de entorno) o automático por duración.
+    Sin duración conocida se usa el perfil de streaming.
+    """
+    name = name or DEFAULT_PROFILE
+    if name != "auto":
+        return get_profile(name)
+    if not duration:
+        return PROFILES[STREAM_PROFILE]
+    for max_seconds, profile_name in AUTO_RULES:
+        if duration <= max_seconds:
+            return PROFILES[profile_name]
+    return PROFILES[STREAM_PROFILE]
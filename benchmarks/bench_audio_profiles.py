@@ -0,0 +1,156 @@
+"""
+Benchmark de perfiles de codificación de audio.
+
+Para cada archivo del corpus y cada perfil mide el tiempo de codificación,
+el tamaño resultante y el tiempo de subida (real a Gemini con --upload, o
+estimado con --bandwidth). El mejor perfil es el de menor codificación + subida.
+
+Uso:
+    python benchmarks/bench_audio_profiles.py muestras/
+    python benchmarks/bench_audio_profiles.py muestras/ --profiles mp3_48k opus_24k --upload
+    python benchmarks/bench_audio_profiles.py muestras/ --bandwidth 20 --json resultados.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from audio_chunks import probe_duration
+from audio_profiles import PROFILES, AudioProfile, choose_profile
+
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".m4a", ".ogg", ".opus", ".flac", ".webm", ".mp4", ".mkv", ".aac"}
+
+
+def find_corpus(paths: List[str]) -> List[Path]:
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files += sorted(p for p in path.rglob("*") if p.suffix.lower() in AUDIO_EXTENSIONS)
+        elif path.exists():
+            files.append(path)
+    return files
+
+
+def encode(source: Path, profile: AudioProfile, output_dir: str) -> Dict:
+    output = os.path.join(output_dir, profile.output_name(f"{source.stem}_{profile.name}"))
+    start = time.perf_counter()
+    result = subprocess.run(
+        ['ffmpeg', '-i', str(source), *profile.ffmpeg_args(), '-y', output],
+        capture_output=True, timeout=1800
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0 or not os.path.exists(output):
+        raise RuntimeError(result.stderr.decode(errors='ignore')[-300:])
+    return {"path": output, "encode_seconds": elapsed, "bytes": os.path.getsize(output)}
+
+
+def measure_upload(path: str) -> float:
+    """Sube a Gemini, espera a ACTIVE y borra el archivo remoto"""
+    import google.generativeai as genai
+    from gemini_files import upload_and_wait
+
+    start = time.perf_counter()
+    uploaded = upload_and_wait(path)
+    elapsed = time.perf_counter() - start
+    genai.delete_file(uploaded.name)
+    return elapsed
+
+
+def run(files: List[Path], profiles: List[AudioProfile], upload: bool, bandwidth_mbps: float) -> Dict:
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="cn-bench-") as output_dir:
+        for source in files:
+            duration = probe_duration(str(source)) or 0.0
+            auto = choose_profile(duration, "auto").name
+            for profile in profiles:
+                try:
+                    encoded = encode(source, profile, output_dir)
+                except Exception as e:
+                    print(f"  {source.name:<40} {profile.name:<10} ❌ {e}", file=sys.stderr)
+                    continue
+
+                if upload:
+                    upload_seconds = measure_upload(encoded["path"])
+                else:
+                    upload_seconds = encoded["bytes"] * 8 / (bandwidth_mbps * 1_000_000)
+                os.unlink(encoded["path"])
+
+                row = {
+                    "file": source.name,
+                    "duration_seconds": duration,
+                    "profile": profile.name,
+                    "auto_choice": profile.name == auto,
+                    "encode_seconds": encoded["encode_seconds"],
+                    "bytes": encoded["bytes"],
+                    "upload_seconds": upload_seconds,
+                    "upload_measured": upload,
+                    "total_seconds": encoded["encode_seconds"] + upload_seconds,
+                }
+                rows.append(row)
+                print(f"  {source.name:<40} {profile.name:<10} "
+                      f"{row['encode_seconds']:7.2f}s {row['bytes'] / 1024:9.0f}KB "
+                      f"{upload_seconds:7.2f}s{' *' if row['auto_choice'] else ''}")
+
+    summary = {}
+    for profile in profiles:
+        own = [row for row in rows if row["profile"] == profile.name]
+        if not own:
+            continue
+        summary[profile.name] = {
+            "files": len(own),
+            "encode_seconds_mean": statistics.mean(r["encode_seconds"] for r in own),
+            "bytes_total": sum(r["bytes"] for r in own),
+            "upload_seconds_mean": statistics.mean(r["upload_seconds"] for r in own),
+            "total_seconds_mean": statistics.mean(r["total_seconds"] for r in own),
+            # kbps efectivos: útil para comparar con el bitrate nominal
+            "kbps": 8 * sum(r["bytes"] for r in own) / 1000 / max(sum(r["duration_seconds"] for r in own), 1e-9),
+        }
+    return {"rows": rows, "summary": summary}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compara perfiles de codificación de audio")
+    parser.add_argument("corpus", nargs="+", help="Archivos o carpetas con audios de muestra")
+    parser.add_argument("--profiles", nargs="*", default=list(PROFILES), choices=list(PROFILES))
+    parser.add_argument("--upload", action="store_true", help="Medir la subida real a Gemini (usa GOOGLE_API_KEY)")
+    parser.add_argument("--bandwidth", type=float, default=10.0,
+                        help="Mbps de subida para estimar sin --upload (por defecto: 10)")
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    args = parser.parse_args(argv)
+
+    files = find_corpus(args.corpus)
+    if not files:
+        parser.error("no se encontraron audios en el corpus")
+
+    if args.upload:
+        import google.generativeai as genai
+        from dotenv import load_dotenv
+        load_dotenv()
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+
+    print(f"{len(files)} archivos x {len(args.profiles)} perfiles (* = elección automática)")
+    results = run(files, [PROFILES[name] for name in args.profiles], args.upload, args.bandwidth)
+
+    print(f"\n{'perfil':<10} {'codif.':>8} {'tamaño':>10} {'subida':>8} {'total':>8} {'kbps':>6}")
+    ranking = sorted(results["summary"].items(), key=lambda item: item[1]["total_seconds_mean"])
+    for name, stats in ranking:
+        print(f"{name:<10} {stats['encode_seconds_mean']:7.2f}s {stats['bytes_total'] / 1048576:8.1f}MB "
+              f"{stats['upload_seconds_mean']:7.2f}s {stats['total_seconds_mean']:7.2f}s {stats['kbps']:6.1f}")
+    if ranking:
+        print(f"\nMenor latencia: {ranking[0][0]}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding='utf-8')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,373 @@
+"""
+Benchmark de extremo a extremo sin servicios reales.
+
+Levanta un servidor Cobalt falso (HTTP local que sirve un audio generado) y
+sustituye google.generativeai por el SDK falso de gemini_stub, con latencias y
+tamaños configurables. Mide por etapa (download_and_transcribe,
+ContextDetector.detect, PromptBuilder.build_prompt, generate_pdf) p50/p95,
+el rendimiento con N trabajos concurrentes, el pico de RSS y el de disco temporal.
+Necesita ffmpeg/ffprobe en el PATH (como la app).
+
+Uso:
+    python benchmarks/bench_pipeline.py --jobs 8 --concurrency 1 4
+    python benchmarks/bench_pipeline.py --generate-latency 2 --transcript-words 9000 --json base.json
+    python benchmarks/bench_pipeline.py --json nuevo.json --compare base.json
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Carpeta temporal fija de yt_helper (la que se vigila para el pico de disco)
+APP_TEMP_DIR = "/tmp/contentnotes"
+
+
+def make_sample_audio(path: str, seconds: float, rate: int = 16000):
+    """WAV mono con ráfagas de tono y pausas (parecido a voz con silencios)"""
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        frames = bytearray()
+        for n in range(int(seconds * rate)):
+            t = n / rate
+            speaking = (t % 4.0) < 3.0
+            value = int(8000 * math.sin(2 * math.pi * (180 + 40 * math.sin(t)) * t)) if speaking else 0
+            frames += struct.pack("<h", value)
+        wav.writeframes(bytes(frames))
+
+
+class FakeCobalt:
+    """Servidor HTTP local con la API v10 de Cobalt: POST -> enlace, GET -> audio"""
+
+    def __init__(self, audio: bytes, resolve_latency: float = 0.1, first_byte_latency: float = 0.1,
+                 bandwidth_mbps: float = 50.0):
+        self.audio = audio
+        self.resolve_latency = resolve_latency
+        self.first_byte_latency = first_byte_latency
+        self.bandwidth_mbps = bandwidth_mbps
+        self.requests = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def _handler(self):
+        cobalt = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                cobalt.requests += 1
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(cobalt.resolve_latency)
+                body = json.dumps({"status": "tunnel", "url": f"{cobalt.base_url}/audio"}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                time.sleep(cobalt.first_byte_latency)
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/wav")
+                self.send_header("Content-Length", str(len(cobalt.audio)))
+                self.end_headers()
+                # Entrega a ritmo de bandwidth_mbps
+                block = 64 * 1024
+                delay = block * 8 / (cobalt.bandwidth_mbps * 1_000_000)
+                for start in range(0, len(cobalt.audio), block):
+                    self.wfile.write(cobalt.audio[start:start + block])
+                    time.sleep(delay)
+
+        return Handler
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+
+
+class Recorder:
+    """Duraciones por etapa (thread-safe)"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: List[str] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def time(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def error(self, message: str):
+        with self._lock:
+            self.errors.append(message)
+
+    def summary(self) -> Dict:
+        return {stage: describe(values) for stage, values in self.samples.items()}
+
+
+class DiskSampler:
+    """Pico de bytes en la carpeta temporal de la app mientras corre el benchmark"""
+
+    def __init__(self, path: str, interval: float = 0.05):
+        self.path = path
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _size(self) -> int:
+        total = 0
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._size())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * p / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def describe(values: List[float]) -> Dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "mean": statistics.mean(values) if values else 0.0,
+        "max": max(values) if values else 0.0,
+    }
+
+
+def setup_environment(args, workdir: str, cobalt_url: str):
+    """Variables de entorno y SDK falso: debe ejecutarse antes de importar la app"""
+    os.environ.update({
+        "COBALT_INSTANCES": f"{cobalt_url}/",
+        # Cachés y trabajos en una carpeta propia y siempre "frías"
+        "CONTENTNOTES_CACHE_DB": os.path.join(workdir, "transcripts.sqlite3"),
+        "CONTENTNOTES_CACHE_TTL": "0",
+        "CONTENTNOTES_UPLOADS_DB": os.path.join(workdir, "uploads.sqlite3"),
+        "CONTENTNOTES_UPLOAD_TTL": "0",
+        "CONTENTNOTES_JOBS_DB": os.path.join(workdir, "jobs.sqlite3"),
+        "CONTENTNOTES_CAPTIONS": "0",
+        "CONTENTNOTES_CONTEXT_CACHE": "0",
+    })
+
+    from gemini_stub import install_fake_genai
+    return install_fake_genai(
+        upload_latency=args.upload_latency,
+        processing_seconds=args.processing_seconds,
+        generate_latency=args.generate_latency,
+        transcript_words=args.transcript_words,
+        notes_words=args.notes_words,
+    )
+
+
+def run_job(index: int, recorder: Recorder, detector, prompt_builder, notes: str, pdf) -> bool:
+    import yt_helper
+
+    def progress(stage, message):
+        if stage == "error":
+            recorder.error(f"job {index}: {message}")
+
+    url = f"https://youtu.be/bench{index:06d}"
+    start = time.perf_counter()
+
+    with recorder.time("download_and_transcribe"):
+        transcript = yt_helper.download_and_transcribe(url, is_youtube=True, progress=progress)
+    if not transcript:
+        return False
+
+    with recorder.time("detect"):
+        context = detector.detect(transcript)
+
+    with recorder.time("build_prompt"):
+        prompt_builder.build_prompt(transcript, context.get("prompt_key", "general_content"))
+
+    if pdf:
+        # Título distinto por trabajo: se mide el renderizado, no la caché
+        with recorder.time("generate_pdf"):
+            pdf(notes, title=f"Benchmark {index}")
+
+    recorder.record("job_total", time.perf_counter() - start)
+    return True
+
+
+def compare(current: Dict, previous: Dict):
+    """Variación de p50/p95 por etapa respecto a una ejecución anterior"""
+    old_runs = {run["concurrency"]: run for run in previous.get("runs", [])}
+    print("\nComparación con la ejecución anterior (positivo = más lento):")
+    for run in current["runs"]:
+        old = old_runs.get(run["concurrency"])
+        if not old:
+            continue
+        print(f"  concurrencia {run['concurrency']}: rendimiento "
+              f"{run['throughput_jobs_per_second']:.2f} vs {old['throughput_jobs_per_second']:.2f} trabajos/s")
+        for stage, stats in run["stages"].items():
+            before = old["stages"].get(stage)
+            if not before or not before["p50"]:
+                continue
+            delta50 = 100 * (stats["p50"] - before["p50"]) / before["p50"]
+            delta95 = 100 * (stats["p95"] - before["p95"]) / before["p95"] if before["p95"] else 0.0
+            print(f"    {stage:<26} p50 {delta50:+6.1f}%   p95 {delta95:+6.1f}%")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de extremo a extremo con Cobalt y Gemini falsos")
+    parser.add_argument("--jobs", type=int, default=8, help="Trabajos por nivel de concurrencia")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--audio-seconds", type=float, default=120)
+    parser.add_argument("--resolve-latency", type=float, default=0.1, help="Latencia de la API de Cobalt (s)")
+    parser.add_argument("--first-byte-latency", type=float, default=0.1)
+    parser.add_argument("--bandwidth", type=float, default=50.0, help="Mbps del servidor Cobalt falso")
+    parser.add_argument("--upload-latency", type=float, default=0.2)
+    parser.add_argument("--processing-seconds", type=float, default=0.5, help="Tiempo hasta ACTIVE")
+    parser.add_argument("--generate-latency", type=float, default=0.5)
+    parser.add_argument("--transcript-words", type=int, default=3000)
+    parser.add_argument("--notes-words", type=int, default=800)
+    parser.add_argument("--no-pdf", action="store_true")
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    parser.add_argument("--compare", help="Resultados JSON anteriores para comparar")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="cn-bench-") as workdir:
+        sample = os.path.join(workdir, "sample.wav")
+        make_sample_audio(sample, args.audio_seconds)
+        cobalt = FakeCobalt(Path(sample).read_bytes(), args.resolve_latency,
+                            args.first_byte_latency, args.bandwidth).start()
+        fake = setup_environment(args, workdir, cobalt.base_url)
+
+        from config_loader import init_config, get_context_detector, get_prompt_builder
+        config_loader = init_config("es")
+        detector = get_context_detector(config_loader, "fake-key")
+        prompt_builder = get_prompt_builder(config_loader)
+
+        pdf = None
+        if not args.no_pdf:
+            try:
+                from pdf_render import generate_pdf as pdf
+            except ImportError as e:
+                print(f"generate_pdf omitido (falta dependencia): {e}")
+        notes = fake.reply("notas")
+
+        runs = []
+        index = 0
+        for concurrency in args.concurrency:
+            recorder = Recorder()
+            os.makedirs(APP_TEMP_DIR, exist_ok=True)
+            with DiskSampler(APP_TEMP_DIR) as disk:
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    results = list(pool.map(
+                        lambda i: run_job(i, recorder, detector, prompt_builder, notes, pdf),
+                        range(index, index + args.jobs)
+                    ))
+                wall = time.perf_counter() - start
+            index += args.jobs
+
+            run = {
+                "concurrency": concurrency,
+                "jobs": args.jobs,
+                "succeeded": sum(results),
+                "wall_seconds": wall,
+                "throughput_jobs_per_second": sum(results) / wall if wall else 0.0,
+                "peak_temp_disk_bytes": disk.peak,
+                "stages": recorder.summary(),
+                "errors": recorder.errors[:20],
+            }
+            runs.append(run)
+
+            print(f"\nConcurrencia {concurrency}: {run['succeeded']}/{args.jobs} en {wall:.2f}s "
+                  f"({run['throughput_jobs_per_second']:.2f} trabajos/s, disco temporal máx. "
+                  f"{disk.peak / 1048576:.1f}MB)")
+            for stage, stats in run["stages"].items():
+                print(f"  {stage:<26} p50 {stats['p50'] * 1000:9.1f}ms   p95 {stats['p95'] * 1000:9.1f}ms")
+            for error in run["errors"][:3]:
+                print(f"  ❌ {error}")
+
+        cobalt.stop()
+
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    results = {
+        "meta": {
+            "timestamp": time.time(),
+            "commit": subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                     capture_output=True, text=True).stdout.strip(),
+            "python": sys.version.split()[0],
+            "settings": vars(args),
+        },
+        "runs": runs,
+        # ru_maxrss está en KB en Linux
+        "peak_rss_bytes": usage_self.ru_maxrss * 1024,
+        "peak_child_rss_bytes": usage_children.ru_maxrss * 1024,
+        "fake_genai": dict(fake.counters),
+        "fake_cobalt_requests": cobalt.requests,
+    }
+    print(f"\nPico RSS: {results['peak_rss_bytes'] / 1048576:.1f}MB "
+          f"(ffmpeg/hijos: {results['peak_child_rss_bytes'] / 1048576:.1f}MB)")
+
+    if args.compare:
+        compare(results, json.loads(Path(args.compare).read_text(encoding="utf-8")))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    return 0 if all(run["succeeded"] == run["jobs"] for run in runs) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
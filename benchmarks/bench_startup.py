@@ -0,0 +1,196 @@
+"""
+Benchmark de arranque: cuánto cuesta importar los módulos de la app en un
+intérprete nuevo (arranque en frío de un contenedor) y cuánto tarda cada
+rerun de Streamlit (cada clic o cambio de un widget).
+
+- Importación: "python -X importtime -c 'import <módulo>'" en procesos nuevos,
+  con la lista de dependencias más pesadas. También comprueba que los módulos
+  pesados que deberían cargarse bajo demanda (SDK de Gemini, pila de PDF, yt-dlp)
+  no se importen al arrancar.
+- Reruns: ejecuta app.py con streamlit.testing (AppTest) y el SDK falso de
+  gemini_stub; mide la primera ejecución y los reruns siguientes.
+
+Uso:
+    python benchmarks/bench_startup.py --repeat 5
+    python benchmarks/bench_startup.py --modules pipeline app_modules --json base.json
+    python benchmarks/bench_startup.py --json nuevo.json --compare base.json
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench_pipeline import describe
+
+# "app_modules" = todo lo que importa app.py (sin ejecutar la interfaz)
+APP_IMPORTS = "config_loader, job_runner, job_store, model_registry, pdf_render, media_input, tracing"
+DEFAULT_MODULES = ["config_loader", "yt_helper", "pipeline", "pdf_render", "app_modules"]
+# No deben cargarse al arrancar: se importan en la primera llamada que los usa
+LAZY_MODULES = ["google.generativeai", "markdown", "xhtml2pdf", "yt_dlp", "altair", "httpx"]
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)')
+
+
+def import_statement(module: str) -> str:
+    return f"import {APP_IMPORTS}" if module == "app_modules" else f"import {module}"
+
+
+def measure_import(module: str) -> Dict:
+    """Una importación en un proceso nuevo: tiempo total y dependencias de primer nivel"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", import_statement(module)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "falló"}
+
+    # Cada línea: tiempo propio | acumulado | nombre (la sangría indica la profundidad)
+    cumulative: Dict[str, int] = {}
+    total_us = 0
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        cum, indent, name = int(match.group(2)), match.group(3), match.group(4)
+        if len(indent) <= 1:
+            cumulative[name] = cumulative.get(name, 0) + cum
+            total_us += cum
+    return {"wall": wall, "import": total_us / 1e6, "top": cumulative}
+
+
+def check_lazy(module: str) -> List[str]:
+    """Módulos pesados que se cargaron al importar module (debería ser una lista vacía)"""
+    code = (f"{import_statement(module)}\nimport sys, json\n"
+            f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        return ["(no se pudo importar)"]
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def bench_imports(modules: List[str], repeat: int, top: int) -> Dict:
+    results = {}
+    for module in modules:
+        runs = [measure_import(module) for _ in range(repeat)]
+        errors = [run["error"] for run in runs if "error" in run]
+        if errors:
+            print(f"  {module:<16} ❌ {errors[0]}")
+            results[module] = {"error": errors[0]}
+            continue
+
+        heaviest: Dict[str, float] = {}
+        for run in runs:
+            for name, us in run["top"].items():
+                heaviest[name] = heaviest.get(name, 0.0) + us / 1e6 / len(runs)
+        wall = describe([run["wall"] for run in runs])
+        imports = describe([run["import"] for run in runs])
+        eager = check_lazy(module)
+        results[module] = {
+            "wall": wall,
+            "import": imports,
+            "heaviest": dict(sorted(heaviest.items(), key=lambda item: -item[1])[:top]),
+            "eager_heavy_modules": eager,
+        }
+        print(f"  {module:<16} proceso p50 {wall['p50']:.3f}s   importación p50 {imports['p50']:.3f}s"
+              + (f"   ⚠️ cargados al arrancar: {', '.join(eager)}" if eager else ""))
+        for name, seconds in results[module]["heaviest"].items():
+            print(f"      {name:<40} {seconds:.3f}s")
+    return results
+
+
+def bench_reruns(reruns: int) -> Optional[Dict]:
+    """Primera ejecución y reruns de app.py con el SDK falso (None si no hay streamlit)"""
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        print("  streamlit no está instalado: se omiten los reruns")
+        return None
+
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    from gemini_stub import install_fake_genai
+    install_fake_genai()
+
+    app = AppTest.from_file(str(ROOT / "app.py"), default_timeout=120)
+    start = time.perf_counter()
+    app.run()
+    first = time.perf_counter() - start
+    if app.exception:
+        print(f"  ❌ app.py falló: {app.exception[0].message}")
+        return {"error": app.exception[0].message}
+
+    times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        times.append(time.perf_counter() - start)
+    result = {"first_run": first, "rerun": describe(times)}
+    print(f"  primera ejecución {first:.3f}s   rerun p50 {result['rerun']['p50'] * 1000:.1f}ms"
+          f"   p95 {result['rerun']['p95'] * 1000:.1f}ms")
+    return result
+
+
+def compare(current: Dict, previous: Dict):
+    """Variación respecto a una ejecución anterior (positivo = más lento)"""
+    print("\nComparación con la ejecución anterior (positivo = más lento):")
+    for module, stats in current["imports"].items():
+        before = previous.get("imports", {}).get(module)
+        if "error" in stats or not before or "error" in before or not before["import"]["p50"]:
+            continue
+        delta = 100 * (stats["import"]["p50"] - before["import"]["p50"]) / before["import"]["p50"]
+        print(f"  importar {module:<16} {delta:+6.1f}%")
+    now, old = current.get("reruns") or {}, previous.get("reruns") or {}
+    if "rerun" in now and "rerun" in old and old["rerun"]["p50"]:
+        delta = 100 * (now["rerun"]["p50"] - old["rerun"]["p50"]) / old["rerun"]["p50"]
+        print(f"  rerun p50               {delta:+6.1f}%")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Tiempo de arranque en frío y de rerun de la app")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES,
+                        help="Módulos a importar ('app_modules' = todo lo que importa app.py)")
+    parser.add_argument("--repeat", type=int, default=5, help="Procesos nuevos por módulo")
+    parser.add_argument("--top", type=int, default=8, help="Dependencias más pesadas a mostrar")
+    parser.add_argument("--reruns", type=int, default=20, help="Reruns de app.py (0 = no medir)")
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    parser.add_argument("--compare", help="Resultados JSON anteriores para comparar")
+    args = parser.parse_args(argv)
+
+    print("Importación en un intérprete nuevo:")
+    imports = bench_imports(args.modules, args.repeat, args.top)
+
+    reruns = None
+    if args.reruns > 0:
+        print("\nReruns de Streamlit (app.py):")
+        reruns = bench_reruns(args.reruns)
+
+    results = {
+        "meta": {
+            "timestamp": time.time(),
+            "commit": subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                     capture_output=True, text=True).stdout.strip(),
+            "python": sys.version.split()[0],
+            "settings": vars(args),
+        },
+        "imports": imports,
+        "reruns": reruns,
+    }
+
+    if args.compare:
+        compare(results, json.loads(Path(args.compare).read_text(encoding="utf-8")))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    return 0 if not any("error" in stats for stats in imports.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
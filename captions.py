@@ -0,0 +1,151 @@
+import io
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import webvtt
+
+# --- CONFIGURACIÓN DE SUBTÍTULOS ---
+# Si el video ya tiene subtítulos se usan en lugar de transcribir el audio
+CAPTIONS_ENABLED = os.getenv("CONTENTNOTES_CAPTIONS", "1") == "1"
+CAPTION_EXTENSIONS = {".vtt", ".srt"}
+PREFERRED_LANGUAGES = ["es", "en"]   # Cuando no se conoce el idioma original del video
+PARAGRAPH_GAP_SECONDS = 3.0          # Una pausa así entre subtítulos abre un párrafo nuevo
+MIN_CAPTION_CHARS = 50               # Menos que esto no sirve para generar notas
+
+TAG_RE = re.compile(r'<[^>]+>')
+SPACES_RE = re.compile(r'\s+')
+SPEAKER_CHANGE_RE = re.compile(r'^\s*(?:>>\s*|-\s+)')
+
+
+def is_caption_file(path: str) -> bool:
+    return Path(path).suffix.lower() in CAPTION_EXTENSIONS
+
+
+def _clean(line: str) -> str:
+    # Los auto-subtítulos traen marcas de tiempo por palabra (<00:00:01.000><c>...</c>)
+    return SPACES_RE.sub(' ', TAG_RE.sub('', line)).strip()
+
+
+def _repeats(previous: str, line: str) -> bool:
+    # Un final de línea solo cuenta como repetición si es largo (evita perder un "no" suelto)
+    return previous == line or (len(line.split()) >= 3 and previous.endswith(line))
+
+
+def normalize_captions(captions) -> str:
+    """
+    Convierte subtítulos (objetos con .start_in_seconds, .text) en texto corrido.
+    Los auto-subtítulos de YouTube repiten cada línea en el subtítulo siguiente
+    (efecto "rodillo") y a veces la van completando palabra a palabra: se
+    conserva cada línea una sola vez y en su versión más completa.
+    """
+    paragraphs: List[List[str]] = [[]]
+    recent: List[str] = []   # Últimas líneas emitidas (el rodillo repite hasta dos)
+    last_end = None
+
+    for caption in captions:
+        start = getattr(caption, "start_in_seconds", None)
+        if last_end is not None and start is not None and start - last_end >= PARAGRAPH_GAP_SECONDS:
+            if paragraphs[-1]:
+                paragraphs.append([])
+        last_end = getattr(caption, "end_in_seconds", start)
+
+        for raw in caption.text.splitlines():
+            line = _clean(raw)
+            speaker_change = bool(SPEAKER_CHANGE_RE.match(line))
+            line = SPEAKER_CHANGE_RE.sub('', line)
+            if not line or any(_repeats(previous, line) for previous in recent):
+                continue
+
+            current = paragraphs[-1]
+            if recent and current and current[-1] == recent[-1] and line.startswith(recent[-1]):
+                # La misma línea, ahora más completa
+                current[-1] = line
+                recent[-1] = line
+                continue
+
+            if speaker_change and current:
+                paragraphs.append([])
+            paragraphs[-1].append(line)
+            recent = (recent + [line])[-3:]
+
+    return "\n\n".join(" ".join(lines) for lines in paragraphs if lines)
+
+
+def read_caption_file(path: str) -> Optional[str]:
+    """Texto normalizado de un archivo .vtt o .srt (None si no se puede leer)"""
+    try:
+        if Path(path).suffix.lower() == ".srt":
+            captions = webvtt.from_srt(path)
+        else:
+            captions = webvtt.read(path)
+        text = normalize_captions(captions)
+    except Exception as e:
+        print(f"Error leyendo subtítulos {path}: {e}")
+        return None
+    return text if len(text) >= MIN_CAPTION_CHARS else None
+
+
+def parse_vtt(content: str) -> str:
+    return normalize_captions(webvtt.read_buffer(io.StringIO(content)))
+
+
+def _pick_track(info: Dict, languages: List[str]) -> Optional[str]:
+    """
+    URL del mejor subtítulo VTT: primero los humanos y luego los automáticos,
+    en el idioma original del video (los automáticos incluyen traducciones
+    automáticas a todos los idiomas, que no queremos).
+    """
+    original = info.get("language")
+    wanted = ([original] if original else []) + [lang for lang in languages if lang != original]
+
+    def vtt_url(tracks: Dict, lang: str) -> Optional[str]:
+        for code, formats in tracks.items():
+            if code == lang or code.startswith(f"{lang}-"):
+                for fmt in formats:
+                    if fmt.get("ext") == "vtt" and fmt.get("url"):
+                        return fmt["url"]
+        return None
+
+    human = info.get("subtitles") or {}
+    for lang in wanted:
+        url = vtt_url(human, lang)
+        if url:
+            return url
+
+    automatic = info.get("automatic_captions") or {}
+    # yt-dlp marca la pista original de los automáticos como "<idioma>-orig"
+    for code in automatic:
+        if code.endswith("-orig"):
+            url = vtt_url(automatic, code)
+            if url:
+                return url
+    if original:
+        return vtt_url(automatic, original)
+    return None
+
+
+def fetch_youtube_captions(url: str, languages: Optional[List[str]] = None) -> Optional[str]:
+    """Subtítulos del video como texto normalizado, o None si no tiene (o falla)"""
+    import yt_dlp
+    from cobalt_client import get_cobalt_client
+
+    options = {"skip_download": True, "quiet": True, "no_warnings": True}
+    try:
+        with yt_dlp.YoutubeDL(options) as ydl:
+            info = ydl.extract_info(url, download=False)
+
+        track_url = _pick_track(info or {}, languages or PREFERRED_LANGUAGES)
+        if not track_url:
+            return None
+
+        # Reutilizamos la sesión HTTP compartida (keep-alive)
+        response = get_cobalt_client().session.get(track_url, timeout=20)
+        response.raise_for_status()
+        text = parse_vtt(response.text)
+    except Exception as e:
+        print(f"Sin subtítulos para {url}: {e}")
+        return None
+
+    return text if len(text) >= MIN_CAPTION_CHARS else None
@@ -0,0 +1,230 @@
+"""
+Procesamiento por lotes sin navegador.
+
+Uso:
+    python cli.py URL_O_ARCHIVO [URL_O_ARCHIVO ...] -o notas/ --workers 2
+    python cli.py --input lista.txt -o notas/ --lang en --no-pdf
+    python cli.py --input lista.txt -o notas/ --async --workers 8
+"""
+import argparse
+import asyncio
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from config_loader import init_config, get_context_detector, get_prompt_builder
+from job_store import get_job_store
+from model_registry import get_model_registry
+from audio_profiles import PROFILES
+from pdf_render import generate_pdf
+from pipeline import process_source, is_remote_source
+from async_pipeline import process_source_async
+from cobalt_client import close_async_cobalt_client
+import rate_limiter
+import tracing
+from yt_helper import extract_video_id
+
+
+def read_sources(args) -> List[str]:
+    """Fuentes de la línea de comandos y/o de un archivo (una por línea, # comenta)"""
+    sources = list(args.sources)
+    if args.input:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    sources.append(line)
+    return sources
+
+
+def output_stem(source: str) -> str:
+    """Nombre base del archivo de notas para una fuente"""
+    if is_remote_source(source):
+        video_id = extract_video_id(source)
+        if video_id != "video_temp":
+            return f"yt_{video_id}"
+        return re.sub(r'[^\w-]+', '_', source.split('://', 1)[-1]).strip('_')[:80]
+    return Path(source).stem
+
+
+def unique_stems(sources: List[str]) -> List[str]:
+    seen = {}
+    stems = []
+    for source in sources:
+        stem = output_stem(source)
+        count = seen.get(stem, 0)
+        seen[stem] = count + 1
+        stems.append(stem if count == 0 else f"{stem}_{count + 1}")
+    return stems
+
+
+def process_one(source: str, stem: str, output_dir: Path, context_detector, prompt_builder,
+                write_pdf: bool, compact: bool = False, audio_profile: Optional[str] = None,
+                captions: Optional[bool] = None) -> bool:
+    def progress(stage, message):
+        print(f"[{stem}] [{stage}] {message}", flush=True)
+
+    # Con el almacén de trabajos, relanzar el lote reanuda lo que quedó a medias
+    result = process_source(source, context_detector, prompt_builder, progress=progress,
+                            job_store=get_job_store(), finish_job=False, compact=compact or None,
+                            audio_profile=audio_profile, captions=captions)
+    return save_outputs(result, stem, output_dir, write_pdf, progress)
+
+
+async def process_one_async(source: str, stem: str, output_dir: Path, context_detector, prompt_builder,
+                            write_pdf: bool, compact: bool = False, audio_profile: Optional[str] = None,
+                            captions: Optional[bool] = None) -> bool:
+    def progress(stage, message):
+        print(f"[{stem}] [{stage}] {message}", flush=True)
+
+    result = await process_source_async(source, context_detector, prompt_builder, progress=progress,
+                                        job_store=get_job_store(), finish_job=False, compact=compact or None,
+                                        audio_profile=audio_profile, captions=captions)
+    # El PDF se renderiza en un hilo para no frenar al resto de trabajos del loop
+    return await asyncio.to_thread(save_outputs, result, stem, output_dir, write_pdf, progress)
+
+
+async def process_all_async(jobs: List[Tuple[str, str]], workers: int, *args) -> List[str]:
+    """Todos los trabajos en un solo event loop, como mucho workers a la vez; devuelve los fallidos"""
+    slots = asyncio.Semaphore(workers)
+
+    async def run(source: str, stem: str) -> bool:
+        async with slots:
+            try:
+                return await process_one_async(source, stem, *args)
+            except Exception as e:
+                print(f"[{source}] ❌ {e}", file=sys.stderr)
+                return False
+
+    try:
+        results = await asyncio.gather(*(run(source, stem) for source, stem in jobs))
+    finally:
+        await close_async_cobalt_client()
+    return [source for (source, _), ok in zip(jobs, results) if not ok]
+
+
+def save_outputs(result, stem: str, output_dir: Path, write_pdf: bool, progress) -> bool:
+    """Escribe el .md (y el .pdf) de un resultado de process_source y cierra su trabajo"""
+    if not result:
+        return False
+    trace = result["trace"]
+    if not result["analysis"]:
+        tracing.finish_trace(trace, status="error")
+        return False
+
+    job = result["job"]
+    md_path = output_dir / f"{stem}.md"
+    md_path.write_text(result["analysis"], encoding='utf-8')
+    rendered = {"md": str(md_path)}
+
+    if write_pdf:
+        with tracing.span("render", trace=trace) as span:
+            pdf_bytes = generate_pdf(result["analysis"], title=stem)
+            span.set(bytes_out=len(pdf_bytes or b""))
+        if pdf_bytes:
+            pdf_path = output_dir / f"{stem}.pdf"
+            pdf_path.write_bytes(pdf_bytes)
+            rendered["pdf"] = str(pdf_path)
+        else:
+            progress("error", "No se pudo generar el PDF")
+            if job:
+                job.fail("render", "No se pudo generar el PDF")
+            tracing.finish_trace(trace, status="error")
+            return False
+
+    if job:
+        job.done("render", rendered)
+        job.finish()
+    tracing.finish_trace(trace)
+
+    progress("done", f"✅ {md_path}")
+    return True
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="ContentNotes por lotes: URLs o archivos -> notas .md/.pdf")
+    parser.add_argument("sources", nargs="*", help="URLs de YouTube o rutas de audio/video/subtítulos")
+    parser.add_argument("-i", "--input", help="Archivo con una fuente por línea")
+    parser.add_argument("-o", "--output-dir", default="notas", help="Carpeta de salida (por defecto: notas)")
+    parser.add_argument("-w", "--workers", type=int, default=2, help="Trabajos en paralelo (por defecto: 2)")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Un solo event loop para todo el lote (plazos por etapa, Ctrl+C cancela)")
+    parser.add_argument("--lang", default="es", help="Idioma de las notas (es|en)")
+    parser.add_argument("--no-pdf", action="store_true", help="Solo escribir Markdown")
+    parser.add_argument("--compact", action="store_true",
+                        help="Quitar silencios largos antes de transcribir (CONTENTNOTES_TEMPO acelera la voz)")
+    parser.add_argument("--audio-profile", default=None, choices=["auto", *PROFILES],
+                        help="Codificación del audio (por defecto: auto según duración)")
+    parser.add_argument("--no-captions", action="store_true",
+                        help="Transcribir el audio aunque el video tenga subtítulos")
+    parser.add_argument("--skip-existing", action="store_true", help="Saltar fuentes que ya tienen .md")
+    parser.add_argument("--list-jobs", action="store_true", help="Mostrar los trabajos registrados y salir")
+    args = parser.parse_args(argv)
+
+    if args.list_jobs:
+        for job in get_job_store().list_jobs():
+            print(f"{job['id'][:8]}  {job['status']:<8} {job['stage'] or '-':<10} {job['source']}"
+                  + (f"  ({job['error']})" if job['error'] else ""))
+        return 0
+
+    sources = read_sources(args)
+    if not sources:
+        parser.error("no se indicó ninguna fuente")
+
+    load_dotenv()
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        print("GOOGLE_API_KEY no configurada (.env o variable de entorno)", file=sys.stderr)
+        return 2
+    get_model_registry().configure(api_key)
+    # Los lotes ceden el turno a las sesiones interactivas que compartan la cuota
+    rate_limiter.set_default_lane("batch")
+
+    config_loader = init_config(language=args.lang)
+    context_detector = get_context_detector(config_loader, api_key)
+    prompt_builder = get_prompt_builder(config_loader)
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    jobs = []
+    for source, stem in zip(sources, unique_stems(sources)):
+        if args.skip_existing and (output_dir / f"{stem}.md").exists():
+            print(f"[{stem}] ya procesado, se omite")
+            continue
+        jobs.append((source, stem))
+
+    options = (output_dir, context_detector, prompt_builder, not args.no_pdf, args.compact,
+               args.audio_profile, False if args.no_captions else None)
+    failed = []
+    if args.use_async:
+        failed = asyncio.run(process_all_async(jobs, max(1, args.workers), *options))
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            futures = {
+                pool.submit(process_one, source, stem, *options): source
+                for source, stem in jobs
+            }
+            for future in as_completed(futures):
+                source = futures[future]
+                try:
+                    ok = future.result()
+                except Exception as e:
+                    print(f"[{source}] ❌ {e}", file=sys.stderr)
+                    ok = False
+                if not ok:
+                    failed.append(source)
+
+    print(f"\n{len(jobs) - len(failed)}/{len(jobs)} fuentes procesadas")
+    for source in failed:
+        print(f"  ❌ {source}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,297 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import tracing
+
+# --- CONFIGURACIÓN DE COBALT ---
+# Lista de instancias separadas por comas (la primera es la preferida).
+# Lista pública: https://instances.cobalt.tools/
+DEFAULT_INSTANCES = [
+    "https://api.cobalt.tools/api/json",
+    "https://cobalt.api.unblockers.it/api/json",
+]
+COBALT_INSTANCES = [
+    url.strip() for url in os.getenv("COBALT_INSTANCES", ",".join(DEFAULT_INSTANCES)).split(",") if url.strip()
+]
+
+REQUEST_TIMEOUT = 20          # Segundos por petición / lectura
+FAILURE_COOLDOWN = 120        # Segundos que una instancia caída queda al final de la cola
+DOWNLOAD_RETRIES = 3          # Reintentos de descarga (reanudando con Range)
+CHUNK_SIZE = 256 * 1024
+
+HEADERS = {
+    "Accept": "application/json",
+    "Content-Type": "application/json",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+}
+
+
+class CobaltError(RuntimeError):
+    """Ninguna instancia de Cobalt pudo resolver o descargar el enlace"""
+
+
+def _resolve_payload(url: str) -> Dict:
+    # Payload actualizado para v10
+    return {
+        "url": url,
+        "videoQuality": "720",     # Requerido en algunas instancias
+        "audioFormat": "mp3",      # Formato de audio
+        "filenameStyle": "basic",
+        "downloadMode": "audio"    # IMPORTANTE: Solo audio
+    }
+
+
+def _download_url(status_code: int, text: str, parse_json: Callable[[], Dict]) -> str:
+    """Enlace de descarga de una respuesta de Cobalt (lanza CobaltError si no lo hay)"""
+    if status_code != 200:
+        raise CobaltError(f"HTTP {status_code}: {text[:200]}")
+
+    data = parse_json()
+
+    # En v10, el estado suele ser 'tunnel', 'redirect' o 'success'
+    if data.get("status") == "error":
+        error = data.get("text") or (data.get("error") or {}).get("code")
+        raise CobaltError(f"Cobalt dice: {error}")
+
+    if not data.get("url"):
+        raise CobaltError("No se encontró el enlace de descarga en la respuesta.")
+    return data["url"]
+
+
+def _skip_prefix(chunk: bytes, skip: int):
+    """Descarta lo ya entregado cuando el servidor reinicia en lugar de reanudar"""
+    if len(chunk) <= skip:
+        return b"", skip - len(chunk)
+    return chunk[skip:], 0
+
+
+class _InstanceHealth:
+    """Latencia media (EWMA) y fallos recientes de una instancia"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.latency = None
+        self.failures = 0
+        self.cooldown_until = 0.0
+
+    def record_success(self, latency: float):
+        self.latency = latency if self.latency is None else 0.7 * self.latency + 0.3 * latency
+        self.failures = 0
+        self.cooldown_until = 0.0
+
+    def record_failure(self):
+        self.failures += 1
+        # Cuantos más fallos seguidos, más tiempo fuera (con tope)
+        self.cooldown_until = time.monotonic() + FAILURE_COOLDOWN * min(self.failures, 5)
+
+    def score(self) -> tuple:
+        cooling = time.monotonic() < self.cooldown_until
+        # Sin medir todavía = optimista (se prueba pronto)
+        return (cooling, self.failures, self.latency if self.latency is not None else 0.0)
+
+
+class CobaltClient:
+    """
+    Cliente de Cobalt con sesión HTTP compartida (keep-alive), varias
+    instancias ordenadas por salud/latencia con failover automático y
+    descargas que se reanudan con peticiones Range si la conexión se corta.
+    """
+
+    def __init__(self, instances: Optional[List[str]] = None, session: Optional[requests.Session] = None,
+                 pool_size: int = 16):
+        self.instances = [_InstanceHealth(url) for url in (instances or COBALT_INSTANCES)]
+        self._lock = threading.Lock()
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+
+    def ranked_instances(self) -> List[_InstanceHealth]:
+        with self._lock:
+            return sorted(self.instances, key=lambda instance: instance.score())
+
+    def _record(self, instance: _InstanceHealth, latency: Optional[float] = None):
+        """Éxito (con latencia) o fallo (sin ella) de una instancia"""
+        with self._lock:
+            if latency is None:
+                instance.record_failure()
+            else:
+                instance.record_success(latency)
+
+    def health(self) -> List[Dict]:
+        """Estado de las instancias (para diagnóstico)"""
+        return [
+            {"url": i.url, "latency": i.latency, "failures": i.failures,
+             "cooling_down": time.monotonic() < i.cooldown_until}
+            for i in self.ranked_instances()
+        ]
+
+    def resolve(self, url: str) -> str:
+        """Pide a Cobalt el enlace de descarga del audio, probando instancias en orden"""
+        payload = _resolve_payload(url)
+
+        errors = []
+        for instance in self.ranked_instances():
+            start = time.monotonic()
+            try:
+                response = self.session.post(instance.url, json=payload, headers=HEADERS, timeout=REQUEST_TIMEOUT)
+                download_url = _download_url(response.status_code, response.text, response.json)
+                self._record(instance, time.monotonic() - start)
+                return download_url
+
+            except (requests.RequestException, ValueError, CobaltError) as e:
+                self._record(instance)
+                errors.append(f"{instance.url} -> {e}")
+                tracing.add(retries=1)
+
+        raise CobaltError("Ninguna instancia de Cobalt respondió: " + " | ".join(errors))
+
+    def iter_download(self, download_url: str, retries: int = DOWNLOAD_RETRIES) -> Iterator[bytes]:
+        """
+        Genera el contenido por bloques. Si la conexión se corta, reanuda con
+        'Range: bytes=N-'; si el servidor no soporta rangos, reinicia y descarta
+        lo ya entregado, así quien consume ve un flujo continuo.
+        """
+        received = 0
+        attempt = 0
+
+        while True:
+            headers = {"Range": f"bytes={received}-"} if received else {}
+            try:
+                with self.session.get(download_url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as r:
+                    if r.status_code == 416:
+                        # Ya teníamos todo el contenido
+                        return
+                    r.raise_for_status()
+
+                    skip = received if (received and r.status_code != 206) else 0
+                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                        if skip:
+                            chunk, skip = _skip_prefix(chunk, skip)
+                            if not chunk:
+                                continue
+                        received += len(chunk)
+                        yield chunk
+                return
+
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                attempt += 1
+                tracing.add(retries=1)
+                if attempt > retries:
+                    raise CobaltError(f"Descarga interrumpida tras {retries} reintentos: {e}")
+                time.sleep(min(2 ** attempt, 10))
+
+
+_client: Optional[CobaltClient] = None
+_client_lock = threading.Lock()
+
+
+def get_cobalt_client() -> CobaltClient:
+    """Cliente compartido del proceso (una sola sesión y un solo marcador de salud)"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = CobaltClient()
+        return _client
+
+
+class AsyncCobaltClient:
+    """
+    Versión async (httpx) del cliente para async_pipeline.py: mismo failover y
+    mismas descargas reanudables, con el marcador de salud del cliente compartido.
+    Un httpx.AsyncClient pertenece a un event loop: usar get_async_cobalt_client().
+    """
+
+    def __init__(self, health: Optional[CobaltClient] = None, pool_size: int = 16):
+        import httpx   # Solo lo necesita el pipeline async
+        self._httpx = httpx
+        self.health = health or get_cobalt_client()
+        self.client = httpx.AsyncClient(
+            timeout=REQUEST_TIMEOUT, follow_redirects=True,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    async def resolve(self, url: str) -> str:
+        payload = _resolve_payload(url)
+
+        errors = []
+        for instance in self.health.ranked_instances():
+            start = time.monotonic()
+            try:
+                response = await self.client.post(instance.url, json=payload, headers=HEADERS)
+                download_url = _download_url(response.status_code, response.text, response.json)
+                self.health._record(instance, time.monotonic() - start)
+                return download_url
+
+            except (self._httpx.HTTPError, ValueError, CobaltError) as e:
+                self.health._record(instance)
+                errors.append(f"{instance.url} -> {e}")
+                tracing.add(retries=1)
+
+        raise CobaltError("Ninguna instancia de Cobalt respondió: " + " | ".join(errors))
+
+    async def iter_download(self, download_url: str, retries: int = DOWNLOAD_RETRIES) -> AsyncIterator[bytes]:
+        """Igual que CobaltClient.iter_download, sin bloquear el event loop"""
+        received = 0
+        attempt = 0
+
+        while True:
+            headers = {"Range": f"bytes={received}-"} if received else {}
+            try:
+                async with self.client.stream("GET", download_url, headers=headers) as r:
+                    if r.status_code == 416:
+                        return
+                    r.raise_for_status()
+
+                    skip = received if (received and r.status_code != 206) else 0
+                    async for chunk in r.aiter_bytes(CHUNK_SIZE):
+                        if skip:
+                            chunk, skip = _skip_prefix(chunk, skip)
+                            if not chunk:
+                                continue
+                        received += len(chunk)
+                        yield chunk
+                return
+
+            except self._httpx.TransportError as e:
+                attempt += 1
+                tracing.add(retries=1)
+                if attempt > retries:
+                    raise CobaltError(f"Descarga interrumpida tras {retries} reintentos: {e}")
+                await asyncio.sleep(min(2 ** attempt, 10))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncCobaltClient]" = weakref.WeakKeyDictionary()
+
+
+def get_async_cobalt_client() -> AsyncCobaltClient:
+    """Cliente async del event loop en curso (uno por loop; todos comparten la salud)"""
+    loop = asyncio.get_running_loop()
+    health = get_cobalt_client()
+    with _client_lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            client = AsyncCobaltClient(health)
+            _async_clients[loop] = client
+        return client
+
+
+async def close_async_cobalt_client():
+    """Cierra el cliente del loop en curso (antes de que termine asyncio.run)"""
+    with _client_lock:
+        client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -1,47 +1,173 @@
+import asyncio
 import json
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
 from pathlib import Path
-from typing import Dict, Optional
-import google.generativeai as genai
+from types import MappingProxyType
+from typing import Dict, List, Optional, Tuple
+from keyword_classifier import KeywordClassifier
+from model_registry import get_model, get_model_registry
+from rate_limiter import get_rate_limiter
+import tracing
+
+# Cada cuánto se mira la fecha de config.json para recargarlo en caliente
+CONFIG_RELOAD_CHECK_SECONDS = 1.0
+
+PROMPT_FOOTER = "\n\nPor favor, genera las notas siguiendo las instrucciones indicadas."
+
+# Modelos por tarea si config.json no trae la sección "models"
+DEFAULT_MODELS = {
+    "transcribe": "gemini-2.0-flash",
+    "classify": "gemini-2.5-flash",
+    "notes": "gemini-2.5-flash"
+}
+CLASSIFY_GENERATION_CONFIG = {"temperature": 0.1}  # Baja temperatura para ser más precisos
+
+# Sustituye a la transcripción dentro de los prompts cuando va en la caché de contexto
+CACHED_CONTENT_NOTE = {
+    "es": "(El contenido completo es la transcripción adjunta en el contexto.)",
+    "en": "(The full content is the transcript attached in the context.)"
+}
+
+
+def _freeze(value):
+    """Copia de solo lectura (dicts -> MappingProxyType, listas -> tuplas)"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _resolve_config_path(config_path) -> Path:
+    # LÓGICA DE BÚSQUEDA INTELIGENTE
+    # 1. Mira si la ruta tal cual existe
+    path_obj = Path(config_path)
+    
+    # 2. Si no existe, intenta buscarlo en la misma carpeta que este script (src/)
+    if not path_obj.exists():
+        path_obj = Path(__file__).parent / "config.json"
+    
+    # 3. Si aún no existe, intenta en la carpeta superior (raíz)
+    if not path_obj.exists():
+        path_obj = Path(__file__).parent.parent / "config.json"
+    
+    return path_obj
 
 
-class ConfigLoader:
-    """Carga y gestiona configuración desde JSON"""
+class ConfigSnapshot:
+    """
+    Una versión de config.json ya procesada e inmutable, compartida por todo el proceso.
+    Los encabezados de los prompts se pre-renderizan por (idioma, prompt_key).
+    """
     
-    def __init__(self, config_path: str = "config.json", language: str = "es"):
-        # LÓGICA DE BÚSQUEDA INTELIGENTE
-        # 1. Mira si la ruta tal cual existe
-        path_obj = Path(config_path)
+    def __init__(self, path: Path, config: Dict, mtime: int):
+        self.path = path
+        self.mtime = mtime
+        self.config = _freeze(config)
+        self.keyword_classifier = (
+            KeywordClassifier(config) if config.get('classifier', {}).get('enabled', False) else None
+        )
         
-        # 2. Si no existe, intenta buscarlo en la misma carpeta que este script (src/)
-        if not path_obj.exists():
-            path_obj = Path(__file__).parent / "config.json"
+        self._parts: Dict[Tuple[str, str], Tuple[str, str, str]] = {}
+        self._headers: Dict[Tuple[str, str], str] = {}
+        for language, templates in config.get('prompts', {}).items():
+            for prompt_key, template in templates.items():
+                if not template:
+                    continue
+                system_role = template.get('system_role', '')
+                intro = template.get('intro', '')
+                instructions_text = "\n".join(f"• {inst}" for inst in template.get('instructions', []))
+                self._parts[(language, prompt_key)] = (system_role, intro, instructions_text)
+                self._headers[(language, prompt_key)] = (
+                    f"{system_role}\n\n{intro}\n\nINSTRUCCIONES:\n{instructions_text}\n\nCONTENIDO A PROCESAR:\n"
+                )
+    
+    def template_parts(self, language: str, prompt_key: str) -> Tuple[str, str, str]:
+        """(system_role, intro, instrucciones con viñetas); general_content si no existe la llave"""
+        return (self._parts.get((language, prompt_key))
+                or self._parts.get((language, 'general_content'))
+                or ("", "", ""))
+    
+    def prompt_header(self, language: str, prompt_key: str) -> str:
+        """Todo el prompt final hasta la transcripción"""
+        return (self._headers.get((language, prompt_key))
+                or self._headers.get((language, 'general_content'))
+                or "\n\n\n\nINSTRUCCIONES:\n\n\nCONTENIDO A PROCESAR:\n")
+
+
+_snapshots: Dict[Path, ConfigSnapshot] = {}
+_checked_at: Dict[Path, float] = {}
+_invalid_mtime: Dict[Path, int] = {}
+_snapshot_lock = threading.Lock()
+
+
+def load_shared_config(config_path="config.json") -> ConfigSnapshot:
+    """
+    Configuración compartida del proceso. Se vuelve a leer solo si cambia la
+    fecha de modificación del archivo (como mucho una comprobación por segundo).
+    Si la nueva versión no es JSON válido se mantiene la anterior.
+    """
+    path = _resolve_config_path(config_path)
+    now = time.monotonic()
+    snapshot = _snapshots.get(path)
+    if snapshot and now - _checked_at.get(path, 0.0) < CONFIG_RELOAD_CHECK_SECONDS:
+        return snapshot
+    
+    with _snapshot_lock:
+        snapshot = _snapshots.get(path)
+        _checked_at[path] = now
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            if snapshot:
+                return snapshot
+            # Esto imprimirá la ruta real que falló para que sepas dónde lo buscó
+            raise FileNotFoundError(f"No se encontró el archivo en: {path.absolute()}")
+        
+        if snapshot and mtime in (snapshot.mtime, _invalid_mtime.get(path)):
+            return snapshot
+        
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except ValueError as e:
+            if snapshot:
+                print(f"config.json inválido, se mantiene la versión anterior: {e}")
+                _invalid_mtime[path] = mtime
+                return snapshot
+            raise
         
-        # 3. Si aún no existe, intenta en la carpeta superior (raíz)
-        if not path_obj.exists():
-            path_obj = Path(__file__).parent.parent / "config.json"
+        snapshot = ConfigSnapshot(path, config, mtime)
+        _snapshots[path] = snapshot
+        return snapshot
 
-        self.config_path = path_obj
+
+def get_model_name(role: str, config_path="config.json") -> str:
+    """Modelo de Gemini para una tarea ("transcribe", "classify", "notes") según config.json"""
+    models = load_shared_config(config_path).config.get("models", {})
+    return models.get(role) or DEFAULT_MODELS[role]
+
+
+class ConfigLoader:
+    """Vista por idioma de la configuración compartida (se recarga sola si cambia el archivo)"""
+    
+    def __init__(self, config_path: str = "config.json", language: str = "es"):
+        self.config_path = _resolve_config_path(config_path)
         self.language = language
-        self.config = self._load_config()
         
         if self.language not in self.config['app_settings']['supported_languages']:
             self.language = self.config['app_settings']['default_language']
     
-    def _load_config(self) -> Dict:
-        # Ahora usamos self.config_path que ya fue validado arriba
-        if not self.config_path.exists():
-            # Esto imprimirá la ruta real que falló para que sepas dónde lo buscó
-            raise FileNotFoundError(f"No se encontró el archivo en: {self.config_path.absolute()}")
-            
-        with open(self.config_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+        return load_shared_config(self.config_path)
     
-    def set_language(self, language: str) -> bool:
-        if language in self.config['app_settings']['supported_languages']:
-            self.language = language
-            return True
-        return False
+    @property
+    def config(self):
+        return self.snapshot.config
     
     def get_all_translations(self) -> dict:
         try:
@@ -49,6 +175,10 @@ class ConfigLoader:
         except:
             return {}
     
+    def get_keyword_classifier(self) -> Optional[KeywordClassifier]:
+        """Clasificador local (se construye una sola vez por versión de la configuración)"""
+        return self.snapshot.keyword_classifier
+    
     def get_prompt_template(self, prompt_key: str) -> Dict:
         try:
             templates = self.config['prompts'].get(self.language, {})
@@ -57,6 +187,9 @@ class ConfigLoader:
             return templates.get(prompt_key, {})
         except:
             return {}
+    
+    def get_prompt_header(self, prompt_key: str) -> str:
+        return self.snapshot.prompt_header(self.language, prompt_key)
 
 
 class DeepAnalyzer:
@@ -66,18 +199,72 @@ class DeepAnalyzer:
     """
     
     def __init__(self, api_key: str, language: str = "es"):
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        get_model_registry().configure(api_key)
         self.language = language
     
-    def analyze_deep(self, transcript: str) -> Dict:
+    @property
+    def model_name(self) -> str:
+        return get_model_name("classify")
+    
+    def analyze_deep(self, transcript: str, use_cache: bool = False) -> Dict:
         """
         ANÁLISIS DEEP V2:
         Ahora detecta el sub-tema específico (Math, Code, AI, etc.)
+        use_cache: registra la transcripción completa en la caché de contexto
+        (la reutilizan después las notas) y solo se envían las instrucciones.
         """
         
-        words = transcript.split()[:1500]
-        sample = " ".join(words)
+        cache, cached, analysis_prompt = self._build_prompt(transcript, use_cache)
+        try:
+            with tracing.span("classify_gemini", model=self.model_name, cached=bool(cached)):
+                if cached:
+                    response = cache.generate(cached, analysis_prompt,
+                                              generation_config=CLASSIFY_GENERATION_CONFIG)
+                else:
+                    model = get_model(self.model_name, CLASSIFY_GENERATION_CONFIG)
+                    response = get_rate_limiter().call(model.generate_content, analysis_prompt,
+                                                       tokens=estimate_tokens(analysis_prompt))
+                tracing.record_usage(response, prompt=analysis_prompt)
+            return self._parse_response(response)
+        except Exception as e:
+            return self._failed_analysis(e)
+    
+    async def analyze_deep_async(self, transcript: str, use_cache: bool = False) -> Dict:
+        """
+        analyze_deep sin ocupar un hilo mientras espera a Gemini: cancelar la
+        tarea corta también la espera en la cola del limitador.
+        """
+        # La caché de contexto solo tiene cliente síncrono
+        cache, cached, analysis_prompt = await asyncio.to_thread(self._build_prompt, transcript, use_cache)
+        try:
+            with tracing.span("classify_gemini", model=self.model_name, cached=bool(cached)):
+                if cached:
+                    response = await asyncio.to_thread(cache.generate, cached, analysis_prompt,
+                                                       generation_config=CLASSIFY_GENERATION_CONFIG)
+                else:
+                    model = get_model(self.model_name, CLASSIFY_GENERATION_CONFIG)
+                    response = await get_rate_limiter().acall(model.generate_content_async, analysis_prompt,
+                                                              tokens=estimate_tokens(analysis_prompt))
+                tracing.record_usage(response, prompt=analysis_prompt)
+            return self._parse_response(response)
+        except Exception as e:
+            return self._failed_analysis(e)
+    
+    def _build_prompt(self, transcript: str, use_cache: bool):
+        """Prompt de clasificación: (caché, handle de la transcripción o None, prompt)"""
+        cache = cached = None
+        if use_cache:
+            from context_cache import get_context_cache
+            cache = get_context_cache()
+            # Solo se crea si las notas la van a reutilizar (mismo modelo)
+            cached = cache.handle_for(self.model_name, transcript,
+                                      create=self.model_name == get_model_name("notes"))
+        
+        if cached:
+            sample = CACHED_CONTENT_NOTE.get(self.language, CACHED_CONTENT_NOTE["es"])
+        else:
+            words = transcript.split()[:1500]
+            sample = " ".join(words)
         
         # Prompt mejorado para detectar sub-temas específicos
         if self.language == "es":
@@ -124,31 +311,29 @@ CONTENT:
 {content}"""
         
         analysis_prompt = analysis_prompt.format(content=sample)
+        return cache, cached, analysis_prompt
+    
+    @staticmethod
+    def _parse_response(response) -> Dict:
+        response_text = response.text.strip()
+        if response_text.startswith("```"):
+            response_text = response_text.split("```")[1]
+            if response_text.startswith("json"):
+                response_text = response_text[4:]
+            response_text = response_text.strip()
         
-        try:
-            response = self.model.generate_content(
-                analysis_prompt,
-                generation_config={"temperature": 0.1} # Bajamos temperatura para ser más precisos
-            )
-            
-            response_text = response.text.strip()
-            if response_text.startswith("```"):
-                response_text = response_text.split("```")[1]
-                if response_text.startswith("json"):
-                    response_text = response_text[4:]
-                response_text = response_text.strip()
-            
-            result = json.loads(response_text)
-            return result
-        
-        except Exception as e:
-            print(f" Error en análisis profundo: {e}")
-            return {
-                "category": "GENERAL", 
-                "sub_topic": "Other",
-                "confidence": 0.0,
-                "has_formal_teaching": False
-            }
+        result = json.loads(response_text)
+        return result
+    
+    @staticmethod
+    def _failed_analysis(error: Exception) -> Dict:
+        print(f" Error en análisis profundo: {error}")
+        return {
+            "category": "GENERAL", 
+            "sub_topic": "Other",
+            "confidence": 0.0,
+            "has_formal_teaching": False
+        }
 
 
 class ContextDetector:
@@ -211,13 +396,37 @@ class ContextDetector:
         # 3. Fallback inteligente
         return 'general_content'
 
-    def detect(self, transcript: str) -> dict:
+    def detect(self, transcript: str, use_cache: bool = False) -> dict:
         if not transcript or len(transcript.strip()) < 50:
             return self._unknown_result()
         
-        # 1. Análisis Profundo
-        analysis = self.analyzer.analyze_deep(transcript)
+        # 1. Clasificador local por palabras clave; si no está seguro, Análisis Profundo
+        with tracing.span("classify", chars=len(transcript)) as span:
+            analysis, detection_method = self._local_analysis(transcript)
+            if not analysis:
+                analysis = self.analyzer.analyze_deep(transcript, use_cache=use_cache)
+            span.set(method=detection_method)
+        return self._build_context(analysis, detection_method)
+    
+    async def detect_async(self, transcript: str, use_cache: bool = False) -> dict:
+        """detect con la llamada a Gemini como corrutina (se cancela con la tarea)"""
+        if not transcript or len(transcript.strip()) < 50:
+            return self._unknown_result()
         
+        with tracing.span("classify", chars=len(transcript)) as span:
+            analysis, detection_method = self._local_analysis(transcript)
+            if not analysis:
+                analysis = await self.analyzer.analyze_deep_async(transcript, use_cache=use_cache)
+            span.set(method=detection_method)
+        return self._build_context(analysis, detection_method)
+    
+    def _local_analysis(self, transcript: str) -> Tuple[Optional[Dict], str]:
+        """(análisis del clasificador local o None, método de detección resultante)"""
+        classifier = self.config_loader.get_keyword_classifier()
+        analysis = classifier.classify(transcript) if classifier else None
+        return analysis, "local_keyword_classifier" if analysis else "deep_analysis_gemini_v8"
+    
+    def _build_context(self, analysis: Dict, detection_method: str) -> dict:
         # 2. Extracción de datos
         category = analysis.get('category', 'GENERAL').lower()
         sub_topic = analysis.get('sub_topic', 'Other')
@@ -248,7 +457,7 @@ class ContextDetector:
             "prompt_key": prompt_key,
             "subject": sub_topic,
             "category": category,
-            "detection_method": "deep_analysis_gemini_v8",
+            "detection_method": detection_method,
             "content_label": content_label,
             "keyword_score": confidence * 100,
             "reasoning": analysis.get('reasoning', ''),
@@ -275,53 +484,265 @@ class ContextDetector:
         }
 
 
+# Hilos para clasificar mientras la transcripción sigue en curso
+_speculative_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculative-detect")
+
+
+class SpeculativeDetector:
+    """
+    Clasificación especulativa: arranca con la primera transcripción parcial
+    mientras el resto del audio se sigue transcribiendo, de modo que el prompt
+    ya está elegido cuando termina la transcripción.
+    """
+    
+    min_confidence = 0.6   # Por debajo se reclasifica con el texto completo
+    
+    def __init__(self, detector: ContextDetector, min_words: int = 200):
+        self.detector = detector
+        self.min_words = min_words
+        self._future: Optional[Future] = None
+    
+    def feed(self, partial_transcript: str):
+        """Se usa como callback on_partial de download_and_transcribe"""
+        if self._future is None and len(partial_transcript.split()) >= self.min_words:
+            self._future = _speculative_pool.submit(tracing.bind(self.detector.detect), partial_transcript)
+    
+    def result(self, transcript: str) -> dict:
+        """Contexto final: el especulativo si es fiable, si no se analiza el texto completo"""
+        if self._future is not None:
+            try:
+                context = self._future.result()
+                if context.get('confidence', 0) >= self.min_confidence:
+                    return context
+            except Exception as e:
+                print(f" Error en clasificación especulativa: {e}")
+        
+        # Texto completo: se registra en la caché de contexto para las notas
+        return self.detector.detect(transcript, use_cache=True)
+
+
+class AsyncSpeculativeDetector(SpeculativeDetector):
+    """
+    SpeculativeDetector del pipeline async: la clasificación especulativa es una
+    tarea del event loop en lugar de un hilo, así que cancel() la detiene de verdad.
+    feed se llama desde el event loop (on_partial de download_and_transcribe_async).
+    """
+    
+    def feed(self, partial_transcript: str):
+        if self._future is None and len(partial_transcript.split()) >= self.min_words:
+            self._future = asyncio.ensure_future(self.detector.detect_async(partial_transcript))
+    
+    async def result_async(self, transcript: str) -> dict:
+        if self._future is not None:
+            try:
+                context = await self._future
+                if context.get('confidence', 0) >= self.min_confidence:
+                    return context
+            except Exception as e:
+                print(f" Error en clasificación especulativa: {e}")
+        
+        return await self.detector.detect_async(transcript, use_cache=True)
+    
+    def cancel(self):
+        """Detiene la clasificación especulativa si sigue en curso"""
+        if self._future is not None:
+            self._future.cancel()
+
+
+# Aproximación de tokens: ~4 caracteres por token en español/inglés
+CHARS_PER_TOKEN = 4
+
+SPEAKER_LABEL_RE = re.compile(r'^\s*(\[HABLANTE\s+[^\]]+\])')
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?…])\s+')
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
 class PromptBuilder:
-    """Constructor de prompts - Sin cambios"""
+    """Constructor de prompts"""
+    
+    # Textos de las fases map/reduce
+    MAP_REDUCE_TEXTS = {
+        "es": {
+            "section": "Esta es la parte {index} de {total} de un contenido largo. Genera notas solo de esta parte; "
+                       "no escribas introducción ni conclusión general.",
+            "reduce": "A continuación tienes notas parciales de partes consecutivas del mismo contenido. "
+                      "Fusiónalas en un único documento coherente: elimina repeticiones, unifica la estructura "
+                      "y conserva todos los conceptos, fórmulas y ejemplos.",
+            "sections_header": "NOTAS PARCIALES:",
+            "part": "PARTE"
+        },
+        "en": {
+            "section": "This is part {index} of {total} of a long piece of content. Generate notes for this part only; "
+                       "do not write an overall introduction or conclusion.",
+            "reduce": "Below are partial notes for consecutive parts of the same content. "
+                      "Merge them into a single coherent document: remove repetition, unify the structure "
+                      "and keep every concept, formula and example.",
+            "sections_header": "PARTIAL NOTES:",
+            "part": "PART"
+        }
+    }
     
     def __init__(self, config_loader: ConfigLoader):
         self.config_loader = config_loader
     
+    # Presupuesto de generación (leído de la configuración vigente: admite recarga en caliente)
+    @property
+    def max_prompt_tokens(self) -> int:
+        return self.config_loader.config.get('generation', {}).get('max_prompt_tokens', 30000)
+    
+    @property
+    def chunk_tokens(self) -> int:
+        return self.config_loader.config.get('generation', {}).get('chunk_tokens', 12000)
+    
+    @property
+    def max_workers(self) -> int:
+        return self.config_loader.config.get('generation', {}).get('max_workers', 4)
+    
+    def _template_parts(self, prompt_key: str):
+        return self.config_loader.snapshot.template_parts(self.config_loader.language, prompt_key)
+    
     def build_prompt(self, transcript: str, prompt_key: str, 
                      subject: str = "General", category: str = "general") -> str:
-        """Construye prompt final"""
-        
-        prompt_template = self.config_loader.get_prompt_template(prompt_key)
+        """Construye prompt final (el encabezado ya viene pre-renderizado)"""
+        with tracing.span("build_prompt", prompt_key=prompt_key) as span:
+            prompt = self.config_loader.get_prompt_header(prompt_key) + transcript + PROMPT_FOOTER
+            span.set(chars=len(prompt))
+        return prompt
+    
+    def build_cached_prompt(self, prompt_key: str) -> str:
+        """Como build_prompt, pero la transcripción ya está en la caché de contexto"""
+        note = CACHED_CONTENT_NOTE.get(self.config_loader.language, CACHED_CONTENT_NOTE["es"])
+        return self.config_loader.get_prompt_header(prompt_key) + note + PROMPT_FOOTER
+    
+    def needs_map_reduce(self, transcript: str) -> bool:
+        """True si el prompt completo excedería el presupuesto de tokens"""
+        return estimate_tokens(transcript) > self.max_prompt_tokens
+    
+    def split_transcript(self, transcript: str, chunk_tokens: Optional[int] = None) -> List[str]:
+        """
+        Divide la transcripción en bloques de hasta chunk_tokens, cortando
+        en cambios de hablante o, si una intervención es muy larga, en frases.
+        """
+        limit = (chunk_tokens or self.chunk_tokens) * CHARS_PER_TOKEN
         
-        if not prompt_template:
-            prompt_template = self.config_loader.get_prompt_template('general_content')
+        # 1. Unidades: intervenciones (líneas) y, si hace falta, frases o palabras
+        units = []
+        for line in transcript.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if len(line) <= limit:
+                units.append(line)
+                continue
+            
+            match = SPEAKER_LABEL_RE.match(line)
+            label = match.group(1) if match else ""
+            pieces = []
+            for sentence in SENTENCE_SPLIT_RE.split(line):
+                while len(sentence) > limit:
+                    cut = sentence.rfind(" ", 0, limit)
+                    cut = cut if cut > 0 else limit
+                    pieces.append(sentence[:cut])
+                    sentence = sentence[cut:].strip()
+                if sentence:
+                    pieces.append(sentence)
+            
+            # Agrupamos frases y repetimos la etiqueta en cada continuación
+            current = ""
+            for piece in pieces:
+                if current and len(current) + len(piece) + 1 > limit:
+                    units.append(current)
+                    current = f"{label} {piece}" if label else piece
+                else:
+                    current = f"{current} {piece}" if current else piece
+            if current:
+                units.append(current)
         
-        system_role = prompt_template.get('system_role', '')
-        intro = prompt_template.get('intro', '')
-        instructions = prompt_template.get('instructions', [])
+        # 2. Empaquetado voraz respetando el límite
+        chunks = []
+        current = []
+        size = 0
+        for unit in units:
+            if current and size + len(unit) + 1 > limit:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            current.append(unit)
+            size += len(unit) + 1
+        if current:
+            chunks.append("\n".join(current))
         
-        instructions_text = "\n".join(f"• {inst}" for inst in instructions)
+        return chunks
+    
+    def build_section_prompt(self, chunk: str, prompt_key: str, index: int, total: int) -> str:
+        """Prompt de la fase map: notas de una sola parte"""
+        texts = self.MAP_REDUCE_TEXTS.get(self.config_loader.language, self.MAP_REDUCE_TEXTS["es"])
+        system_role, intro, instructions_text = self._template_parts(prompt_key)
         
-        prompt = f"""{system_role}
+        return f"""{system_role}
 
 {intro}
 
+{texts['section'].format(index=index, total=total)}
+
 INSTRUCCIONES:
 {instructions_text}
 
 CONTENIDO A PROCESAR:
-{transcript}
+{chunk}
 
 Por favor, genera las notas siguiendo las instrucciones indicadas."""
+    
+    def build_reduce_prompt(self, sections: List[str], prompt_key: str) -> str:
+        """Prompt de la fase reduce: fusiona notas parciales en un documento"""
+        texts = self.MAP_REDUCE_TEXTS.get(self.config_loader.language, self.MAP_REDUCE_TEXTS["es"])
+        system_role, intro, instructions_text = self._template_parts(prompt_key)
         
-        return prompt
+        joined = "\n\n".join(
+            f"--- {texts['part']} {i + 1} ---\n{section}" for i, section in enumerate(sections)
+        )
+        
+        return f"""{system_role}
+
+{texts['reduce']}
+
+INSTRUCCIONES:
+{instructions_text}
+
+{texts['sections_header']}
+{joined}
+
+Por favor, genera las notas siguiendo las instrucciones indicadas."""
 
 
 
 # FUNCIONES DE INICIALIZACIÓN
 
+_shared_lock = threading.Lock()
+_loaders: Dict[str, ConfigLoader] = {}
+_detectors: Dict[tuple, "ContextDetector"] = {}
+_builders: Dict[str, PromptBuilder] = {}
+
+
 def init_config(language: str = "es") -> ConfigLoader:
-    """Inicializa el loader de configuración"""
-    return ConfigLoader("config.json", language)
+    """
+    Loader compartido por idioma: todas las sesiones reciben el mismo.
+    Para cambiar de idioma se pide el loader del otro idioma; ninguno se modifica.
+    """
+    with _shared_lock:
+        loader = _loaders.get(language)
+        if loader is None:
+            loader = ConfigLoader("config.json", language)
+            # Un idioma no soportado recibe el del idioma por defecto, sin otra entrada
+            loader = _loaders.setdefault(loader.language, loader)
+        return loader
 
 
 def get_context_detector(config_loader: ConfigLoader, api_key: str = None) -> ContextDetector:
     """
-    Obtiene el detector de contexto v7
+    Obtiene el detector de contexto v7 (uno por idioma y API key en todo el proceso)
     API key se obtiene automáticamente de variables de entorno
     """
     if not api_key:
@@ -345,9 +766,20 @@ def get_context_detector(config_loader: ConfigLoader, api_key: str = None) -> Co
             "2. O en Streamlit secrets (.streamlit/secrets.toml)"
         )
     
-    return ContextDetector(config_loader, api_key)
+    key = (id(config_loader), config_loader.language, api_key)
+    with _shared_lock:
+        detector = _detectors.get(key)
+        if detector is None:
+            detector = ContextDetector(config_loader, api_key)
+            _detectors[key] = detector
+        return detector
 
 
 def get_prompt_builder(config_loader: ConfigLoader) -> PromptBuilder:
-    """Obtiene el constructor de prompts"""
-    return PromptBuilder(config_loader)
\ No newline at end of file
+    """Obtiene el constructor de prompts (uno por idioma en todo el proceso)"""
+    with _shared_lock:
+        builder = _builders.get(config_loader.language)
+        if builder is None or builder.config_loader is not config_loader:
+            builder = PromptBuilder(config_loader)
+            _builders[config_loader.language] = builder
+        return builder
@@ -0,0 +1,181 @@
+import datetime
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from config_loader import estimate_tokens
+from model_registry import get_model_registry
+from rate_limiter import get_rate_limiter
+
+# --- CONFIGURACIÓN DE LA CACHÉ DE CONTEXTO ---
+# La transcripción se registra una vez en Gemini y las llamadas siguientes
+# (clasificación, notas, regenerar en otro idioma) solo envían las instrucciones.
+CONTEXT_CACHE_ENABLED = os.getenv("CONTENTNOTES_CONTEXT_CACHE", "1") == "1"
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTENTNOTES_CONTEXT_CACHE_TTL", "3600"))
+CONTEXT_CACHE_MIN_TOKENS = 4096   # Por debajo el almacenamiento cuesta más de lo que ahorra
+EXPIRY_MARGIN_SECONDS = 120       # No usamos una entrada que caduca antes de terminar la llamada
+
+CACHE_SYSTEM_INSTRUCTION = (
+    "The attached content is a transcript. Every following request refers to it; "
+    "follow each request's own instructions and output language."
+)
+
+
+class GeminiCacheClient:
+    """Cliente real: CachedContent de google.generativeai"""
+
+    def create(self, model: str, contents: str, system_instruction: str, ttl_seconds: int,
+               display_name: str):
+        get_model_registry().sdk()   # Aplica la clave registrada antes de usar el SDK
+        from google.generativeai import caching
+
+        cached = get_rate_limiter().call(
+            caching.CachedContent.create,
+            tokens=estimate_tokens(contents),
+            model=model if model.startswith("models/") else f"models/{model}",
+            display_name=display_name,
+            system_instruction=system_instruction,
+            contents=[contents],
+            ttl=datetime.timedelta(seconds=ttl_seconds)
+        )
+        return cached, cached.expire_time.timestamp()
+
+    def generate(self, handle, prompt: str, stream: bool = False, generation_config: Optional[Dict] = None):
+        model = get_model_registry().for_cached_content(handle)
+        return get_rate_limiter().call(model.generate_content, prompt, tokens=estimate_tokens(prompt),
+                                       stream=stream, generation_config=generation_config)
+
+    def delete(self, handle):
+        get_model_registry().forget_cached_content(handle.name)
+        handle.delete()
+
+
+class _Entry:
+    def __init__(self, handle, expires_at: float, tokens: int):
+        self.handle = handle
+        self.expires_at = expires_at
+        self.tokens = tokens
+        self.uses = 0
+
+
+class ContextCache:
+    """
+    Registro local de las cachés de contexto creadas en Gemini, por (modelo, transcripción).
+    Lleva la cuenta de su caducidad para no referenciar una ya expirada y
+    de cuántos tokens de entrada se dejaron de reenviar.
+    """
+
+    def __init__(self, client=None, ttl_seconds: int = CONTEXT_CACHE_TTL_SECONDS,
+                 min_tokens: int = CONTEXT_CACHE_MIN_TOKENS, enabled: bool = CONTEXT_CACHE_ENABLED):
+        self.client = client or GeminiCacheClient()
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.enabled = enabled
+        self.tokens_saved = 0
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+    @staticmethod
+    def _key(model: str, transcript: str) -> str:
+        digest = hashlib.sha256(transcript.encode('utf-8')).hexdigest()
+        return f"{model}:{digest}"
+
+    def _live_entry(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry and entry.expires_at - EXPIRY_MARGIN_SECONDS > time.time():
+            return entry
+        self._entries.pop(key, None)
+        return None
+
+    def handle_for(self, model: str, transcript: str, create: bool = True):
+        """
+        Handle de la caché con esta transcripción (creándola si hace falta y create=True).
+        None si está desactivada, el texto es demasiado corto o Gemini la rechaza.
+        """
+        if not self.enabled or not transcript:
+            return None
+        tokens = estimate_tokens(transcript)
+        if tokens < self.min_tokens:
+            return None
+
+        key = self._key(model, transcript)
+        with self._lock:
+            entry = self._live_entry(key)
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        if entry is None and not create:
+            return None
+
+        with key_lock:
+            with self._lock:
+                entry = self._live_entry(key)
+            if entry is None:
+                try:
+                    handle, expires_at = self.client.create(
+                        model, transcript, CACHE_SYSTEM_INSTRUCTION, self.ttl_seconds,
+                        display_name=f"contentnotes-{key[-16:]}"
+                    )
+                except Exception as e:
+                    print(f"Caché de contexto no disponible, se envía el texto completo: {e}")
+                    return None
+                entry = _Entry(handle, expires_at, tokens)
+                with self._lock:
+                    self._entries[key] = entry
+                return entry.handle
+
+        with self._lock:
+            entry.uses += 1
+            self.tokens_saved += entry.tokens
+        return entry.handle
+
+    def generate(self, handle, prompt: str, stream: bool = False, generation_config: Optional[Dict] = None):
+        return self.client.generate(handle, prompt, stream=stream, generation_config=generation_config)
+
+    def purge_expired(self) -> int:
+        """Olvida las entradas caducadas (Gemini ya las borró por TTL)"""
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if entry.expires_at <= time.time()]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+    def release(self, model: str, transcript: str):
+        """Borra la caché antes de que caduque (deja de cobrarse el almacenamiento)"""
+        key = self._key(model, transcript)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry:
+            try:
+                self.client.delete(entry.handle)
+            except Exception:
+                pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "reuses": sum(entry.uses for entry in self._entries.values()),
+                "tokens_saved": self.tokens_saved
+            }
+
+
+_cache: Optional[ContextCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_context_cache() -> ContextCache:
+    """Obtiene la caché de contexto compartida del proceso"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ContextCache()
+        return _cache
+
+
+def set_context_cache(cache: ContextCache):
+    """Sustituye la caché compartida (p.ej. por una con el cliente de pruebas)"""
+    global _cache
+    with _cache_lock:
+        _cache = cache
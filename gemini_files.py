@@ -0,0 +1,95 @@
+import asyncio
+import random
+import time
+
+import tracing
+from model_registry import get_genai
+from rate_limiter import get_rate_limiter
+
+# --- CONFIGURACIÓN DE ESPERA ---
+READY_DEADLINE_SECONDS = 120   # Tiempo máximo esperando a que Gemini procese el archivo
+INITIAL_DELAY_SECONDS = 0.25   # Primera espera (archivos pequeños suelen estar listos enseguida)
+MAX_DELAY_SECONDS = 8.0        # Tope del backoff exponencial
+
+
+class FileProcessingError(RuntimeError):
+    """Gemini marcó el archivo como FAILED"""
+
+
+class FileReadyTimeout(TimeoutError):
+    """El archivo no llegó a ACTIVE antes del plazo"""
+
+
+def _state_of(file) -> str:
+    state = getattr(file, "state", None)
+    return getattr(state, "name", str(state or ""))
+
+
+def _next_delay(attempt: int, initial: float, maximum: float) -> float:
+    # Backoff exponencial con jitter ("equal jitter"): nunca cero, nunca sincronizado
+    delay = min(maximum, initial * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _check(file, name: str):
+    """Devuelve True si el archivo está listo; lanza si falló"""
+    state = _state_of(file)
+    if state == "ACTIVE":
+        return True
+    if state == "FAILED":
+        raise FileProcessingError(f"Gemini no pudo procesar el archivo {name}")
+    return False
+
+
+def wait_until_active(file, deadline: float = READY_DEADLINE_SECONDS,
+                      initial_delay: float = INITIAL_DELAY_SECONDS,
+                      max_delay: float = MAX_DELAY_SECONDS):
+    """Espera a que un archivo subido esté ACTIVE (versión bloqueante)"""
+    name = file.name
+    limit = time.monotonic() + deadline
+    attempt = 0
+
+    while not _check(file, name):
+        remaining = limit - time.monotonic()
+        if remaining <= 0:
+            raise FileReadyTimeout(f"El archivo {name} no estuvo listo en {deadline:g}s")
+        time.sleep(min(_next_delay(attempt, initial_delay, max_delay), remaining))
+        attempt += 1
+        tracing.add(polls=1)
+        file = get_genai().get_file(name)
+
+    return file
+
+
+async def wait_until_active_async(file, deadline: float = READY_DEADLINE_SECONDS,
+                                  initial_delay: float = INITIAL_DELAY_SECONDS,
+                                  max_delay: float = MAX_DELAY_SECONDS):
+    """
+    Igual que wait_until_active pero sin bloquear el event loop:
+    varias subidas se pueden esperar a la vez con asyncio.gather.
+    """
+    name = file.name
+    limit = time.monotonic() + deadline
+    attempt = 0
+
+    while not _check(file, name):
+        remaining = limit - time.monotonic()
+        if remaining <= 0:
+            raise FileReadyTimeout(f"El archivo {name} no estuvo listo en {deadline:g}s")
+        await asyncio.sleep(min(_next_delay(attempt, initial_delay, max_delay), remaining))
+        attempt += 1
+        tracing.add(polls=1)
+        file = await asyncio.to_thread(get_genai().get_file, name)
+
+    return file
+
+
+def upload_and_wait(path: str, deadline: float = READY_DEADLINE_SECONDS):
+    """Sube un archivo y espera a que esté listo"""
+    return wait_until_active(get_rate_limiter().call(get_genai().upload_file, path), deadline=deadline)
+
+
+async def upload_and_wait_async(path: str, deadline: float = READY_DEADLINE_SECONDS):
+    """Versión async de upload_and_wait (la espera de turno no ocupa un hilo)"""
+    uploaded = await get_rate_limiter().acall(asyncio.to_thread, get_genai().upload_file, path)
+    return await wait_until_active_async(uploaded, deadline=deadline)
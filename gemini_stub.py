@@ -0,0 +1,247 @@
+"""
+Dobles de prueba de Gemini: permiten ejercitar el pipeline sin red ni API key.
+
+    from context_cache import ContextCache, set_context_cache
+    from gemini_stub import StubCacheClient
+
+    stub = StubCacheClient()
+    set_context_cache(ContextCache(client=stub, min_tokens=0))
+
+Para sustituir el SDK completo, install_fake_genai() debe llamarse antes de
+importar cualquier módulo que haga "import google.generativeai".
+"""
+import asyncio
+import itertools
+import random
+import sys
+import threading
+import time
+import types
+from typing import Dict, List, Optional
+
+
+def estimate_tokens(text: str) -> int:
+    # Igual que config_loader.estimate_tokens (sin importarlo: este módulo se carga antes que el SDK)
+    return len(text) // 4 + 1
+
+
+class StubResponse:
+    """Imita la respuesta de generate_content (texto completo o por fragmentos)"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def __iter__(self):
+        # stream=True: el texto llega en varios fragmentos
+        words = self.text.split(" ")
+        for i in range(0, len(words), 8):
+            piece = " ".join(words[i:i + 8])
+            yield StubResponse(piece if i + 8 >= len(words) else piece + " ")
+
+
+class StubHandle:
+    def __init__(self, name: str, model: str, contents: str, system_instruction: str, expires_at: float):
+        self.name = name
+        self.model = model
+        self.contents = contents
+        self.system_instruction = system_instruction
+        self.expires_at = expires_at
+        self.deleted = False
+
+
+class StubCacheClient:
+    """
+    Cliente de caché de contexto en memoria, con la misma interfaz que GeminiCacheClient.
+    Registra cada llamada y los tokens de entrada que se habrían enviado.
+    reply(prompt, handle) decide el texto devuelto (por defecto, un eco corto).
+    """
+
+    def __init__(self, reply=None, fail_create: bool = False):
+        self.reply = reply or (lambda prompt, handle: f"Respuesta de prueba ({len(prompt)} caracteres)")
+        self.fail_create = fail_create
+        self.handles: Dict[str, StubHandle] = {}
+        self.calls: List[Dict] = []
+        self._ids = itertools.count(1)
+
+    def create(self, model: str, contents: str, system_instruction: str, ttl_seconds: int,
+               display_name: str):
+        if self.fail_create:
+            raise RuntimeError("creación de caché rechazada (stub)")
+        name = f"cachedContents/stub-{next(self._ids)}"
+        handle = StubHandle(name, model, contents, system_instruction, time.time() + ttl_seconds)
+        self.handles[name] = handle
+        self.calls.append({"op": "create", "name": name, "input_tokens": estimate_tokens(contents)})
+        return handle, handle.expires_at
+
+    def generate(self, handle: StubHandle, prompt: str, stream: bool = False,
+                 generation_config: Optional[Dict] = None):
+        if handle.deleted or handle.expires_at <= time.time():
+            raise RuntimeError(f"{handle.name} ya no existe")
+        self.calls.append({"op": "generate", "name": handle.name, "input_tokens": estimate_tokens(prompt),
+                           "cached_tokens": estimate_tokens(handle.contents), "stream": stream})
+        response = StubResponse(self.reply(prompt, handle))
+        return iter(response) if stream else response
+
+    def delete(self, handle: StubHandle):
+        handle.deleted = True
+        self.calls.append({"op": "delete", "name": handle.name})
+
+    def input_tokens(self) -> int:
+        """Tokens de entrada enviados (sin contar los servidos desde la caché)"""
+        return sum(call.get("input_tokens", 0) for call in self.calls)
+
+
+# SDK FALSO (google.generativeai)
+
+WORDS = (
+    "el profesor explica la derivada de una función como el límite del cociente incremental "
+    "y luego resuelve varios ejemplos con polinomios y funciones trigonométricas en clase"
+).split()
+
+
+class FakeFile:
+    def __init__(self, name: str, path: str, ready_at: float):
+        self.name = name
+        self.path = path
+        self.ready_at = ready_at
+
+    @property
+    def state(self):
+        ready = time.monotonic() >= self.ready_at
+        return types.SimpleNamespace(name="ACTIVE" if ready else "PROCESSING")
+
+
+class FakeGenAI:
+    """
+    Imita las funciones de google.generativeai que usa la app, con latencias
+    y tamaños de respuesta configurables. Cuenta llamadas y bytes subidos.
+    """
+
+    def __init__(self, upload_latency: float = 0.2, processing_seconds: float = 0.5,
+                 generate_latency: float = 0.5, stream_chunk_latency: float = 0.02,
+                 transcript_words: int = 3000, notes_words: int = 800, jitter: float = 0.1):
+        self.upload_latency = upload_latency
+        self.processing_seconds = processing_seconds
+        self.generate_latency = generate_latency
+        self.stream_chunk_latency = stream_chunk_latency
+        self.transcript_words = transcript_words
+        self.notes_words = notes_words
+        self.jitter = jitter
+        self.files: Dict[str, FakeFile] = {}
+        self.counters = {"upload": 0, "get_file": 0, "delete": 0, "generate": 0, "bytes_uploaded": 0}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _sleep(self, seconds: float):
+        if seconds > 0:
+            time.sleep(seconds * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    @staticmethod
+    def _text(words: int) -> str:
+        return " ".join(WORDS[i % len(WORDS)] for i in range(words))
+
+    # API del módulo
+    def configure(self, **kwargs):
+        pass
+
+    def upload_file(self, path, **kwargs):
+        import os
+        self._count("upload")
+        self._count("bytes_uploaded", os.path.getsize(path))
+        self._sleep(self.upload_latency)
+        name = f"files/fake-{next(self._ids)}"
+        fake = FakeFile(name, str(path), time.monotonic() + self.processing_seconds)
+        with self._lock:
+            self.files[name] = fake
+        return fake
+
+    def get_file(self, name: str):
+        self._count("get_file")
+        with self._lock:
+            fake = self.files.get(name)
+        if fake is None:
+            raise KeyError(f"{name} no existe")
+        return fake
+
+    def delete_file(self, name: str):
+        self._count("delete")
+        with self._lock:
+            self.files.pop(name, None)
+
+    def reply(self, contents) -> str:
+        """Transcripción si se adjunta un archivo, JSON si es la clasificación, notas en otro caso"""
+        parts = contents if isinstance(contents, (list, tuple)) else [contents]
+        prompt = " ".join(part for part in parts if isinstance(part, str))
+        if any(isinstance(part, FakeFile) for part in parts):
+            return self._text(self.transcript_words)
+        if '"category"' in prompt:
+            return ('{"category": "ACADEMIC", "sub_topic": "Math", "confidence": 0.9, '
+                    '"purpose": "Clase", "has_formal_teaching": true, "reasoning": "stub"}')
+        return "# Notas\n\n" + self._text(self.notes_words)
+
+    def module(self) -> types.ModuleType:
+        """Módulo listo para sys.modules["google.generativeai"]"""
+        fake = self
+        module = types.ModuleType("google.generativeai")
+
+        class GenerativeModel:
+            def __init__(self, model_name: str = "fake", **kwargs):
+                self.model_name = model_name
+
+            @classmethod
+            def from_cached_content(cls, cached_content, **kwargs):
+                return cls(getattr(cached_content, "model", "fake"))
+
+            def generate_content(self, contents, stream: bool = False, **kwargs):
+                fake._count("generate")
+                fake._sleep(fake.generate_latency)
+                response = StubResponse(fake.reply(contents))
+                if not stream:
+                    return response
+
+                def chunks():
+                    for chunk in response:
+                        fake._sleep(fake.stream_chunk_latency)
+                        yield chunk
+                return chunks()
+
+            async def generate_content_async(self, contents, stream: bool = False, **kwargs):
+                fake._count("generate")
+                await asyncio.sleep(fake.generate_latency)
+                response = StubResponse(fake.reply(contents))
+                if not stream:
+                    return response
+
+                async def chunks():
+                    for chunk in response:
+                        await asyncio.sleep(fake.stream_chunk_latency)
+                        yield chunk
+                return chunks()
+
+        module.configure = self.configure
+        module.upload_file = self.upload_file
+        module.get_file = self.get_file
+        module.delete_file = self.delete_file
+        module.GenerativeModel = GenerativeModel
+        module.fake = self
+        return module
+
+
+def install_fake_genai(**settings) -> FakeGenAI:
+    """Registra el SDK falso como google.generativeai (antes de importar la app)"""
+    fake = FakeGenAI(**settings)
+    module = fake.module()
+    try:
+        import google
+    except ImportError:
+        # Sin ningún paquete google instalado: creamos el espacio de nombres
+        google = types.ModuleType("google")
+        google.__path__ = []
+        sys.modules["google"] = google
+    google.generativeai = module
+    sys.modules["google.generativeai"] = module
+    return fake
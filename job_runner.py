@@ -0,0 +1,185 @@
+"""
+Event loop en segundo plano que ejecuta los trabajos de todas las sesiones
+(async_pipeline.process_source_async). El script de Streamlit solo los lanza
+y consulta su estado, así que un clic no bloquea la interfaz mientras dura
+el trabajo, y un trabajo se puede cancelar:
+
+    runner = get_job_runner()
+    job_id = runner.submit(url, context_detector, prompt_builder, is_youtube=True)
+    state = runner.heartbeat(job_id)   # en cada refresco de la interfaz
+    runner.cancel(job_id)              # botón "Nuevo"
+
+Una sesión que deja de enviar latidos (pestaña cerrada) pierde su trabajo
+tras ABANDON_SECONDS: se cancela y deja de gastar ffmpeg y cuota de Gemini.
+"""
+import asyncio
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import tracing
+from async_pipeline import process_source_async
+
+# --- CONFIGURACIÓN DEL EJECUTOR ---
+MAX_RUNNING_JOBS = int(os.getenv("CONTENTNOTES_MAX_JOBS", "8"))   # Trabajos a la vez (el resto espera)
+ABANDON_SECONDS = float(os.getenv("CONTENTNOTES_ABANDON_SECONDS", "30"))  # Sin latidos -> se cancela (0 = nunca)
+RESULT_TTL_SECONDS = 600      # Resultados no recogidos que se conservan
+WATCHDOG_INTERVAL_SECONDS = 5
+MAX_EVENTS = 50               # Mensajes de progreso que se guardan por trabajo
+
+FINISHED_STATUSES = ("done", "error", "cancelled")
+
+
+class RunningJob:
+    """Estado de un trabajo tal como lo ve la interfaz"""
+
+    def __init__(self, job_id: str, source: str, cleanup: Iterable[str] = ()):
+        self.id = job_id
+        self.source = source
+        self.status = "queued"     # queued | running | done | error | cancelled
+        self.events: List[Tuple[str, str]] = []
+        self.notes = ""            # Notas parciales mientras se generan
+        self.result: Optional[Dict] = None
+        self.trace = None
+        self.cleanup = list(cleanup)
+        self.last_seen = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self._future = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def progress(self, stage: str, message: str):
+        """ProgressCallback del pipeline"""
+        self.events.append((stage, message))
+        del self.events[:-MAX_EVENTS]
+
+    def write_notes(self, text: str):
+        self.notes = text
+
+    def snapshot(self) -> Dict:
+        return {
+            "id": self.id,
+            "source": self.source,
+            "status": self.status,
+            "finished": self.finished,
+            "events": list(self.events),
+            "notes": self.notes,
+            "result": self.result,
+            "trace": self.trace,
+        }
+
+
+class JobRunner:
+    """
+    Un hilo con un event loop propio: todos los trabajos del proceso comparten
+    el loop, así que muchos trabajos a la vez no necesitan muchos hilos.
+    """
+
+    def __init__(self, max_running: int = MAX_RUNNING_JOBS, abandon_seconds: float = ABANDON_SECONDS):
+        self.abandon_seconds = abandon_seconds
+        self.jobs: Dict[str, RunningJob] = {}
+        self._lock = threading.Lock()
+        self._slots = asyncio.Semaphore(max_running)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True, name="job-runner")
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._watchdog(), self._loop)
+
+    def submit(self, source: str, context_detector, prompt_builder, cleanup: Iterable[str] = (),
+               **options) -> str:
+        """
+        Lanza process_source_async(source, ...) con las opciones dadas
+        (is_youtube, job_store, compact...). cleanup: archivos a borrar al terminar.
+        """
+        job = RunningJob(uuid.uuid4().hex, source, cleanup)
+        with self._lock:
+            self.jobs[job.id] = job
+        job._future = asyncio.run_coroutine_threadsafe(
+            self._run(job, context_detector, prompt_builder, options), self._loop
+        )
+        return job.id
+
+    async def _run(self, job: RunningJob, context_detector, prompt_builder, options: Dict):
+        try:
+            async with self._slots:
+                job.status = "running"
+                try:
+                    job.result = await process_source_async(
+                        job.source, context_detector, prompt_builder,
+                        progress=job.progress, on_notes_chunk=job.write_notes, **options
+                    )
+                finally:
+                    # La traza la abrió process_source_async en esta misma tarea
+                    job.trace = tracing.current_trace()
+            job.status = "done" if job.result and job.result["analysis"] else "error"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+        except Exception as e:
+            job.progress("error", f"❌ Error General: {str(e)}")
+            job.status = "error"
+        finally:
+            job.finished_at = time.monotonic()
+            for path in job.cleanup:
+                if os.path.exists(path):
+                    os.unlink(path)
+
+    def get(self, job_id: str) -> Optional[RunningJob]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def heartbeat(self, job_id: str) -> Optional[Dict]:
+        """La sesión sigue mirando este trabajo; devuelve su estado (None si no existe)"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.last_seen = time.monotonic()
+        return job.snapshot()
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancela el trabajo (esté en cola o en cualquier etapa); True si seguía en marcha"""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job._future.cancel()
+        return True
+
+    def forget(self, job_id: str):
+        """La sesión ya recogió el resultado"""
+        with self._lock:
+            self.jobs.pop(job_id, None)
+
+    async def _watchdog(self):
+        while True:
+            await asyncio.sleep(WATCHDOG_INTERVAL_SECONDS)
+            now = time.monotonic()
+            with self._lock:
+                jobs = list(self.jobs.values())
+            for job in jobs:
+                if job.finished:
+                    if now - job.finished_at > RESULT_TTL_SECONDS:
+                        self.forget(job.id)
+                elif self.abandon_seconds and now - job.last_seen > self.abandon_seconds:
+                    print(f"Trabajo {job.id[:8]} sin sesión que lo espere: se cancela")
+                    job._future.cancel()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {status: statuses.count(status) for status in ("queued", "running", *FINISHED_STATUSES)}
+
+
+_runner: Optional[JobRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> JobRunner:
+    """Ejecutor compartido del proceso (un solo event loop para todas las sesiones)"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner()
+        return _runner
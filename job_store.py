@@ -0,0 +1,225 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# --- CONFIGURACIÓN DEL ALMACÉN DE TRABAJOS ---
+JOB_DB_PATH = os.getenv("CONTENTNOTES_JOBS_DB", "/tmp/contentnotes/jobs.sqlite3")
+# Un trabajo 'running' sin actividad durante este tiempo se da por abandonado
+# (proceso caído) y se puede reanudar; si no, pertenece a otro proceso vivo
+JOB_STALE_SECONDS = float(os.getenv("CONTENTNOTES_JOB_STALE_SECONDS", "1800"))
+
+# Etapas del procesamiento, en orden
+STAGES = ["download", "compress", "compact", "upload", "transcribe", "classify", "generate", "render"]
+
+
+def _merge(base: Dict, update: Dict) -> Dict:
+    """Fusión recursiva de diccionarios (los parciales se acumulan)"""
+    merged = dict(base)
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class Job:
+    """
+    Handle de un trabajo: consulta qué etapas ya se completaron y registra
+    los artefactos de cada una para poder reanudar tras un fallo o reinicio.
+    """
+
+    def __init__(self, store: "JobStore", job_id: str, source: str, source_key: str, variant: str = ""):
+        self.store = store
+        self.id = job_id
+        self.source = source
+        self.source_key = source_key
+        self.variant = variant
+
+    def get(self, stage: str) -> Optional[Dict]:
+        """Artefactos de la etapa si está completada, si no None"""
+        return self.store._artifact(self.id, stage, completed_only=True)
+
+    def partial(self, stage: str) -> Dict:
+        """Progreso parcial guardado de una etapa (aunque no esté completada)"""
+        return self.store._artifact(self.id, stage, completed_only=False) or {}
+
+    def save_partial(self, stage: str, data: Dict):
+        """Fusiona datos parciales de una etapa en curso (p.ej. fragmentos ya transcritos)"""
+        self.store._save(self.id, stage, data, completed=False, merge=True)
+
+    def done(self, stage: str, data: Optional[Dict] = None):
+        self.store._save(self.id, stage, data or {}, completed=True, merge=False)
+
+    def fail(self, stage: str, error: str):
+        self.store._set_status(self.id, "failed", error=f"{stage}: {error}")
+
+    def finish(self):
+        self.store._set_status(self.id, "done")
+
+    @property
+    def completed_stages(self) -> List[str]:
+        return self.store._completed(self.id)
+
+
+class JobStore:
+    """Estado persistente de los trabajos en SQLite (compartido entre procesos)"""
+
+    def __init__(self, db_path: str = JOB_DB_PATH):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    source_key TEXT NOT NULL,
+                    variant TEXT NOT NULL DEFAULT '',
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    job_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    completed INTEGER NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (job_id, stage)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_key ON jobs(source_key, variant, status)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def open_job(self, source: str, source_key: str, variant: str = "") -> Job:
+        """
+        Reanuda el último trabajo fallido o abandonado de esta fuente o crea uno nuevo.
+        variant distingue trabajos de la misma fuente con salida distinta (p.ej. idioma).
+        Un trabajo 'running' que sigue activo es de otro proceso: no se toca.
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            # Bloqueo de escritura antes de leer: dos procesos no reclaman la misma fila
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE source_key = ? AND variant = ? "
+                "AND (status = 'failed' OR (status = 'running' AND updated_at < ?)) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (source_key, variant, now - JOB_STALE_SECONDS)
+            ).fetchone()
+
+            if row:
+                job_id = row[0]
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', error = NULL, updated_at = ? WHERE id = ?",
+                    (now, job_id)
+                )
+            else:
+                job_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO jobs (id, source, source_key, variant, status, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, 'running', ?, ?)",
+                    (job_id, source, source_key, variant, now, now)
+                )
+
+        return Job(self, job_id, source, source_key, variant)
+
+    def get_job(self, job_id: str) -> Optional[Job]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT source, source_key, variant FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return Job(self, job_id, *row) if row else None
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        query = "SELECT id, source, status, stage, error, updated_at FROM jobs"
+        params = ()
+        if status:
+            query += " WHERE status = ?"
+            params = (status,)
+        query += " ORDER BY updated_at DESC LIMIT ?"
+
+        with self._connect() as conn:
+            rows = conn.execute(query, params + (limit,)).fetchall()
+        keys = ["id", "source", "status", "stage", "error", "updated_at"]
+        return [dict(zip(keys, row)) for row in rows]
+
+    def _artifact(self, job_id: str, stage: str, completed_only: bool) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT data, completed FROM artifacts WHERE job_id = ? AND stage = ?",
+                (job_id, stage)
+            ).fetchone()
+        if not row or (completed_only and not row[1]):
+            return None
+        return json.loads(row[0])
+
+    def _save(self, job_id: str, stage: str, data: Dict, completed: bool, merge: bool):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            if merge:
+                row = conn.execute(
+                    "SELECT data FROM artifacts WHERE job_id = ? AND stage = ?", (job_id, stage)
+                ).fetchone()
+                if row:
+                    data = _merge(json.loads(row[0]), data)
+
+            conn.execute(
+                "INSERT OR REPLACE INTO artifacts (job_id, stage, data, completed, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job_id, stage, json.dumps(data, ensure_ascii=False), int(completed), now)
+            )
+            # Cada avance renueva updated_at: el trabajo sigue vivo para open_job
+            if completed:
+                conn.execute("UPDATE jobs SET stage = ?, updated_at = ? WHERE id = ?", (stage, now, job_id))
+            else:
+                conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (now, job_id))
+
+    def _set_status(self, job_id: str, status: str, error: Optional[str] = None):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id)
+            )
+
+    def _completed(self, job_id: str) -> List[str]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT stage FROM artifacts WHERE job_id = ? AND completed = 1", (job_id,)
+            ).fetchall()
+        done = {row[0] for row in rows}
+        return [stage for stage in STAGES if stage in done]
+
+
+_store: Optional[JobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """Obtiene el almacén de trabajos compartido del proceso"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = JobStore()
+        return _store
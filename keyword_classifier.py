@@ -0,0 +1,155 @@
+import unicodedata
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas y sin tildes, para que 'Función' y 'funcion' coincidan"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+class AhoCorasick:
+    """
+    Autómata multi-patrón: encuentra todas las palabras clave
+    en una sola pasada sobre el texto, sin importar cuántas sean.
+    """
+
+    def __init__(self, patterns: Dict[str, List]):
+        # patterns: texto del patrón -> lista de valores asociados
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, List]]] = [[]]
+
+        for pattern, values in patterns.items():
+            self._add(pattern, values)
+        self._build()
+
+    def _add(self, pattern: str, values: List):
+        node = 0
+        for char in pattern:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(pattern), values))
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, nxt in self._goto[node].items():
+                queue.append(nxt)
+                if node == 0:
+                    # Los hijos directos de la raíz siempre fallan a la raíz
+                    self._fail[nxt] = 0
+                else:
+                    fail = self._fail[node]
+                    while fail and char not in self._goto[fail]:
+                        fail = self._fail[fail]
+                    self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text: str):
+        """Genera (inicio, fin, valores) de cada coincidencia"""
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for length, values in self._out[node]:
+                yield i - length + 1, i + 1, values
+
+
+class KeywordClassifier:
+    """
+    Clasificador local construido a partir de 'signals' y 'scoring' de config.json.
+    Puntúa todas las categorías en una sola pasada y solo decide cuando
+    la evidencia es clara; si no, se delega en DeepAnalyzer.
+    """
+
+    def __init__(self, config: Dict):
+        settings = config.get('classifier', {})
+        self.threshold = settings.get('threshold', 0.7)
+        self.min_topic_hits = settings.get('min_topic_hits', 8)
+        self.target_density = settings.get('target_density', 15.0)
+        self.topic_groups: Dict[str, str] = settings.get('topic_groups', {})
+
+        self.weights: Dict[Tuple[str, str], float] = {}
+        patterns: Dict[str, List] = {}
+
+        for category, groups in config.get('signals', {}).items():
+            for group, keywords in groups.items():
+                weight = config.get('scoring', {}).get(category, {}).get(group, 0)
+                self.weights[(category, group)] = weight
+                for keyword in keywords:
+                    patterns.setdefault(normalize_text(keyword), []).append((category, group))
+
+        self.matcher = AhoCorasick(patterns)
+
+    def count_hits(self, text: str) -> Dict[Tuple[str, str], int]:
+        """Cuenta coincidencias por (categoría, grupo), respetando límites de palabra"""
+        text = normalize_text(text)
+        hits: Dict[Tuple[str, str], int] = {}
+
+        for start, end, values in self.matcher.iter_matches(text):
+            if start > 0 and text[start - 1].isalnum():
+                continue
+            if end < len(text) and text[end].isalnum():
+                continue
+            for value in values:
+                hits[value] = hits.get(value, 0) + 1
+
+        return hits
+
+    def classify(self, transcript: str) -> Optional[Dict]:
+        """
+        Devuelve un resultado estilo DeepAnalyzer si la confianza supera el umbral,
+        o None si hay que recurrir al LLM.
+        """
+        words = max(len(transcript.split()), 1)
+        hits = self.count_hits(transcript)
+
+        # Puntuación académica neta (el entretenimiento resta)
+        academic_score = sum(
+            count * self.weights.get(key, 0)
+            for key, count in hits.items()
+            if key[0] in ('academic', 'entertainment')
+        )
+
+        # Puntuación por sub-tema
+        topic_scores: Dict[str, float] = {}
+        topic_hits = 0
+        for (category, group), count in hits.items():
+            sub_topic = self.topic_groups.get(group)
+            if category == 'academic' and sub_topic:
+                topic_scores[sub_topic] = topic_scores.get(sub_topic, 0) + count * self.weights.get((category, group), 0)
+                topic_hits += count
+
+        if academic_score <= 0 or topic_hits < self.min_topic_hits or not topic_scores:
+            return None
+
+        # Densidad: puntos académicos por cada 100 palabras, saturada a 1.0
+        density = academic_score / words * 100
+        academic_confidence = min(density / self.target_density, 1.0)
+
+        # Dominancia: qué parte de la evidencia temática apunta al sub-tema ganador
+        sub_topic, best = max(topic_scores.items(), key=lambda item: item[1])
+        dominance = best / sum(topic_scores.values())
+
+        confidence = round(academic_confidence * dominance, 3)
+        if confidence < self.threshold:
+            return None
+
+        return {
+            "category": "ACADEMIC",
+            "sub_topic": sub_topic,
+            "confidence": confidence,
+            "purpose": "",
+            "has_formal_teaching": True,
+            "reasoning": f"Clasificador local: {topic_hits} señales temáticas, densidad {density:.2f}"
+        }
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from audio_profiles import PROFILES, AudioProfile
+
+# --- CONFIGURACIÓN DE ARCHIVOS DE ENTRADA ---
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024   # Bloques al volcar a disco un archivo subido
+# Por encima de este bitrate compensa recodificar (la subida pesa más que el ffmpeg)
+COPY_MAX_KBPS = int(os.getenv("CONTENTNOTES_COPY_MAX_KBPS", "128"))
+
+# Códecs que Gemini acepta tal cual: (extensión, contenedor) para extraerlos sin recodificar
+AUDIO_COPY_FORMATS = {
+    "aac": (".aac", "adts"),
+    "mp3": (".mp3", "mp3"),
+    "opus": (".ogg", "ogg"),
+    "vorbis": (".ogg", "ogg"),
+    "flac": (".flac", "flac"),
+}
+
+
+def save_upload(fileobj, suffix: str, temp_dir: str = "/tmp/contentnotes") -> str:
+    """
+    Vuelca un archivo subido a disco por bloques, sin pedir de golpe todo su contenido.
+    Se guarda a disco en lugar de pasarlo por el stdin de ffmpeg porque los MP4/MOV
+    suelen llevar el índice (moov) al final y ffmpeg necesita poder buscar en el archivo.
+    """
+    os.makedirs(temp_dir, exist_ok=True)
+    if hasattr(fileobj, "seek"):
+        fileobj.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=temp_dir) as tmp:
+        shutil.copyfileobj(fileobj, tmp, UPLOAD_CHUNK_SIZE)
+        return tmp.name
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+async def run_command_async(args: List[str], timeout: Optional[float] = None) -> Tuple[int, bytes, bytes]:
+    """
+    subprocess.run para asyncio: (código, stdout, stderr). Si la tarea se cancela
+    o vence el plazo, el proceso se mata en lugar de quedar huérfano.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *args, stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except BaseException:
+        if proc.returncode is None:
+            proc.kill()
+            await asyncio.shield(proc.wait())
+        raise
+    return proc.returncode, stdout, stderr
+
+
+def _probe_command(path: str) -> List[str]:
+    return [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'format=duration,format_name,bit_rate'
+                         ':stream=codec_type,codec_name,sample_rate,channels,bit_rate'
+                         ':stream_disposition=attached_pic',
+        '-of', 'json', path
+    ]
+
+
+def probe_media(path: str) -> Optional[Dict]:
+    """
+    Formato del archivo con una sola llamada a ffprobe:
+    {"duration", "format", "audio_codec", "sample_rate", "channels", "kbps", "has_video"}.
+    None si no se puede leer.
+    """
+    try:
+        result = subprocess.run(_probe_command(path), capture_output=True, text=True, timeout=60)
+        data = json.loads(result.stdout or "{}")
+    except Exception:
+        return None
+    return _parse_probe(data)
+
+
+async def probe_media_async(path: str) -> Optional[Dict]:
+    """probe_media sin bloquear el event loop"""
+    try:
+        _, stdout, _ = await run_command_async(_probe_command(path), timeout=60)
+        data = json.loads(stdout.decode(errors="ignore") or "{}")
+    except (OSError, ValueError, asyncio.TimeoutError):
+        return None
+    return _parse_probe(data)
+
+
+def _parse_probe(data: Dict) -> Optional[Dict]:
+    streams = data.get("streams") or []
+    fmt = data.get("format") or {}
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    if not fmt and not streams:
+        return None
+
+    # Las carátulas de un MP3/M4A aparecen como video pero no lo son
+    has_video = any(
+        s.get("codec_type") == "video" and not (s.get("disposition") or {}).get("attached_pic")
+        for s in streams
+    )
+    bit_rate = _number((audio or {}).get("bit_rate")) or (None if has_video else _number(fmt.get("bit_rate")))
+    return {
+        "duration": _number(fmt.get("duration")),
+        "format": fmt.get("format_name", ""),
+        "audio_codec": (audio or {}).get("codec_name"),
+        "sample_rate": int(_number((audio or {}).get("sample_rate")) or 0),
+        "channels": (audio or {}).get("channels"),
+        "kbps": bit_rate / 1000 if bit_rate else None,
+        "has_video": has_video,
+    }
+
+
+def plan_audio(path: str, info: Optional[Dict], profile: AudioProfile,
+               explicit: bool = False) -> Tuple[str, AudioProfile]:
+    """
+    Decide cómo preparar el audio de un archivo:
+      "skip"   -> ya sirve tal cual (mismo formato que un perfil, o audio aceptable sin video)
+      "copy"   -> extraer la pista de audio sin recodificar (-vn -c:a copy)
+      "encode" -> recodificar con el perfil
+    Con un perfil explícito solo se omite la recodificación si el archivo ya lo cumple.
+    Devuelve la acción y el perfil que describe el resultado.
+    """
+    if not info or not info.get("audio_codec"):
+        return "encode", profile
+    if profile.matches(info):
+        return "skip", profile
+    if explicit:
+        return "encode", profile
+
+    # En modo automático cualquier perfil ya cumplido vale (p.ej. un MP3 de 48k de más de una hora)
+    for candidate in PROFILES.values():
+        if candidate.matches(info):
+            return "skip", candidate
+
+    copy_format = AUDIO_COPY_FORMATS.get(info["audio_codec"])
+    kbps = info.get("kbps")
+    if copy_format and kbps is not None and kbps <= COPY_MAX_KBPS:
+        if not info.get("has_video") and Path(path).suffix.lower() == copy_format[0]:
+            return "skip", profile
+        return "copy", profile
+    return "encode", profile
+
+
+def copy_output_name(stem: str, info: Dict) -> str:
+    return f"{stem}{AUDIO_COPY_FORMATS[info['audio_codec']][0]}"
+
+
+def _extract_command(path: str, output_path: str, action: str, profile: AudioProfile,
+                     info: Optional[Dict]) -> List[str]:
+    if action == "copy":
+        container = AUDIO_COPY_FORMATS[info["audio_codec"]][1]
+        args = ['-vn', '-sn', '-dn', '-map', '0:a:0', '-c:a', 'copy', '-f', container]
+    else:
+        args = profile.ffmpeg_args()
+    return ['ffmpeg', '-i', path, *args, '-y', output_path]
+
+
+def extract_audio(path: str, output_path: str, action: str, profile: AudioProfile,
+                  info: Optional[Dict] = None, timeout: int = 300) -> bool:
+    """Ejecuta la acción de plan_audio ("copy" o "encode"); True si output_path quedó listo"""
+    subprocess.run(_extract_command(path, output_path, action, profile, info), capture_output=True, timeout=timeout)
+    return os.path.exists(output_path) and os.path.getsize(output_path) > 0
+
+
+async def extract_audio_async(path: str, output_path: str, action: str, profile: AudioProfile,
+                              info: Optional[Dict] = None) -> bool:
+    """extract_audio con un subproceso asyncio (el plazo lo pone la etapa que lo llama)"""
+    await run_command_async(_extract_command(path, output_path, action, profile, info))
+    return os.path.exists(output_path) and os.path.getsize(output_path) > 0
@@ -0,0 +1,111 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# Modelos ligados a una caché de contexto que se conservan (uno por caché viva)
+MAX_CACHED_CONTENT_MODELS = 32
+
+
+class ModelRegistry:
+    """
+    Modelos de Gemini ya construidos, compartidos por todo el proceso y
+    reutilizados entre peticiones, por (nombre, configuración de generación).
+    Todos usan el cliente por defecto del SDK, así que comparten conexiones.
+    El SDK (lento de importar) no se carga hasta la primera llamada real.
+    """
+
+    def __init__(self):
+        self.created = 0
+        self._models: Dict[Tuple[str, str], object] = {}
+        self._cached_content: "OrderedDict[str, object]" = OrderedDict()
+        self._api_key: Optional[str] = None
+        self._configured = False
+        self._lock = threading.Lock()
+
+    def configure(self, api_key: Optional[str]):
+        """Registra la clave; genai.configure se aplica una sola vez, al usar el SDK"""
+        if not api_key:
+            return
+        with self._lock:
+            if api_key == self._api_key:
+                return
+            self._api_key = api_key
+            self._configured = False
+            # Los modelos guardan el cliente de la clave anterior
+            self._models.clear()
+            self._cached_content.clear()
+
+    def _sdk_locked(self):
+        import google.generativeai as genai
+        if not self._configured and self._api_key:
+            genai.configure(api_key=self._api_key)
+            self._configured = True
+        return genai
+
+    def sdk(self):
+        """Módulo google.generativeai, ya configurado con la clave registrada"""
+        with self._lock:
+            return self._sdk_locked()
+
+    @staticmethod
+    def _key(name: str, generation_config: Optional[Dict]) -> Tuple[str, str]:
+        return name, json.dumps(generation_config or {}, sort_keys=True)
+
+    def get(self, name: str, generation_config: Optional[Dict] = None):
+        key = self._key(name, generation_config)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = self._sdk_locked().GenerativeModel(name, generation_config=generation_config)
+                self._models[key] = model
+                self.created += 1
+            return model
+
+    def for_cached_content(self, handle):
+        """Modelo ligado a una caché de contexto (uno por caché, no uno por llamada)"""
+        with self._lock:
+            model = self._cached_content.get(handle.name)
+            if model is None:
+                model = self._sdk_locked().GenerativeModel.from_cached_content(cached_content=handle)
+                self._cached_content[handle.name] = model
+                self.created += 1
+                while len(self._cached_content) > MAX_CACHED_CONTENT_MODELS:
+                    self._cached_content.popitem(last=False)
+            else:
+                self._cached_content.move_to_end(handle.name)
+            return model
+
+    def forget_cached_content(self, name: str):
+        with self._lock:
+            self._cached_content.pop(name, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "models": len(self._models),
+                "cached_content_models": len(self._cached_content),
+                "created": self.created
+            }
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Registro de modelos compartido del proceso"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        return _registry
+
+
+def get_model(name: str, generation_config: Optional[Dict] = None):
+    return get_model_registry().get(name, generation_config)
+
+
+def get_genai():
+    """google.generativeai configurado (import diferido: no pesa en el arranque)"""
+    return get_model_registry().sdk()
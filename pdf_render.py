@@ -0,0 +1,190 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+
+# markdown y xhtml2pdf se importan al renderizar el primer PDF: pesan en el arranque de la app
+
+# --- CONFIGURACIÓN DE LA CACHÉ DE PDF ---
+MAX_CACHE_BYTES = 64 * 1024 * 1024   # Memoria máxima para PDFs ya renderizados
+MAX_CACHE_ENTRIES = 256
+FAILURE_TTL_SECONDS = 60             # Un render fallido no se reintenta solo durante este tiempo
+
+# Estilos CSS (Aquí controlas el diseño visual del PDF)
+PDF_CSS = """
+<style>
+    @page {
+        size: A4;
+        margin: 2cm;
+        @frame footer_frame {           /* Static Frame */
+            -pdf-frame-content: footerContent;
+            bottom: 1cm;
+            margin-left: 2cm;
+            margin-right: 2cm;
+            height: 1cm;
+        }
+    }
+    body { font-family: Helvetica, sans-serif; font-size: 11pt; color: #2a2a2a; line-height: 1.5; }
+    h1 { font-size: 24pt; color: #1a1a1a; text-align: center; border-bottom: 2px solid #ddd; padding-bottom: 10px; margin-bottom: 20px; }
+    h2 { font-size: 16pt; color: #2a2a2a; margin-top: 20px; margin-bottom: 10px; }
+    h3 { font-size: 13pt; color: #3a3a3a; font-weight: bold; }
+    p { margin-bottom: 10px; text-align: justify; }
+    ul, ol { margin-bottom: 10px; margin-left: 15px; }
+    li { margin-bottom: 5px; }
+    code { background-color: #f0f0f0; font-family: Courier; padding: 2px; }
+    pre { background-color: #f0f0f0; border: 1px solid #ccc; padding: 10px; font-family: Courier; font-size: 9pt; white-space: pre-wrap; }
+    blockquote { border-left: 4px solid #ccc; padding-left: 10px; color: #666; font-style: italic; margin: 15px 0; }
+    table { border-collapse: collapse; width: 100%; margin-bottom: 15px; }
+    th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
+    th { background-color: #f2f2f2; font-weight: bold; }
+</style>
+"""
+
+
+def render_pdf(text: str, title: str = "Notas", css: str = PDF_CSS) -> Optional[bytes]:
+    """
+    Genera un PDF convirtiendo Markdown -> HTML -> PDF directamente.
+    Soporta CSS para estilos avanzados.
+    """
+    try:
+        import markdown
+        from xhtml2pdf import pisa
+
+        # 1. Convertir Markdown a HTML
+        # Agregamos extensiones útiles para tablas y bloques de código
+        html_content = markdown.markdown(text, extensions=['tables', 'fenced_code', 'sane_lists'])
+
+        # 2. Construir el HTML completo
+        full_html = f"""
+        <html>
+        <head>{css}</head>
+        <body>
+            <h1>{title}</h1>
+            {html_content}
+
+            <div id="footerContent" style="text-align:center; color:#888; font-size:9pt;">
+                Generado con ContentNotes.
+            </div>
+        </body>
+        </html>
+        """
+
+        # 3. Generar el PDF en memoria
+        buffer = BytesIO()
+        # pisa.CreatePDF convierte el string HTML/CSS directamente a bytes PDF
+        pisa_status = pisa.CreatePDF(full_html, dest=buffer)
+
+        # Verificar errores
+        if pisa_status.err:
+            print(f"Error generando PDF: {pisa_status.err}")
+            return None
+
+        return buffer.getvalue()
+
+    except Exception as e:
+        print(f"Error crítico en PDF: {e}")
+        return None
+
+
+# CACHÉ DE RENDERIZADO (compartida por todas las sesiones del proceso)
+
+_cache: "OrderedDict[str, bytes]" = OrderedDict()
+_cache_bytes = 0
+_pending: Dict[str, Future] = {}
+_failed: Dict[str, float] = {}       # clave -> momento del fallo (caché negativa)
+_lock = threading.Lock()
+_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pdf-render")
+
+
+def pdf_cache_key(text: str, title: str = "Notas", css: str = PDF_CSS) -> str:
+    """Hash de (notas, título, CSS)"""
+    digest = hashlib.sha256()
+    for part in (text, title, css):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _store(key: str, pdf: Optional[bytes]):
+    global _cache_bytes
+    with _lock:
+        _pending.pop(key, None)
+        if pdf is None:
+            # El fallo se recuerda poco tiempo: evita relanzar en bucle un render que
+            # siempre falla, pero uno pasajero se puede reintentar (retry_pdf)
+            now = time.monotonic()
+            for old_key in [k for k, failed_at in _failed.items() if now - failed_at > FAILURE_TTL_SECONDS]:
+                del _failed[old_key]
+            _failed[key] = now
+            return
+        _failed.pop(key, None)
+        if key in _cache:
+            return
+        _cache[key] = pdf
+        _cache_bytes += len(pdf)
+
+        # Expulsamos los menos usados hasta volver al límite
+        while _cache and (_cache_bytes > MAX_CACHE_BYTES or len(_cache) > MAX_CACHE_ENTRIES):
+            _, old = _cache.popitem(last=False)
+            _cache_bytes -= len(old)
+
+
+def _lookup(key: str) -> Tuple[bool, Optional[bytes]]:
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return True, _cache[key]
+        failed_at = _failed.get(key)
+        if failed_at is not None and time.monotonic() - failed_at <= FAILURE_TTL_SECONDS:
+            return True, None
+    return False, None
+
+
+def generate_pdf_async(text: str, title: str = "Notas") -> Future:
+    """Lanza el renderizado en segundo plano (o devuelve el ya hecho/en curso)"""
+    key = pdf_cache_key(text, title)
+    found, pdf = _lookup(key)
+    if found:
+        future = Future()
+        future.set_result(pdf)
+        return future
+
+    with _lock:
+        future = _pending.get(key)
+        if future is None:
+            def job():
+                result = None
+                try:
+                    result = render_pdf(text, title)
+                    return result
+                finally:
+                    _store(key, result)
+            future = _pool.submit(job)
+            _pending[key] = future
+        return future
+
+
+def get_pdf_if_ready(text: str, title: str = "Notas") -> Tuple[bool, Optional[bytes]]:
+    """
+    No bloquea nunca: devuelve (listo, bytes). Si aún no está, lanza el
+    renderizado y devuelve (False, None). Un PDF fallido es (True, None) y se
+    recuerda FAILURE_TTL_SECONDS; retry_pdf lo vuelve a intentar antes.
+    """
+    future = generate_pdf_async(text, title)
+    if future.done():
+        return True, future.result()
+    return False, None
+
+
+def retry_pdf(text: str, title: str = "Notas"):
+    """Olvida un fallo anterior: la siguiente llamada vuelve a renderizar"""
+    with _lock:
+        _failed.pop(pdf_cache_key(text, title), None)
+
+
+def generate_pdf(text: str, title: str = "Notas") -> Optional[bytes]:
+    """Versión bloqueante con caché (CLI, lotes)"""
+    return generate_pdf_async(text, title).result()
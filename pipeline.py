@@ -0,0 +1,244 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import rate_limiter
+import tracing
+from config_loader import ContextDetector, PromptBuilder, SpeculativeDetector, estimate_tokens, get_model_name
+from context_cache import get_context_cache
+from job_store import JobStore
+from model_registry import get_model
+from yt_helper import ProgressCallback, download_and_transcribe, print_progress, source_key
+
+
+def is_remote_source(source: str) -> bool:
+    """True si la fuente es una URL (se descarga vía Cobalt)"""
+    return source.startswith(("http://", "https://"))
+
+
+def generate_notes(prompt: str, on_chunk: Optional[Callable[[str], None]] = None, cached=None) -> str:
+    """
+    Genera las notas a partir del prompt final.
+    Con on_chunk la respuesta llega en streaming y se entrega el texto acumulado
+    tras cada fragmento; el resultado final es el mismo.
+    cached: handle de la caché de contexto que ya contiene la transcripción.
+    """
+    if cached is not None:
+        generate = lambda stream: get_context_cache().generate(cached, prompt, stream=stream)
+    else:
+        model = get_model(get_model_name("notes"))
+        generate = lambda stream: rate_limiter.get_rate_limiter().call(
+            model.generate_content, prompt, tokens=estimate_tokens(prompt), stream=stream
+        )
+
+    with tracing.span("generate", cached=cached is not None, stream=on_chunk is not None):
+        if on_chunk is None:
+            response = generate(False)
+            tracing.record_usage(response, prompt=prompt)
+            return response.text if response.text else ""
+
+        text = ""
+        chunk = None
+        for chunk in generate(True):
+            piece = getattr(chunk, "text", "") or ""
+            if piece:
+                text += piece
+                on_chunk(text)
+        # En streaming el uso de tokens llega con el último fragmento
+        tracing.record_usage(chunk, prompt=prompt, text=text)
+        return text
+
+
+def reduce_groups(sections: List[str], prompt_builder: PromptBuilder) -> Optional[List[List[str]]]:
+    """
+    Agrupa notas parciales consecutivas para reducirlas por partes.
+    None si ya caben en un solo prompt o si no se pueden agrupar más.
+    """
+    if len(sections) <= 1 or estimate_tokens("\n\n".join(sections)) <= prompt_builder.max_prompt_tokens:
+        return None
+    groups, current = [], []
+    for section in sections:
+        if current and estimate_tokens("\n\n".join(current + [section])) > prompt_builder.chunk_tokens:
+            groups.append(current)
+            current = []
+        current.append(section)
+    groups.append(current)
+    if len(groups) == len(sections):
+        # Cada nota parcial ya ocupa un grupo entero; no se puede reducir más por partes
+        return None
+    return groups
+
+
+def section_prompts(transcript: str, prompt_key: str, prompt_builder: PromptBuilder,
+                    progress: ProgressCallback = print_progress) -> List[str]:
+    """Prompts de la fase map: uno por bloque de la transcripción"""
+    chunks = prompt_builder.split_transcript(transcript)
+    progress("generate", f"📝 Generando notas por partes ({len(chunks)} bloques)...")
+    return [prompt_builder.build_section_prompt(chunk, prompt_key, i + 1, len(chunks))
+            for i, chunk in enumerate(chunks)]
+
+
+def full_notes_prompt(transcript: str, context: Dict, prompt_builder: PromptBuilder) -> str:
+    """Prompt con la transcripción completa (sin caché de contexto)"""
+    return prompt_builder.build_prompt(
+        transcript=transcript,
+        prompt_key=context.get('prompt_key', 'general'),
+        subject=context.get('context', 'General'),
+        category=context.get('context', 'general')
+    )
+
+
+def generate_notes_map_reduce(transcript: str, prompt_key: str, prompt_builder: PromptBuilder,
+                              on_chunk: Optional[Callable[[str], None]] = None,
+                              progress: ProgressCallback = print_progress) -> str:
+    """
+    Notas para transcripciones que exceden el presupuesto de tokens:
+    map = notas de cada bloque en paralelo, reduce = fusión en un documento.
+    Cada llamada se mantiene dentro del presupuesto, así que la latencia no
+    crece con la longitud del contenido (salvo por el número de workers).
+    """
+    prompts = section_prompts(transcript, prompt_key, prompt_builder, progress)
+
+    with ThreadPoolExecutor(max_workers=prompt_builder.max_workers) as pool:
+        sections = list(pool.map(tracing.bind(generate_notes), prompts))
+
+        # Si las notas parciales aún no caben en un solo prompt, reducimos por grupos
+        while True:
+            groups = reduce_groups(sections, prompt_builder)
+            if groups is None:
+                break
+            sections = list(pool.map(
+                tracing.bind(lambda group: group[0] if len(group) == 1 else generate_notes(
+                    prompt_builder.build_reduce_prompt(group, prompt_key)
+                )),
+                groups
+            ))
+
+    if len(sections) == 1:
+        if on_chunk:
+            on_chunk(sections[0])
+        return sections[0]
+
+    progress("generate", "🧩 Unificando notas...")
+    return generate_notes(prompt_builder.build_reduce_prompt(sections, prompt_key), on_chunk=on_chunk)
+
+
+def generate_analysis(transcript: str, context: Dict, prompt_builder: PromptBuilder,
+                      on_notes_chunk: Optional[Callable[[str], None]] = None,
+                      progress: ProgressCallback = print_progress) -> str:
+    """Notas de la transcripción: map-reduce, caché de contexto o prompt completo"""
+    prompt_key = context.get('prompt_key', 'general')
+    if prompt_builder.needs_map_reduce(transcript):
+        return generate_notes_map_reduce(transcript, prompt_key, prompt_builder,
+                                         on_chunk=on_notes_chunk, progress=progress)
+
+    progress("generate", "📝 Generando notas...")
+    # La transcripción ya registrada (p.ej. al clasificar) no se vuelve a enviar; para
+    # una sola llamada de notas no compensa crear la caché
+    cached = get_context_cache().handle_for(get_model_name("notes"), transcript, create=False)
+    if cached is not None:
+        try:
+            analysis = generate_notes(prompt_builder.build_cached_prompt(prompt_key),
+                                      on_chunk=on_notes_chunk, cached=cached)
+            if analysis:
+                return analysis
+        except Exception as e:
+            print(f"Caché de contexto falló, se envía la transcripción completa: {e}")
+
+    return generate_notes(full_notes_prompt(transcript, context, prompt_builder), on_chunk=on_notes_chunk)
+
+
+def open_source_job(job_store: Optional[JobStore], source: str, is_youtube: bool, prompt_builder: PromptBuilder):
+    """Trabajo persistente de la fuente (None sin job_store o sin llave estable)"""
+    if not job_store:
+        return None
+    key = source_key(source, is_youtube)
+    if not key:
+        return None
+    return job_store.open_job(source, key, variant=prompt_builder.config_loader.language)
+
+
+def start_source_trace(source: str, progress: ProgressCallback = print_progress) -> Optional[tracing.Trace]:
+    """Abre la traza del trabajo y avisa por progress mientras espera cuota de Gemini"""
+    trace = tracing.start_trace(source)
+    # Si la cuota de Gemini está agotada el trabajo espera turno en lugar de fallar
+    rate_limiter.set_wait_feedback(
+        lambda position, wait: progress("queue", f"⏳ En cola para Gemini: posición {position} (~{wait:.0f}s)")
+    )
+    return trace
+
+
+def process_source(source: str, context_detector: ContextDetector, prompt_builder: PromptBuilder,
+                   is_youtube: Optional[bool] = None,
+                   progress: ProgressCallback = print_progress,
+                   job_store: Optional[JobStore] = None, finish_job: bool = True,
+                   on_notes_chunk: Optional[Callable[[str], None]] = None,
+                   compact: Optional[bool] = None,
+                   audio_profile: Optional[str] = None,
+                   captions: Optional[bool] = None) -> Optional[Dict]:
+    """
+    Flujo completo sin interfaz: transcribir -> detectar contexto -> prompt -> notas.
+    Devuelve {"transcript", "context", "analysis", "job", "trace"} o None si algo falla.
+    Con job_store, cada etapa queda registrada y un reintento reanuda desde la
+    última completada. finish_job=False deja el trabajo abierto (p.ej. para 'render').
+    on_notes_chunk recibe las notas parciales mientras se generan (streaming).
+    compact quita silencios del audio antes de transcribir (None = según entorno).
+    audio_profile fija el perfil de codificación (None = automático).
+    captions=False obliga a transcribir el audio aunque el video tenga subtítulos.
+    Cada etapa queda medida en la traza del trabajo (tracing); con finish_job=False
+    quien llama la cierra con tracing.finish_trace(result["trace"]).
+    """
+    if is_youtube is None:
+        is_youtube = is_remote_source(source)
+
+    job = open_source_job(job_store, source, is_youtube, prompt_builder)
+    trace = start_source_trace(source, progress)
+
+    # La clasificación arranca con el primer fragmento transcrito
+    speculative = SpeculativeDetector(context_detector)
+    transcript = download_and_transcribe(source, is_youtube=is_youtube,
+                                         on_partial=speculative.feed, progress=progress, job=job,
+                                         compact=compact, audio_profile=audio_profile,
+                                         captions=captions)
+    if not transcript:
+        tracing.finish_trace(trace, status="error")
+        return None
+
+    # Detectar contexto con nueva lógica
+    classified = job.get("classify") if job else None
+    if classified:
+        context = classified["context"]
+    else:
+        progress("classify", "📊 Detectando tipo de contenido...")
+        context = speculative.result(transcript)
+        if job:
+            job.done("classify", {"context": context})
+
+    # Generar análisis
+    generated = job.get("generate") if job else None
+    if generated:
+        analysis = generated["analysis"]
+    else:
+        try:
+            analysis = generate_analysis(transcript, context, prompt_builder, on_notes_chunk, progress)
+        except Exception as e:
+            progress("error", f"⚠️ Error Gemini: {str(e)[:100]}")
+            if job:
+                job.fail("generate", str(e))
+            tracing.finish_trace(trace, status="error")
+            return None
+
+        if job and analysis:
+            job.done("generate", {"analysis": analysis})
+
+    if job and finish_job:
+        job.finish()
+    if finish_job:
+        tracing.finish_trace(trace)
+
+    return {
+        "transcript": transcript,
+        "context": context,
+        "analysis": analysis,
+        "job": job,
+        "trace": trace
+    }
@@ -0,0 +1,486 @@
+"""
+Límite de peticiones a Gemini compartido por todas las sesiones del proceso
+(y, con CONTENTNOTES_RATE_DB, por todos los procesos de la máquina).
+
+    limiter = get_rate_limiter()
+    response = limiter.call(model.generate_content, prompt, tokens=estimate_tokens(prompt))
+    # En código async (async_pipeline.py), sin ocupar un hilo mientras espera turno:
+    response = await limiter.acall(model.generate_content_async, prompt, tokens=estimate_tokens(prompt))
+
+Dos cubetas de fichas (peticiones y tokens por minuto) y un máximo de
+llamadas simultáneas. Las esperas se reparten por carriles: "interactive"
+(la interfaz) pasa antes que "batch" (cli.py). Un 429 no llega al usuario:
+se reintenta con backoff exponencial y frena a todo el proceso mientras dura.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import tracing
+
+# --- CONFIGURACIÓN DEL LIMITADOR ---
+# Ajustar a la cuota del proyecto (0 = sin límite). Por defecto, un nivel de pago básico.
+GEMINI_RPM = int(os.getenv("CONTENTNOTES_GEMINI_RPM", "150"))
+GEMINI_TPM = int(os.getenv("CONTENTNOTES_GEMINI_TPM", "1000000"))
+GEMINI_MAX_CONCURRENT = int(os.getenv("CONTENTNOTES_GEMINI_CONCURRENCY", "8"))
+# Vacío = límite solo dentro del proceso; una ruta = cubetas compartidas entre procesos
+RATE_DB_PATH = os.getenv("CONTENTNOTES_RATE_DB", "")
+
+MAX_RETRIES = 5                # Reintentos ante un 429 antes de rendirse
+RETRY_BASE_SECONDS = 2.0       # Primera espera tras un 429 (luego se dobla)
+RETRY_MAX_SECONDS = 60.0
+FEEDBACK_MIN_WAIT_SECONDS = 1.0  # Esperas más cortas no se notifican
+ASYNC_POLL_SECONDS = 0.1       # Cada cuánto revisa su turno una tarea async en cola
+
+LANES = {"interactive": 0, "batch": 1}   # Menor = más prioridad
+DEFAULT_LANE = "interactive"
+
+# Aviso de cola: (posición, segundos estimados) -> None
+WaitCallback = Callable[[int, float], None]
+
+_lane = contextvars.ContextVar("contentnotes_lane", default=None)
+_feedback = contextvars.ContextVar("contentnotes_wait_feedback", default=None)
+_default_lane = DEFAULT_LANE
+
+RETRY_HINT_RE = re.compile(r'retry(?:_delay)?\D{0,20}?(\d+(?:\.\d+)?)\s*s', re.IGNORECASE)
+
+
+def set_default_lane(lane: str):
+    """Carril por defecto del proceso (cli.py usa "batch")"""
+    global _default_lane
+    if lane not in LANES:
+        raise ValueError(f"Carril desconocido: {lane}")
+    _default_lane = lane
+
+
+@contextmanager
+def lane(name: str):
+    """Fija el carril de las llamadas hechas dentro del bloque"""
+    if name not in LANES:
+        raise ValueError(f"Carril desconocido: {name}")
+    token = _lane.set(name)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def current_lane() -> str:
+    return _lane.get() or _default_lane
+
+
+def set_wait_feedback(callback: Optional[WaitCallback]):
+    """Aviso de cola para las llamadas del trabajo en curso (p.ej. mensaje en la interfaz)"""
+    _feedback.set(callback)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """True si Gemini rechazó la llamada por cuota (HTTP 429 / RESOURCE_EXHAUSTED)"""
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and code == 429:
+        return True
+    text = str(error)
+    return "429" in text or "RESOURCE_EXHAUSTED" in text or "Resource has been exhausted" in text
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """Espera antes del reintento: la que sugiere Gemini o backoff exponencial con jitter"""
+    hint = RETRY_HINT_RE.search(str(error))
+    if hint:
+        return min(RETRY_MAX_SECONDS, float(hint.group(1))) + random.uniform(0, 1)
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _total_tokens(response) -> Optional[int]:
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) if usage else None
+
+
+# Una demanda: (cubeta, fichas pedidas, capacidad, recarga por segundo)
+Demand = Tuple[str, float, float, float]
+
+
+class MemoryBucketStore:
+    """Cubetas en memoria (un solo proceso)"""
+
+    def __init__(self):
+        self._levels: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, demands: List[Demand]) -> float:
+        """Toma todas las fichas o ninguna; devuelve 0 o los segundos que faltan"""
+        now = time.time()
+        with self._lock:
+            levels = {}
+            wait = 0.0
+            for name, amount, capacity, rate in demands:
+                level, updated = self._levels.get(name, (capacity, now))
+                level = min(capacity, level + (now - updated) * rate)
+                levels[name] = level
+                if level < amount:
+                    wait = max(wait, (amount - level) / rate)
+            for name, amount, _, _ in demands:
+                self._levels[name] = (levels[name] - (amount if wait == 0 else 0), now)
+        return wait
+
+    def adjust(self, name: str, delta: float, capacity: float):
+        """Corrige una cubeta con el consumo real (delta > 0 consume, < 0 devuelve)"""
+        now = time.time()
+        with self._lock:
+            level, updated = self._levels.get(name, (capacity, now))
+            self._levels[name] = (max(-capacity, min(capacity, level - delta)), updated)
+
+    def drain(self, names: List[str]):
+        """Vacía las cubetas (tras un 429 la cuota real va por detrás de la nuestra)"""
+        now = time.time()
+        with self._lock:
+            for name in names:
+                self._levels[name] = (min(0.0, self._levels.get(name, (0.0, now))[0]), now)
+
+
+class SqliteBucketStore:
+    """
+    Cubetas en SQLite: varios procesos (p.ej. varias réplicas de Streamlit y
+    un lote de cli.py) comparten la misma cuota. BEGIN IMMEDIATE serializa
+    la lectura y escritura de los niveles.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    name TEXT PRIMARY KEY,
+                    level REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _level(conn, name: str, capacity: float, now: float) -> Tuple[float, float]:
+        row = conn.execute("SELECT level, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+        return row if row else (capacity, now)
+
+    def take(self, demands: List[Demand]) -> float:
+        now = time.time()
+        with self._connect() as conn:
+            levels = {}
+            wait = 0.0
+            for name, amount, capacity, rate in demands:
+                level, updated = self._level(conn, name, capacity, now)
+                level = min(capacity, level + (now - updated) * rate)
+                levels[name] = level
+                if level < amount:
+                    wait = max(wait, (amount - level) / rate)
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets (name, level, updated) VALUES (?, ?, ?)",
+                [(name, levels[name] - (amount if wait == 0 else 0), now) for name, amount, _, _ in demands]
+            )
+        return wait
+
+    def adjust(self, name: str, delta: float, capacity: float):
+        now = time.time()
+        with self._connect() as conn:
+            level, updated = self._level(conn, name, capacity, now)
+            conn.execute("INSERT OR REPLACE INTO buckets (name, level, updated) VALUES (?, ?, ?)",
+                         (name, max(-capacity, min(capacity, level - delta)), updated))
+
+    def drain(self, names: List[str]):
+        now = time.time()
+        with self._connect() as conn:
+            for name in names:
+                level, _ = self._level(conn, name, 0.0, now)
+                conn.execute("INSERT OR REPLACE INTO buckets (name, level, updated) VALUES (?, ?, ?)",
+                             (name, min(0.0, level), now))
+
+
+class _Permit:
+    def __init__(self, limiter: "GeminiRateLimiter", tokens: float):
+        self.limiter = limiter
+        self.tokens = tokens
+        self.released = False
+
+    def release(self, used_tokens: Optional[int] = None):
+        if self.released:
+            return
+        self.released = True
+        self.limiter._release(self, used_tokens)
+
+
+class GeminiRateLimiter:
+    """
+    Cubetas de peticiones y tokens por minuto + máximo de llamadas a la vez.
+    Dentro del proceso las esperas se atienden en orden de carril y de llegada;
+    entre procesos solo se comparten las cubetas.
+    """
+
+    def __init__(self, rpm: int = GEMINI_RPM, tpm: int = GEMINI_TPM,
+                 max_concurrent: int = GEMINI_MAX_CONCURRENT, store=None,
+                 max_retries: int = MAX_RETRIES):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrent = max_concurrent
+        self.store = store or MemoryBucketStore()
+        self.max_retries = max_retries
+        self.active = 0
+        self.waited_seconds = 0.0
+        self.rate_limited = 0
+        self._queue: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._cooldown_until = 0.0
+        self._cond = threading.Condition()
+
+    def _demands(self, tokens: float) -> List[Demand]:
+        demands = []
+        if self.rpm > 0:
+            demands.append(("gemini_requests", 1, self.rpm, self.rpm / 60))
+        if self.tpm > 0 and tokens > 0:
+            # Una petición mayor que la cubeta entera nunca pasaría: se limita a la capacidad
+            demands.append(("gemini_tokens", min(tokens, self.tpm), self.tpm, self.tpm / 60))
+        return demands
+
+    def _blocked(self, ticket: Tuple[int, int]) -> float:
+        """Segundos a esperar antes de pedir fichas (0 = es su turno)"""
+        if not self._queue or self._queue[0] != ticket:
+            return 1.0   # Hay alguien antes: nos despertará al salir
+        if self.max_concurrent > 0 and self.active >= self.max_concurrent:
+            return 1.0
+        cooldown = self._cooldown_until - time.time()
+        if cooldown > 0:
+            return cooldown
+        return 0.0
+
+    def _try_take(self, ticket: Tuple[int, int], tokens: float) -> float:
+        """
+        0 si la llamada puede salir ya (y la registra); si no, segundos a esperar.
+        Se llama con self._cond tomado, pero lo suelta mientras consulta el almacén:
+        con CONTENTNOTES_RATE_DB es un BEGIN IMMEDIATE que espera a otros procesos.
+        """
+        blocked = self._blocked(ticket)
+        if blocked:
+            return blocked
+        # La plaza se reserva antes de soltar el cond para no pasarse de max_concurrent
+        self.active += 1
+        granted = False
+        try:
+            demands = self._demands(tokens)
+            wait = 0.0
+            if demands:
+                self._cond.release()
+                try:
+                    wait = self.store.take(demands)
+                finally:
+                    self._cond.acquire()
+            granted = wait == 0
+        finally:
+            if not granted:
+                self.active -= 1
+                self._cond.notify_all()
+        return wait
+
+    def _report(self, ticket: Tuple[int, int], wait: float, on_wait: Optional[WaitCallback],
+                reported: Optional[int]) -> Optional[int]:
+        """Avisa de la posición en cola cuando cambia; devuelve la última avisada"""
+        position = sorted(self._queue).index(ticket) + 1
+        if on_wait and position != reported and (position > 1 or wait >= FEEDBACK_MIN_WAIT_SECONDS):
+            try:
+                on_wait(position, wait)
+            except Exception as e:
+                print(f"Error notificando la cola de Gemini: {e}")
+            return position
+        return reported
+
+    def _leave(self, ticket: Tuple[int, int]):
+        self._queue.remove(ticket)
+        heapq.heapify(self._queue)
+        self._cond.notify_all()
+
+    def _granted(self, start: float, tokens: float) -> _Permit:
+        waited = time.monotonic() - start
+        if waited > 0.01:
+            self.waited_seconds += waited
+            tracing.annotate(queued_seconds=round(waited, 3))
+        return _Permit(self, tokens)
+
+    def acquire(self, tokens: float = 0, lane_name: Optional[str] = None,
+                on_wait: Optional[WaitCallback] = None) -> _Permit:
+        """Espera turno para una llamada que consumirá unos tokens estimados"""
+        ticket = (LANES[lane_name or current_lane()], next(self._seq))
+        on_wait = on_wait or _feedback.get()
+        start = time.monotonic()
+        reported = None
+
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    wait = self._try_take(ticket, tokens)
+                    if wait == 0:
+                        break
+                    reported = self._report(ticket, wait, on_wait, reported)
+                    self._cond.wait(timeout=min(wait, 1.0))
+            finally:
+                self._leave(ticket)
+        return self._granted(start, tokens)
+
+    async def acquire_async(self, tokens: float = 0, lane_name: Optional[str] = None,
+                            on_wait: Optional[WaitCallback] = None) -> _Permit:
+        """
+        Igual que acquire pero sin ocupar un hilo mientras espera: comparte la
+        misma cola y si la tarea se cancela sale de ella sin llevarse el turno.
+        """
+        ticket = (LANES[lane_name or current_lane()], next(self._seq))
+        on_wait = on_wait or _feedback.get()
+        start = time.monotonic()
+        reported = None
+
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._blocked(ticket)
+                if wait == 0:
+                    # Tomar fichas puede esperar a otros procesos (SQLite): va a un hilo
+                    take = asyncio.ensure_future(asyncio.to_thread(self._try_take_locked, ticket, tokens))
+                    try:
+                        wait = await asyncio.shield(take)
+                    except asyncio.CancelledError:
+                        take.add_done_callback(self._undo_grant)
+                        raise
+                    if wait == 0:
+                        break
+                with self._cond:
+                    reported = self._report(ticket, wait, on_wait, reported)
+                # Los hilos despiertan con notify; las tareas revisan su turno cada poco
+                await asyncio.sleep(min(wait, ASYNC_POLL_SECONDS))
+        finally:
+            with self._cond:
+                self._leave(ticket)
+        return self._granted(start, tokens)
+
+    def _try_take_locked(self, ticket: Tuple[int, int], tokens: float) -> float:
+        with self._cond:
+            return self._try_take(ticket, tokens)
+
+    def _undo_grant(self, take: asyncio.Future):
+        """La tarea se canceló mientras tomaba fichas: si se le concedió el turno, se devuelve"""
+        if not take.cancelled() and take.exception() is None and take.result() == 0:
+            with self._cond:
+                self.active -= 1
+                self._cond.notify_all()
+
+    def _release(self, permit: _Permit, used_tokens: Optional[int]):
+        if used_tokens is not None and self.tpm > 0:
+            # La reserva era una estimación: se cobra lo que de verdad se gastó
+            self.store.adjust("gemini_tokens", used_tokens - min(permit.tokens, self.tpm), self.tpm)
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def _penalize(self, delay: float):
+        """Tras un 429 frenamos a todos, no solo a quien lo recibió"""
+        with self._cond:
+            self.rate_limited += 1
+            self._cooldown_until = max(self._cooldown_until, time.time() + delay)
+        self.store.drain([name for name, *_ in self._demands(1)])
+
+    def call(self, fn, *args, tokens: float = 0, lane_name: Optional[str] = None, **kwargs):
+        """
+        Ejecuta fn(*args, **kwargs) respetando los límites y reintentando los 429.
+        En streaming el permiso cubre solo la petición inicial, no la lectura.
+        """
+        attempt = 0
+        while True:
+            permit = self.acquire(tokens, lane_name)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                permit.release()
+                if not is_rate_limited(e) or attempt >= self.max_retries:
+                    raise
+                delay = retry_delay(e, attempt)
+                print(f"Gemini limitó la petición (429), reintento en {delay:.1f}s")
+                tracing.add(retries=1)
+                self._penalize(delay)
+                attempt += 1
+                continue
+            permit.release(_total_tokens(result))
+            return result
+
+    async def acall(self, fn, *args, tokens: float = 0, lane_name: Optional[str] = None, **kwargs):
+        """
+        Versión async de call: fn(*args, **kwargs) debe devolver algo esperable
+        (p.ej. model.generate_content_async, o asyncio.to_thread para el resto del SDK).
+        """
+        attempt = 0
+        while True:
+            permit = await self.acquire_async(tokens, lane_name)
+            try:
+                result = await fn(*args, **kwargs)
+            except asyncio.CancelledError:
+                permit.release()
+                raise
+            except Exception as e:
+                permit.release()
+                if not is_rate_limited(e) or attempt >= self.max_retries:
+                    raise
+                delay = retry_delay(e, attempt)
+                print(f"Gemini limitó la petición (429), reintento en {delay:.1f}s")
+                tracing.add(retries=1)
+                await asyncio.to_thread(self._penalize, delay)
+                attempt += 1
+                continue
+            # Corregir la cubeta de tokens también toca el almacén (SQLite entre procesos)
+            await asyncio.to_thread(permit.release, _total_tokens(result))
+            return result
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "active": self.active,
+                "queued": len(self._queue),
+                "waited_seconds": round(self.waited_seconds, 3),
+                "rate_limited": self.rate_limited
+            }
+
+
+_limiter: Optional[GeminiRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> GeminiRateLimiter:
+    """Limitador compartido del proceso"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            store = SqliteBucketStore(RATE_DB_PATH) if RATE_DB_PATH else None
+            _limiter = GeminiRateLimiter(store=store)
+        return _limiter
@@ -0,0 +1,31 @@
+"""
+Fragmentos de audio: cortes con solapamiento sin un último fragmento diminuto.
+"""
+from audio_chunks import _chunk_spans
+
+
+def spans(duration: float, chunk: int = 600, overlap: int = 15):
+    return [(start, length) for _, start, length in _chunk_spans("/x/clase.mp3", "/tmp", duration, chunk, overlap)]
+
+
+def test_chunks_cover_the_audio_with_overlap():
+    assert spans(1500) == [(0.0, 615), (600.0, 615), (1200.0, 615)]
+
+
+def test_no_chunk_starts_inside_the_final_overlap():
+    # El audio acaba 10 s después del inicio del tercer fragmento: lo cubre el segundo
+    assert spans(1210) == [(0.0, 615), (600.0, 615)]
+    assert spans(1215) == [(0.0, 615), (600.0, 615)]
+
+
+def test_tail_longer_than_overlap_gets_its_own_chunk():
+    assert spans(1216) == [(0.0, 615), (600.0, 615), (1200.0, 615)]
+
+
+def test_short_audio_is_one_chunk():
+    assert spans(30) == [(0.0, 615)]
+
+
+def test_chunk_paths_keep_stem_and_suffix():
+    paths = [path for path, _, _ in _chunk_spans("/x/clase.mp3", "/tmp", 1500, 600, 15)]
+    assert paths == ["/tmp/clase_part000.mp3", "/tmp/clase_part001.mp3", "/tmp/clase_part002.mp3"]
@@ -0,0 +1,95 @@
+"""
+Subtítulos: normalización del "rodillo" de los auto-subtítulos de YouTube,
+lectura de archivos .vtt/.srt y elección de pista.
+"""
+import os
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("webvtt")
+
+from captions import _pick_track, normalize_captions, read_caption_file
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def cue(start: float, end: float, text: str):
+    return SimpleNamespace(start_in_seconds=start, end_in_seconds=end, text=text)
+
+
+def test_youtube_rolling_captions_file():
+    text = read_caption_file(os.path.join(FIXTURES, "youtube_auto.vtt"))
+    assert text == (
+        "so today we're going to talk about the history of computing and why it matters"
+        "\n\n"
+        "next question please"
+    )
+
+
+def test_srt_file():
+    text = read_caption_file(os.path.join(FIXTURES, "lecture.srt"))
+    assert text == (
+        "Bienvenidos a la clase de hoy."
+        "\n\n"
+        "Hoy hablamos de redes neuronales y de cómo se entrenan."
+        "\n\n"
+        "Empezamos con un ejemplo sencillo."
+    )
+
+
+def test_unreadable_file_returns_none(tmp_path):
+    path = tmp_path / "empty.vtt"
+    path.write_text("WEBVTT\n\n00:00:00.000 --> 00:00:01.000\nhola\n", encoding="utf-8")
+    # Demasiado corto para generar notas
+    assert read_caption_file(str(path)) is None
+    assert read_caption_file(str(tmp_path / "missing.srt")) is None
+
+
+def test_line_completed_word_by_word():
+    text = normalize_captions([
+        cue(0.0, 1.0, "and why"),
+        cue(1.0, 2.0, "and why it matters"),
+        cue(2.0, 3.0, "and why it matters\nfor us"),
+    ])
+    assert text == "and why it matters for us"
+
+
+def test_short_repeated_line_is_kept():
+    # Un "no" suelto no es una repetición del rodillo
+    text = normalize_captions([cue(0.0, 1.0, "we said no"), cue(1.0, 2.0, "no")])
+    assert text == "we said no no"
+
+
+def test_speaker_change_opens_paragraph():
+    text = normalize_captions([cue(0.0, 1.0, ">> hello there"), cue(1.0, 2.0, ">> hi how are you")])
+    assert text == "hello there\n\nhi how are you"
+
+
+def vtt(lang: str):
+    return [{"ext": "json3", "url": f"https://x/{lang}.json3"}, {"ext": "vtt", "url": f"https://x/{lang}.vtt"}]
+
+
+def test_pick_track_prefers_human_subtitles_in_original_language():
+    info = {
+        "language": "en",
+        "subtitles": {"es": vtt("es"), "en-US": vtt("en-US")},
+        "automatic_captions": {"en-orig": vtt("en-orig")},
+    }
+    assert _pick_track(info, ["es", "en"]) == "https://x/en-US.vtt"
+
+
+def test_pick_track_uses_original_automatic_track_not_translations():
+    info = {
+        "language": "en",
+        "automatic_captions": {"es": vtt("es"), "en-orig": vtt("en-orig"), "en": vtt("en")},
+    }
+    assert _pick_track(info, ["es", "en"]) == "https://x/en-orig.vtt"
+
+
+def test_pick_track_without_usable_track():
+    assert _pick_track({}, ["es", "en"]) is None
+    # Sin idioma original conocido no se elige una traducción automática
+    assert _pick_track({"automatic_captions": {"es": vtt("es")}}, ["es"]) is None
+    # Solo formatos que no son VTT
+    assert _pick_track({"subtitles": {"es": [{"ext": "srv3", "url": "https://x"}]}}, ["es"]) is None
@@ -0,0 +1,365 @@
+"""
+Trazas por etapa de cada trabajo (descarga, compresión, subida, transcripción,
+clasificación, notas...). Cada etapa registra su duración y, si los conoce,
+bytes de entrada/salida, segundos de audio, tokens y reintentos.
+
+    trace = start_trace(source)
+    with span("download") as s:
+        ...
+        s.set(bytes_out=size)
+    finish_trace(trace)
+
+Al terminar, la traza se escribe como JSON por líneas (CONTENTNOTES_TRACE_LOG)
+y se acumula en métricas con formato de texto de Prometheus (archivo
+CONTENTNOTES_METRICS_FILE y, opcionalmente, endpoint HTTP en CONTENTNOTES_METRICS_PORT,
+solo en 127.0.0.1 salvo que CONTENTNOTES_METRICS_HOST indique otra dirección).
+Sin traza activa, span() mide igual pero no se guarda nada.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# --- CONFIGURACIÓN DE TRAZAS ---
+TRACING_ENABLED = os.getenv("CONTENTNOTES_TRACING", "1") == "1"
+TRACE_LOG_PATH = os.getenv("CONTENTNOTES_TRACE_LOG", "/tmp/contentnotes/traces.jsonl")
+METRICS_FILE_PATH = os.getenv("CONTENTNOTES_METRICS_FILE", "/tmp/contentnotes/metrics.prom")
+METRICS_PORT = int(os.getenv("CONTENTNOTES_METRICS_PORT", "0"))   # 0 = sin endpoint HTTP
+# Solo local por defecto; "0.0.0.0" para que un Prometheus de otra máquina lo lea
+METRICS_HOST = os.getenv("CONTENTNOTES_METRICS_HOST", "127.0.0.1")
+
+# Magnitudes que se suman por etapa y por trabajo
+COUNTERS = ("bytes_in", "bytes_out", "audio_seconds", "prompt_tokens", "response_tokens", "retries")
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_current_trace = contextvars.ContextVar("contentnotes_trace", default=None)
+_current_span = contextvars.ContextVar("contentnotes_span", default=None)
+
+
+class Span:
+    """Una etapa medida: duración, atributos y error si lo hubo"""
+
+    def __init__(self, stage: str, trace_id: Optional[str], parent: Optional[str], attrs: Dict):
+        self.stage = stage
+        self.trace_id = trace_id
+        self.parent = parent
+        self.thread = threading.current_thread().name
+        self.started_at = time.time()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self.attrs = {key: value for key, value in attrs.items() if value is not None}
+        self._start = time.monotonic()
+
+    def set(self, **attrs):
+        self.attrs.update({key: value for key, value in attrs.items() if value is not None})
+
+    def add(self, **amounts):
+        for key, value in amounts.items():
+            self.attrs[key] = self.attrs.get(key, 0) + value
+
+    def fail(self, message: str):
+        """Marca la etapa como fallida sin lanzar (funciones que devuelven None)"""
+        self.error = message
+
+    def to_dict(self) -> Dict:
+        return {
+            "stage": self.stage,
+            "parent": self.parent,
+            "thread": self.thread,
+            "started_at": self.started_at,
+            "duration": self.duration,
+            "error": self.error,
+            **self.attrs
+        }
+
+
+class Trace:
+    """Las etapas de un trabajo, desde cualquier hilo que participe en él"""
+
+    def __init__(self, source: str, trace_id: Optional[str] = None):
+        self.id = trace_id or uuid.uuid4().hex
+        self.source = source
+        self.started_at = time.time()
+        self.duration: Optional[float] = None
+        self.status: Optional[str] = None
+        self.spans: List[Span] = []
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status is not None
+
+    def _record(self, span: Span):
+        with self._lock:
+            if not self.finished:
+                self.spans.append(span)
+
+    def totals(self) -> Dict:
+        with self._lock:
+            spans = list(self.spans)
+        totals = {name: 0 for name in COUNTERS}
+        for span in spans:
+            for name in COUNTERS:
+                totals[name] += span.attrs.get(name, 0)
+        return totals
+
+    def timeline(self) -> List[Dict]:
+        """Etapas ordenadas por inicio, con su desfase respecto al inicio del trabajo"""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.started_at)
+        return [dict(span.to_dict(), offset=round(span.started_at - self.started_at, 3)) for span in spans]
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.id,
+            "source": self.source,
+            "started_at": self.started_at,
+            "duration": self.duration,
+            "status": self.status,
+            "totals": self.totals(),
+            "spans": self.timeline()
+        }
+
+
+def start_trace(source: str) -> Optional[Trace]:
+    """Abre la traza de un trabajo en el hilo actual (None si las trazas están desactivadas)"""
+    if not TRACING_ENABLED:
+        return None
+    trace = Trace(source)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(stage: str, trace: Optional[Trace] = None, **attrs):
+    """
+    Mide una etapa dentro de la traza activa (o la indicada).
+    Una excepción queda anotada como error de la etapa y se relanza.
+    """
+    trace = trace or _current_trace.get()
+    parent = _current_span.get()
+    current = Span(stage, trace.id if trace else None, parent.stage if parent else None, attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"[:300]
+        raise
+    finally:
+        current.duration = time.monotonic() - current._start
+        _current_span.reset(token)
+        if trace is not None:
+            trace._record(current)
+
+
+def annotate(**attrs):
+    """Añade atributos a la etapa en curso (sin efecto fuera de una etapa)"""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attrs)
+
+
+def fail(message: str):
+    """Marca la etapa en curso como fallida (cuando el fallo no es una excepción)"""
+    current = _current_span.get()
+    if current is not None:
+        current.fail(message)
+
+
+def add(**amounts):
+    """Suma contadores (p.ej. retries=1) a la etapa en curso"""
+    current = _current_span.get()
+    if current is not None:
+        current.add(**amounts)
+
+
+def record_usage(response, prompt: Optional[str] = None, text: Optional[str] = None):
+    """
+    Tokens de una respuesta de Gemini en la etapa en curso. Sin usage_metadata
+    (p.ej. dobles de prueba) se estiman a partir del texto (~4 caracteres por token).
+    En streaming, response es el último fragmento y text la respuesta completa.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None) if usage else None
+    response_tokens = getattr(usage, "candidates_token_count", None) if usage else None
+    if prompt_tokens is None and prompt:
+        prompt_tokens = len(prompt) // 4 + 1
+    if response_tokens is None:
+        text = text if text is not None else getattr(response, "text", None)
+        if isinstance(text, str):
+            response_tokens = len(text) // 4 + 1
+    annotate(prompt_tokens=prompt_tokens, response_tokens=response_tokens)
+
+
+def bind(fn):
+    """
+    Envuelve fn para que, al ejecutarse en otro hilo (ThreadPoolExecutor),
+    vea el contexto actual: sus etapas se registran en la traza y la etapa
+    actuales, y conserva el resto de ajustes por trabajo (p.ej. el carril
+    y el aviso de cola de rate_limiter).
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # Una copia por llamada: el mismo contexto no puede usarse en dos hilos a la vez
+        return context.copy().run(fn, *args, **kwargs)
+    return run
+
+
+# EXPORTACIÓN
+
+class StageMetrics:
+    """Acumulado del proceso por etapa, para el formato de texto de Prometheus"""
+
+    def __init__(self):
+        self.stages: Dict[str, Dict] = {}
+        self.jobs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, trace: Trace):
+        with self._lock:
+            self.jobs[trace.status] = self.jobs.get(trace.status, 0) + 1
+            for item in trace.timeline():
+                stage = self.stages.setdefault(item["stage"], {
+                    "count": 0, "errors": 0, "duration_sum": 0.0,
+                    "buckets": [0] * len(DURATION_BUCKETS),
+                    **{name: 0 for name in COUNTERS}
+                })
+                duration = item["duration"] or 0.0
+                stage["count"] += 1
+                stage["duration_sum"] += duration
+                if item["error"]:
+                    stage["errors"] += 1
+                for i, bound in enumerate(DURATION_BUCKETS):
+                    if duration <= bound:
+                        stage["buckets"][i] += 1
+                for name in COUNTERS:
+                    stage[name] += item.get(name, 0)
+
+    def prometheus_text(self) -> str:
+        lines = [
+            "# HELP contentnotes_jobs_total Trabajos terminados por estado",
+            "# TYPE contentnotes_jobs_total counter"
+        ]
+        with self._lock:
+            for status, count in sorted(self.jobs.items()):
+                lines.append(f'contentnotes_jobs_total{{status="{status}"}} {count}')
+
+            lines += [
+                "# HELP contentnotes_stage_duration_seconds Duración de cada etapa",
+                "# TYPE contentnotes_stage_duration_seconds histogram"
+            ]
+            for name, stage in sorted(self.stages.items()):
+                for bound, count in zip(DURATION_BUCKETS, stage["buckets"]):
+                    lines.append(f'contentnotes_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'contentnotes_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {stage["count"]}')
+                lines.append(f'contentnotes_stage_duration_seconds_sum{{stage="{name}"}} {stage["duration_sum"]:.6f}')
+                lines.append(f'contentnotes_stage_duration_seconds_count{{stage="{name}"}} {stage["count"]}')
+
+            for counter in ("errors", *COUNTERS):
+                metric = f"contentnotes_stage_{counter}_total"
+                lines += [f"# HELP {metric} Suma de {counter} por etapa", f"# TYPE {metric} counter"]
+                for name, stage in sorted(self.stages.items()):
+                    lines.append(f'{metric}{{stage="{name}"}} {stage[counter]:g}')
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path: str = METRICS_FILE_PATH):
+        """Escribe las métricas de forma atómica (p.ej. para el textfile collector de node_exporter)"""
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+        tmp.write_text(self.prometheus_text(), encoding="utf-8")
+        os.replace(tmp, target)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = get_metrics().prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> Optional[ThreadingHTTPServer]:
+    """Sirve /metrics en segundo plano; None si el puerto no está disponible"""
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"No se pudo abrir el endpoint de métricas en {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+    return server
+
+
+_metrics: Optional[StageMetrics] = None
+_metrics_lock = threading.Lock()
+_log_lock = threading.Lock()
+_last_trace: Optional[Trace] = None
+
+
+def get_metrics() -> StageMetrics:
+    """Métricas compartidas del proceso (abre el endpoint HTTP la primera vez si está configurado)"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = StageMetrics()
+            if METRICS_PORT:
+                start_metrics_server(METRICS_PORT)
+        return _metrics
+
+
+def _write_log(trace: Trace, path: str = TRACE_LOG_PATH):
+    # Una línea por etapa y una de resumen por trabajo: fácil de filtrar con jq o de enviar a un agregador
+    lines = [json.dumps({"event": "span", "trace_id": trace.id, **item}, ensure_ascii=False, default=str)
+             for item in trace.timeline()]
+    lines.append(json.dumps({
+        "event": "job", "trace_id": trace.id, "source": trace.source, "started_at": trace.started_at,
+        "duration": trace.duration, "status": trace.status, **trace.totals()
+    }, ensure_ascii=False, default=str))
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with _log_lock, open(path, "a", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def finish_trace(trace: Optional[Trace], status: str = "ok"):
+    """Cierra la traza y la exporta (log JSON y métricas). Un fallo al exportar no afecta al trabajo."""
+    global _last_trace
+    if trace is None or trace.finished:
+        return
+    with trace._lock:
+        trace.duration = time.monotonic() - trace._start
+        trace.status = status
+    _last_trace = trace
+
+    metrics = get_metrics()
+    metrics.observe(trace)
+    try:
+        _write_log(trace)
+        metrics.write_file()
+    except OSError as e:
+        print(f"No se pudieron exportar las trazas: {e}")
+
+
+def last_trace() -> Optional[Trace]:
+    """Última traza terminada en este proceso (panel de depuración)"""
+    return _last_trace
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+# --- CONFIGURACIÓN DE LA CACHÉ ---
+# Se puede sobreescribir con variables de entorno (útil en contenedores)
+CACHE_DB_PATH = os.getenv("CONTENTNOTES_CACHE_DB", "/tmp/contentnotes/cache/transcripts.sqlite3")
+CACHE_TTL_SECONDS = int(os.getenv("CONTENTNOTES_CACHE_TTL", str(7 * 24 * 3600)))  # 7 días
+CACHE_MAX_BYTES = int(os.getenv("CONTENTNOTES_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))  # 200MB
+
+
+def youtube_key(video_id: str) -> str:
+    """Llave de caché para un video de YouTube"""
+    return f"yt:{video_id}"
+
+
+def file_key(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Llave de caché para un archivo subido (hash SHA-256 del contenido)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return f"file:{digest.hexdigest()}"
+
+
+class TranscriptCache:
+    """
+    Caché persistente de transcripciones en SQLite.
+    Compartida por todas las sesiones de Streamlit y procesos del mismo host.
+    Expulsa entradas por antigüedad (TTL) y por tamaño total (LRU).
+    """
+
+    def __init__(self, db_path: str = CACHE_DB_PATH, ttl_seconds: int = CACHE_TTL_SECONDS,
+                 max_bytes: int = CACHE_MAX_BYTES):
+        self.db_path = Path(db_path)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS transcripts (
+                    key TEXT PRIMARY KEY,
+                    transcript TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_transcripts_access ON transcripts(last_access)")
+
+    @contextmanager
+    def _connect(self):
+        # WAL permite lectores concurrentes mientras otro proceso escribe
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _bump(self, conn: sqlite3.Connection, name: str):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,)
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT transcript, created_at FROM transcripts WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM transcripts WHERE key = ?", (key,))
+                row = None
+
+            if row is None:
+                self.misses += 1
+                self._bump(conn, "misses")
+                return None
+
+            conn.execute("UPDATE transcripts SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            self._bump(conn, "hits")
+            return row[0]
+
+    def set(self, key: str, transcript: str):
+        now = time.time()
+        size = len(transcript.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO transcripts (key, transcript, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, transcript, size, now, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        # 1. Entradas caducadas
+        conn.execute("DELETE FROM transcripts WHERE created_at < ?", (now - self.ttl_seconds,))
+
+        # 2. Si aún nos pasamos del tamaño, borramos las menos usadas recientemente
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for key, size in conn.execute("SELECT key, size FROM transcripts ORDER BY last_access ASC").fetchall():
+            conn.execute("DELETE FROM transcripts WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> Dict:
+        """Contadores de este proceso y globales (todos los procesos)"""
+        with self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcripts"
+            ).fetchone()
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "total_hits": counters.get("hits", 0),
+            "total_misses": counters.get("misses", 0),
+            "entries": entries,
+            "bytes": total
+        }
+
+
+_cache: Optional[TranscriptCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_transcript_cache() -> TranscriptCache:
+    """Obtiene la caché compartida del proceso"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TranscriptCache()
+        return _cache
@@ -0,0 +1,224 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+from gemini_files import READY_DEADLINE_SECONDS, wait_until_active, wait_until_active_async
+from model_registry import get_genai
+from rate_limiter import get_rate_limiter
+from transcript_cache import file_key
+import tracing
+
+# --- CONFIGURACIÓN DE LA CACHÉ DE SUBIDAS ---
+# Gemini borra los archivos subidos a las 48 h; dejamos margen para no usar uno a punto de caducar
+UPLOAD_DB_PATH = os.getenv("CONTENTNOTES_UPLOADS_DB", "/tmp/contentnotes/cache/uploads.sqlite3")
+UPLOAD_TTL_SECONDS = int(os.getenv("CONTENTNOTES_UPLOAD_TTL", str(46 * 3600)))
+UPLOAD_IDLE_SECONDS = int(os.getenv("CONTENTNOTES_UPLOAD_IDLE", str(2 * 3600)))  # Sin uso -> se borra
+SWEEP_INTERVAL_SECONDS = 300
+
+
+class _AsyncKeyLock:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0   # Tareas que lo tienen o lo esperan
+
+
+class UploadCache:
+    """
+    Handles de archivos ya subidos a Gemini, por hash del contenido.
+    Reintentos, otro idioma o un fragmento repetido reutilizan la subida sin
+    volver a esperar a que esté lista. Los archivos no se borran al terminar:
+    un barrido en segundo plano elimina los que llevan tiempo sin usarse.
+    """
+
+    def __init__(self, db_path: str = UPLOAD_DB_PATH, ttl_seconds: int = UPLOAD_TTL_SECONDS,
+                 idle_seconds: int = UPLOAD_IDLE_SECONDS):
+        self.db_path = Path(db_path)
+        self.ttl_seconds = ttl_seconds
+        self.idle_seconds = idle_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        # Un asyncio.Lock solo sirve en su event loop: uno por loop (CLI, job_runner...)
+        self._async_key_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, _AsyncKeyLock]]" = \
+            weakref.WeakKeyDictionary()
+        self._sweeper: Optional[threading.Thread] = None
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS uploads (
+                    key TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        # Dos hilos con el mismo audio no deben subirlo dos veces
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    @asynccontextmanager
+    async def _async_key_lock(self, key: str):
+        # Dos tareas del mismo loop con el mismo audio se turnan; el lock se
+        # descarta en cuanto nadie lo usa, termine la subida bien o mal
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            locks = self._async_key_locks.setdefault(loop, {})
+            entry = locks.setdefault(key, _AsyncKeyLock())
+            entry.users += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            with self._lock:
+                entry.users -= 1
+                if entry.users == 0:
+                    del locks[key]
+
+    def _lookup(self, key: str):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT name FROM uploads WHERE key = ? AND created_at > ?", (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE uploads SET last_used = ? WHERE key = ?", (now, key))
+        if not row:
+            return None
+
+        # Una sola consulta barata: confirma que sigue existiendo y está lista
+        try:
+            remote = get_genai().get_file(row[0])
+            if remote.state.name == "ACTIVE":
+                return remote
+        except Exception:
+            pass
+        self._forget(key)
+        return None
+
+    def _forget(self, key: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM uploads WHERE key = ?", (key,))
+
+    def get_or_upload(self, path: str, deadline: float = READY_DEADLINE_SECONDS):
+        """Archivo ACTIVE en Gemini con el contenido de path (subiéndolo solo si hace falta)"""
+        key = file_key(path)
+        with self._key_lock(key):
+            remote = self._lookup(key)
+            if remote is not None:
+                self.hits += 1
+                tracing.annotate(cache_hit=True)
+                return remote
+
+            self.misses += 1
+            tracing.annotate(cache_hit=False, bytes_out=os.path.getsize(path))
+            remote = wait_until_active(get_rate_limiter().call(get_genai().upload_file, path), deadline=deadline)
+            self._remember(key, remote)
+            return remote
+
+    async def get_or_upload_async(self, path: str, deadline: float = READY_DEADLINE_SECONDS):
+        """
+        Versión async de get_or_upload: hash, consulta y subida van a hilos y la
+        espera hasta ACTIVE no bloquea el event loop. Las tareas con el mismo
+        audio se turnan con un lock async (los hilos con su propio lock).
+        """
+        key = await asyncio.to_thread(file_key, path)
+        async with self._async_key_lock(key):
+            remote = await asyncio.to_thread(self._lookup, key)
+            if remote is not None:
+                self.hits += 1
+                tracing.annotate(cache_hit=True)
+                return remote
+
+            self.misses += 1
+            tracing.annotate(cache_hit=False, bytes_out=os.path.getsize(path))
+            uploaded = await get_rate_limiter().acall(asyncio.to_thread, get_genai().upload_file, path)
+            remote = await wait_until_active_async(uploaded, deadline=deadline)
+            await asyncio.to_thread(self._remember, key, remote)
+            return remote
+
+    def _remember(self, key: str, remote):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO uploads (key, name, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, remote.name, now, now)
+            )
+        self._ensure_sweeper()
+
+    def sweep(self) -> int:
+        """Borra de Gemini los archivos caducados o sin uso reciente; devuelve cuántos"""
+        now = time.time()
+        # SQLite ya serializa entre procesos; self._lock solo protege los diccionarios
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT key, name FROM uploads WHERE created_at < ? OR last_used < ?",
+                (now - self.ttl_seconds, now - self.idle_seconds)
+            ).fetchall()
+            conn.executemany("DELETE FROM uploads WHERE key = ?", [(key,) for key, _ in rows])
+
+        with self._lock:
+            # Los locks de claves barridas sobran (salvo si alguien los tiene cogidos)
+            for key, _ in rows:
+                if key in self._key_locks and not self._key_locks[key].locked():
+                    del self._key_locks[key]
+
+        for _, name in rows:
+            try:
+                get_genai().delete_file(name)
+            except Exception:
+                # Ya caducó o lo borró otro proceso
+                pass
+        return len(rows)
+
+    def _ensure_sweeper(self):
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(target=self._sweep_loop, daemon=True, name="upload-sweeper")
+            self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(SWEEP_INTERVAL_SECONDS)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error en el barrido de archivos subidos: {e}")
+
+    def stats(self) -> Dict:
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM uploads").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+_cache: Optional[UploadCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_upload_cache() -> UploadCache:
+    """Obtiene la caché de subidas compartida del proceso"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = UploadCache()
+        return _cache
@@ -1,165 +1,512 @@
 import re
 import os
-import time
 import subprocess
-import requests  # <--- IMPORTANTE: Necesario para hablar con Cobalt
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
 from pathlib import Path
-import streamlit as st
-import google.generativeai as genai
+from transcript_cache import get_transcript_cache, youtube_key, file_key
+from audio_chunks import probe_duration, split_audio, extract_clip, stitch_transcripts
+from upload_cache import get_upload_cache
+from audio_compact import COMPACT_ENABLED, compact_audio, compaction_report
+from audio_profiles import DEFAULT_PROFILE, AudioProfile, choose_profile, get_profile
+from cobalt_client import CobaltError, get_cobalt_client
+from media_input import copy_output_name, extract_audio, plan_audio, probe_media
+from captions import CAPTIONS_ENABLED, fetch_youtube_captions, is_caption_file, read_caption_file
+from config_loader import get_model_name
+from model_registry import get_model
+from rate_limiter import get_rate_limiter
+import tracing
 
-# --- CONFIGURACIÓN DE COBALT ---
-# Puedes cambiar esta URL si la oficial está saturada.
-# Lista de instancias: https://instances.cobalt.tools/
-COBALT_API_URL = "https://api.cobalt.tools/api/json"
+# La configuración de Cobalt (instancias, timeouts) vive en cobalt_client.py
+
+# --- CONFIGURACIÓN DE TRANSCRIPCIÓN ---
+TRANSCRIBE_PROMPT = "Transcribe completamente este audio. Usa [HABLANTE X] para múltiples voces. Solo el texto."
+CHUNK_PROMPT = (
+    "Transcribe completamente este fragmento de audio (parte {index} de {total}). "
+    "Usa [HABLANTE X] para múltiples voces. Solo el texto."
+)
+CHUNKED_MIN_SECONDS = 1200     # A partir de 20 minutos se transcribe por fragmentos
+MAX_TRANSCRIBE_WORKERS = 4     # Fragmentos transcritos en paralelo
+SPECULATIVE_PREVIEW_SECONDS = 300  # Minutos iniciales que se transcriben aparte para clasificar antes
+MIN_TRANSCRIPT_CHARS = 50      # Menos que esto se considera una transcripción fallida
+
+# Los formatos de salida de ffmpeg (MP3, Opus, FLAC) viven en audio_profiles.py
+
+# Progreso: (etapa, mensaje). La etapa "error" indica un fallo mostrado al usuario
+ProgressCallback = Callable[[str, str], None]
+
+def print_progress(stage: str, message: str):
+    """Progreso por consola (modo sin interfaz)"""
+    print(f"[{stage}] {message}")
 
 def extract_video_id(url: str) -> str | None:
     """Extrae ID de video de YouTube (útil para nombres de archivo)"""
     match = re.search(r'(?:youtube\.com/watch\?v=|youtu\.be/)([a-zA-Z0-9_-]{11})', url)
     return match.group(1) if match else "video_temp"
 
-def download_with_cobalt(url: str, output_path: str):
+def source_key(source: str, is_youtube: bool) -> str | None:
+    """Llave estable de una fuente: ID de video o hash del archivo"""
+    if is_youtube:
+        video_id = extract_video_id(source)
+        return youtube_key(video_id) if video_id != "video_temp" else None
+    return file_key(source)
+
+def discard_partial(path: str):
+    """Borra una salida a medias: un reintento o una reanudación no debe tomarla por buena"""
+    if os.path.exists(path):
+        os.unlink(path)
+
+def stream_to_ffmpeg(chunks, output_path: str, timeout: int = 300,
+                     progress: ProgressCallback = print_progress,
+                     profile: AudioProfile | None = None) -> bool:
+    """
+    Alimenta el stdin de ffmpeg con los bytes según llegan y escribe
+    directamente el audio optimizado (16 kHz mono). Red y transcodificación
+    se solapan y nunca se guarda el original en disco.
+    """
+    profile = profile or choose_profile()
+    proc = subprocess.Popen(
+        ['ffmpeg', '-i', 'pipe:0', *profile.ffmpeg_args(), '-y', output_path],
+        stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    
+    # Vaciamos stderr en paralelo para que ffmpeg nunca se bloquee escribiendo logs
+    stderr_tail = []
+    def drain():
+        for line in proc.stderr:
+            stderr_tail.append(line)
+            del stderr_tail[:-20]
+    reader = threading.Thread(target=drain, daemon=True)
+    reader.start()
+    
+    try:
+        try:
+            for chunk in chunks:
+                if chunk:
+                    proc.stdin.write(chunk)
+                    tracing.add(bytes_in=len(chunk))
+            proc.stdin.close()
+        except BrokenPipeError:
+            # ffmpeg terminó antes de tiempo; el código de salida lo explica
+            pass
+        proc.wait(timeout=timeout)
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        discard_partial(output_path)
+        raise
+    finally:
+        reader.join(timeout=5)
+    
+    if proc.returncode != 0:
+        discard_partial(output_path)
+        progress("error", f"❌ FFmpeg falló: {b''.join(stderr_tail).decode(errors='ignore')[-300:]}")
+        tracing.fail(f"ffmpeg salió con código {proc.returncode}")
+        return False
+    
+    if not os.path.exists(output_path):
+        return False
+    tracing.annotate(bytes_out=os.path.getsize(output_path))
+    return os.path.getsize(output_path) > 0
+
+def download_with_cobalt(url: str, output_path: str, progress: ProgressCallback = print_progress,
+                         profile: AudioProfile | None = None):
     """
     Actualizado para la API v10 de Cobalt.
+    Descarga el audio y lo transcodifica en streaming: output_path ya es el MP3 optimizado.
+    Usa el cliente compartido: failover entre instancias y descargas reanudables.
     """
-    # La URL de la API v10 suele ser la misma, pero el cuerpo del JSON cambió
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-    }
-    
-    # Payload actualizado para v10
-    payload = {
-        "url": url,
-        "videoQuality": "720",     # Requerido en algunas instancias
-        "audioFormat": "mp3",      # Formato de audio
-        "filenameStyle": "basic",
-        "downloadMode": "audio"    # IMPORTANTE: Solo audio
-    }
+    client = get_cobalt_client()
+    profile = profile or choose_profile()
     
     try:
-        # Intentamos con la instancia oficial o una alternativa si falla
-        response = requests.post(COBALT_API_URL, json=payload, headers=headers, timeout=20)
-        
-        if response.status_code != 200:
-            # Si la instancia oficial falla, podrías intentar con otra de la lista
-            # ej: https://cobalt.api.unblockers.it/api/json
-            st.error(f"Error en Cobalt API ({response.status_code}): {response.text}")
-            return False
-            
-        data = response.json()
+        # 1. Resolver el enlace con la instancia más sana disponible
+        with tracing.span("cobalt_resolve"):
+            download_url = client.resolve(url)
         
-        # En v10, el estado suele ser 'tunnel', 'redirect' o 'success'
-        status = data.get("status")
-        download_url = data.get("url")
-
-        if status == "error":
-            st.error(f"Cobalt dice: {data.get('text')}")
-            return False
-
-        if not download_url:
-            st.error("No se encontró el enlace de descarga en la respuesta.")
-            return False
-
-        # 2. Descargar el archivo
-        with requests.get(download_url, stream=True) as r:
-            r.raise_for_status()
-            with open(output_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=1024*1024): # Chunks de 1MB
-                    f.write(chunk)
+        # 2. Descargar y transcodificar a la vez (sin archivo intermedio)
+        with tracing.span("download", profile=profile.name):
+            return stream_to_ffmpeg(client.iter_download(download_url), output_path,
+                                    progress=progress, profile=profile)
+    
+    except CobaltError as e:
+        progress("error", f"Error en Cobalt API: {str(e)}")
+        return False
+    except Exception as e:
+        progress("error", f"Error de conexión: {str(e)}")
+        return False
         
-        return True
+def _transcribe_file(model, audio_path: str, prompt: str, job=None) -> str:
+    """
+    Transcribe un audio subido a Gemini. La subida se reutiliza si el mismo
+    contenido ya está en Gemini (reintentos, otro idioma, fragmentos repetidos)
+    y no se borra aquí: el barrido de upload_cache la retira cuando deja de usarse.
+    """
+    with tracing.span("upload"):
+        uploaded = get_upload_cache().get_or_upload(audio_path)
+    if job:
+        job.done("upload", {"name": uploaded.name, "path": audio_path})
+    
+    with tracing.span("transcribe_call"):
+        # La reserva cubre el prompt; al terminar se cobran los tokens reales del audio
+        response = get_rate_limiter().call(model.generate_content, [prompt, uploaded],
+                                           tokens=len(prompt) // 4 + 1)
+        tracing.record_usage(response, prompt=prompt)
+    return response.text.strip() if response.text else ""
 
+def notify_partial(on_partial: Optional[Callable[[str], None]], text: str):
+    """Entrega una transcripción parcial sin que un fallo afecte a la principal"""
+    if not on_partial or not text:
+        return
+    try:
+        on_partial(text)
     except Exception as e:
-        st.error(f"Error de conexión: {str(e)}")
+        print(f"Error procesando transcripción parcial: {e}")
+
+# Las decisiones del flujo (caché, reanudación, plan de audio, modo de
+# transcripción) viven en estas funciones y las comparten la versión síncrona
+# y la async (async_pipeline.py): cada una solo pone sus propias llamadas de E/S.
+
+def pending_parts(chunks: List[str], job=None,
+                  on_partial: Optional[Callable[[str], None]] = None) -> Tuple[List[str], List[int], Optional[Callable]]:
+    """
+    Fragmentos ya transcritos en un intento anterior y los que faltan.
+    Si el fragmento 0 ya estaba hecho se entrega ahora: el on_partial devuelto
+    es None y no se vuelve a avisar. Devuelve (parts, pendientes, on_partial).
+    """
+    done_parts = job.partial("transcribe").get("parts", {}) if job else {}
+    parts = [done_parts.get(str(i), "") for i in range(len(chunks))]
+    
+    if parts and parts[0]:
+        notify_partial(on_partial, parts[0])
+        on_partial = None
+    return parts, [i for i in range(len(chunks)) if str(i) not in done_parts], on_partial
+
+def record_part(parts: List[str], index: int, text: str, job=None,
+                on_partial: Optional[Callable[[str], None]] = None):
+    """Guarda un fragmento transcrito (no se repite al reanudar) y entrega el 0 en cuanto termina"""
+    parts[index] = text
+    if job:
+        job.save_partial("transcribe", {"parts": {str(index): text}})
+    if index == 0:
+        notify_partial(on_partial, text)
+
+def preview_path(audio_path: str, temp_dir: str) -> str:
+    return os.path.join(temp_dir, f"{Path(audio_path).stem}_preview{Path(audio_path).suffix}")
+
+def cached_transcript(cache_key: str | None, job=None, progress: ProgressCallback = print_progress) -> str | None:
+    """Transcripción ya hecha: de la caché (por fuente) o de un intento anterior del trabajo"""
+    if cache_key:
+        cached = get_transcript_cache().get(cache_key)
+        if cached:
+            progress("cache", "⚡ Transcripción recuperada de caché")
+            return cached
+    
+    finished = job.get("transcribe") if job else None
+    if finished:
+        progress("resume", "♻️ Transcripción recuperada del trabajo anterior")
+        return finished["transcript"]
+    return None
+
+def save_transcript(transcript: str, cache_key: str | None, job=None, origin: str | None = None):
+    """
+    Registra la transcripción en el trabajo y en la caché. Audio y subtítulos
+    usan la misma clave: otro idioma o un reintento no repiten la descarga.
+    """
+    if job:
+        data = {"transcript": transcript}
+        if origin:
+            data["source"] = origin
+        job.done("transcribe", data)
+    if cache_key:
+        get_transcript_cache().set(cache_key, transcript)
+
+def resume_audio(job, progress: ProgressCallback = print_progress) -> Tuple[str, AudioProfile, bool] | None:
+    """
+    Audio optimizado (o ya compactado) de un intento anterior que sigue en disco:
+    (ruta, perfil, ya compactado) o None si hay que empezar desde la descarga.
+    """
+    resumed_compact = job.get("compact") if job else None
+    resumed = resumed_compact or (job.get("compress") if job else None)
+    if not resumed or not os.path.exists(resumed.get("path", "")):
+        return None
+    progress("resume", "♻️ Reanudando desde el audio ya optimizado")
+    return resumed["path"], get_profile(resumed.get("profile", "mp3_48k")), resumed is resumed_compact
+
+def youtube_audio_path(source: str, temp_dir: str, profile: AudioProfile) -> str:
+    return os.path.join(temp_dir, profile.output_name(f"yt_{extract_video_id(source)}_opt"))
+
+def record_download(audio_path: str, profile: AudioProfile, job=None) -> bool:
+    """Comprueba el audio descargado y lo registra (descarga y compresión son el mismo paso)"""
+    if not os.path.exists(audio_path) or os.path.getsize(audio_path) == 0:
         return False
-        
-def download_and_transcribe(source: str, is_youtube: bool = False) -> str | None:
-    """Descarga audio vía Cobalt y transcribe con Gemini"""
+    if job:
+        job.done("download", {"path": audio_path})
+        job.done("compress", {"path": audio_path, "profile": profile.name})
+    return True
+
+def plan_compress(source: str, info: Dict | None, audio_profile: str | None,
+                  temp_dir: str) -> Tuple[AudioProfile, List[Tuple[str, str, str]]]:
+    """
+    Con el formato ya leído (probe_media) decide cómo preparar un archivo local.
+    Devuelve el perfil y los intentos en orden, (acción, salida, mensaje):
+    copia y, si falla, recodificación; solo recodificación; o ninguno ("skip").
+    """
+    profile = choose_profile(info["duration"] if info else None, audio_profile)
+    action, profile = plan_audio(source, info, profile, explicit=(audio_profile or DEFAULT_PROFILE) != "auto")
+    stem = f"{Path(source).stem}_opt"
+    
+    attempts = []
+    if action == "copy":
+        attempts.append(("copy", os.path.join(temp_dir, copy_output_name(stem, info)),
+                         f"⚡ Extrayendo el audio sin recodificar ({info['audio_codec']})..."))
+    if action in ("copy", "encode"):
+        # Algunos contenedores no admiten la copia directa: se recodifica
+        attempts.append(("encode", os.path.join(temp_dir, profile.output_name(stem)),
+                         f"🔧 Optimizando audio con FFmpeg ({profile.name})..."))
+    return profile, attempts
+
+def finish_compress(span, source: str, action: str, output: str | None, profile: AudioProfile,
+                    job=None, progress: ProgressCallback = print_progress) -> str:
+    """Cierra la etapa de compresión y devuelve el audio a transcribir (el original si ffmpeg falló)"""
+    if action == "skip":
+        progress("compress", "⚡ El audio ya está en un formato apto: no se recodifica")
+    elif not output:
+        span.fail("ffmpeg no generó el audio comprimido")
+    span.set(action=action, bytes_out=os.path.getsize(output) if output else None)
+    
+    audio_path = output or source
+    if job and (output or action == "skip"):
+        job.done("compress", {"path": audio_path, "profile": profile.name})
+    return audio_path
+
+def compact_path(audio_path: str, temp_dir: str, profile: AudioProfile) -> str:
+    return os.path.join(temp_dir, profile.output_name(f"{Path(audio_path).stem}_compact"))
+
+def finish_compact(span, result: Dict | None, audio_path: str, source: str, profile: AudioProfile,
+                   job=None, progress: ProgressCallback = print_progress) -> str:
+    """Cierra la etapa de compactación y devuelve el audio a transcribir (el compactado si lo hay)"""
+    if result:
+        span.set(bytes_out=os.path.getsize(result["path"]), removed_seconds=round(result["removed_seconds"], 2))
+        progress("compact", compaction_report(result))
+        if audio_path != source and os.path.exists(audio_path):
+            os.unlink(audio_path)
+        audio_path = result["path"]
+    # El mapa de tiempos queda en el trabajo para rastrear marcas hasta el original
+    if job:
+        job.done("compact", dict(result or {"path": audio_path, "removed_seconds": 0.0}, profile=profile.name))
+    return audio_path
+
+def transcription_mode(chunked: bool | None, on_partial: Optional[Callable[[str], None]],
+                       duration: float | None) -> str:
+    """
+    "chunked" (fragmentos en paralelo), "preview" (audio completo y, aparte, los
+    primeros minutos para clasificar antes) o "single".
+    chunked: None = según la duración; sin duración conocida no se fragmenta.
+    """
+    if chunked is None:
+        chunked = bool(duration) and duration >= CHUNKED_MIN_SECONDS
+    if chunked and duration:
+        return "chunked"
+    if on_partial and duration and duration >= 2 * SPECULATIVE_PREVIEW_SECONDS:
+        return "preview"
+    return "single"
+
+def transcribe_chunked(model, audio_path: str, temp_dir: str, duration: float,
+                       max_workers: int = MAX_TRANSCRIBE_WORKERS,
+                       on_partial: Optional[Callable[[str], None]] = None, job=None) -> str:
+    """
+    Transcribe audios largos por fragmentos en paralelo.
+    El tiempo total escala con el número de workers, no con la duración.
+    on_partial recibe el fragmento 0 en cuanto termina (p.ej. para clasificar ya):
+    el primero en terminar suele ser el último, más corto y poco representativo.
+    Con job, cada fragmento transcrito se guarda y no se repite al reanudar.
+    """
+    chunks = split_audio(audio_path, temp_dir, duration)
+    parts, pending, on_partial = pending_parts(chunks, job, on_partial)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                pool.submit(tracing.bind(_transcribe_file), model, chunks[i],
+                            CHUNK_PROMPT.format(index=i + 1, total=len(chunks))): i
+                for i in pending
+            }
+            for future in as_completed(futures):
+                record_part(parts, futures[future], future.result(), job, on_partial)
+    finally:
+        for chunk in chunks:
+            if os.path.exists(chunk):
+                os.unlink(chunk)
+    
+    return stitch_transcripts(parts)
+
+def transcribe_with_preview(model, audio_path: str, temp_dir: str,
+                            on_partial: Callable[[str], None], job=None) -> str:
+    """
+    Transcribe el audio completo y, en paralelo, sus primeros minutos para
+    que la clasificación pueda empezar antes de tener el texto completo.
+    """
+    try:
+        preview = extract_clip(audio_path, preview_path(audio_path, temp_dir), 0, SPECULATIVE_PREVIEW_SECONDS)
+    except RuntimeError as e:
+        print(f"Sin vista previa, se transcribe solo el audio completo: {e}")
+        return _transcribe_file(model, audio_path, TRANSCRIBE_PROMPT, job=job)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            full = pool.submit(tracing.bind(_transcribe_file), model, audio_path, TRANSCRIBE_PROMPT, job)
+            partial = pool.submit(tracing.bind(_transcribe_file), model, preview, TRANSCRIBE_PROMPT)
+            try:
+                notify_partial(on_partial, partial.result())
+            except Exception as e:
+                print(f"Error transcribiendo la vista previa: {e}")
+            return full.result()
+    finally:
+        if os.path.exists(preview):
+            os.unlink(preview)
+
+def download_and_transcribe(source: str, is_youtube: bool = False, chunked: bool | None = None,
+                            on_partial: Optional[Callable[[str], None]] = None,
+                            progress: ProgressCallback = print_progress, job=None,
+                            compact: bool | None = None, audio_profile: str | None = None,
+                            captions: bool | None = None) -> str | None:
+    """
+    Descarga audio vía Cobalt y transcribe con Gemini.
+    chunked: None = automático según duración, True/False = forzar modo.
+    compact: quitar silencios largos antes de subir (None = CONTENTNOTES_COMPACT).
+    audio_profile: perfil de codificación (audio_profiles.PROFILES); None/"auto" = según duración.
+    captions: usar los subtítulos del video si existen (None = CONTENTNOTES_CAPTIONS).
+    Los archivos .vtt/.srt se leen directamente, sin audio.
+    on_partial: recibe la primera transcripción parcial disponible (modo especulativo).
+    progress: recibe (etapa, mensaje); no depende de ninguna interfaz.
+    job: trabajo persistente (job_store); reanuda desde la última etapa completada.
+    """
     
     temp_dir = "/tmp/contentnotes"
     os.makedirs(temp_dir, exist_ok=True)
+    stage = "download"
+    
+    def fail(message: str):
+        progress("error", message)
+        if job:
+            job.fail(stage, message)
+        return None
     
     try:
-        if is_youtube:
-            video_id = extract_video_id(source)
-            audio_path = os.path.join(temp_dir, f"yt_{video_id}.mp3")
-            
-            with st.status("🚀 Procesando con Cobalt API..."):
-                # Llamamos a la función de Cobalt en lugar de usar yt-dlp
-                success = download_with_cobalt(source, audio_path)
-                
-                if not success:
-                    return None
-                
-                time.sleep(1) # Un respiro para asegurar escritura en disco
-                
-                if not os.path.exists(audio_path) or os.path.getsize(audio_path) == 0:
-                    st.error("❌ El archivo de audio parece estar vacío.")
-                    return None
-        else:
-            audio_path = source
+        # Caché de transcripciones: por ID de video o por hash del archivo
+        cache_key = job.source_key if job else source_key(source, is_youtube)
+        transcript = cached_transcript(cache_key, job, progress)
+        if transcript:
+            return transcript
         
-        # --- A PARTIR DE AQUÍ ES TU LÓGICA ORIGINAL DE FFMPEG Y GEMINI ---
+        # Vía rápida: subtítulos ya existentes en lugar de transcribir el audio
+        if is_caption_file(source):
+            stage = "transcribe"
+            progress("captions", "💬 Leyendo subtítulos...")
+            with tracing.span("captions", origin="file", bytes_in=os.path.getsize(source)) as span:
+                transcript = read_caption_file(source)
+                span.set(chars=len(transcript or ""))
+            if not transcript:
+                return fail("❌ No se pudieron leer los subtítulos.")
+            save_transcript(transcript, cache_key, job, origin="captions")
+            return transcript
         
-        # Comprimir para optimizar tokens (balance calidad-tamaño)
-        file_size_mb = os.path.getsize(audio_path) / (1024 * 1024)
+        if is_youtube and (CAPTIONS_ENABLED if captions is None else captions):
+            progress("captions", "💬 Buscando subtítulos...")
+            with tracing.span("captions", origin="youtube") as span:
+                transcript = fetch_youtube_captions(source)
+                span.set(found=bool(transcript), chars=len(transcript or ""))
+            if transcript:
+                progress("captions", "⚡ Subtítulos encontrados: se omite la transcripción del audio")
+                save_transcript(transcript, cache_key, job, origin="captions")
+                return transcript
         
-        with st.status("🔧 Optimizando audio con FFmpeg..."):
-            compressed = os.path.join(temp_dir, f"{Path(audio_path).stem}_opt.mp3")
+        known_duration = None   # Duración ya medida del audio a transcribir (evita otro ffprobe)
+        resumed = resume_audio(job, progress)
+        if resumed:
+            audio_path, profile, compacted = resumed
+        
+        elif is_youtube:
+            compacted = False
+            profile = choose_profile(name=audio_profile)
+            audio_path = youtube_audio_path(source, temp_dir, profile)
             
-            # Usamos ffmpeg para asegurar que el formato sea digerible por Gemini
-            subprocess.run([
-                'ffmpeg', '-i', audio_path,
-                '-acodec', 'libmp3lame', '-b:a', '48k', '-ar', '16000', '-ac', '1',
-                '-y', compressed
-            ], capture_output=True, timeout=300)
+            progress("download", "🚀 Procesando con Cobalt API + FFmpeg...")
+            # Llamamos a la función de Cobalt en lugar de usar yt-dlp
+            if not download_with_cobalt(source, audio_path, progress=progress, profile=profile):
+                # download_with_cobalt ya informó del motivo
+                if job:
+                    job.fail(stage, "Cobalt/FFmpeg")
+                return None
+            if not record_download(audio_path, profile, job):
+                return fail("❌ El archivo de audio parece estar vacío.")
+        else:
+            compacted = False
+            if job:
+                job.done("download", {"path": source})
             
-            if os.path.exists(compressed):
-                # Borramos el original pesado
-                if is_youtube and os.path.exists(audio_path):
-                    os.unlink(audio_path)
-                audio_path = compressed
-                file_size_mb = os.path.getsize(audio_path) / (1024 * 1024)
+            # Comprimir para optimizar tokens (balance calidad-tamaño)
+            stage = "compress"
+            with tracing.span("compress", bytes_in=os.path.getsize(source)) as span:
+                # Una sola lectura del formato decide si hay que recodificar, solo extraer el audio o nada
+                info = probe_media(source)
+                known_duration = info["duration"] if info else None
+                profile, attempts = plan_compress(source, info, audio_profile, temp_dir)
+                span.set(profile=profile.name)
+                
+                action, output = "skip", None
+                for action, path, message in attempts:
+                    progress("compress", message)
+                    if extract_audio(source, path, action, profile, info):
+                        output = path
+                        break
+                    discard_partial(path)
+                audio_path = finish_compress(span, source, action, output, profile, job, progress)
+        
+        # Compactar: menos audio = subida, tokens y transcripción más rápidos
+        if (COMPACT_ENABLED if compact is None else compact) and not compacted:
+            stage = "compact"
+            progress("compact", "✂️ Buscando silencios...")
+            with tracing.span("compact", bytes_in=os.path.getsize(audio_path)) as span:
+                result = compact_audio(audio_path, compact_path(audio_path, temp_dir, profile), profile.ffmpeg_args())
+                audio_path = finish_compact(span, result, audio_path, source, profile, job, progress)
+            if result:
+                known_duration = None
         
         # Transcribir con Gemini
-        with st.status(f"🎙️ Transcribiendo ({file_size_mb:.1f}MB)..."):
-            model = genai.GenerativeModel("gemini-2.0-flash") # Actualizado a 2.0 (más rápido) o usa 1.5
+        stage = "transcribe"
+        duration = None
+        if chunked is None or chunked or on_partial:
+            duration = known_duration or probe_duration(audio_path)
+        mode = transcription_mode(chunked, on_partial, duration)
+        
+        progress("transcribe", f"🎙️ Transcribiendo ({os.path.getsize(audio_path) / (1024 * 1024):.1f}MB)...")
+        model = get_model(get_model_name("transcribe"))  # config.json -> "models"
+        
+        try:
+            with tracing.span("transcribe", mode=mode, audio_seconds=duration, bytes_in=os.path.getsize(audio_path)):
+                if mode == "chunked":
+                    transcript = transcribe_chunked(model, audio_path, temp_dir, duration,
+                                                    on_partial=on_partial, job=job)
+                elif mode == "preview":
+                    transcript = transcribe_with_preview(model, audio_path, temp_dir, on_partial, job=job)
+                else:
+                    transcript = _transcribe_file(model, audio_path, TRANSCRIBE_PROMPT, job=job)
             
-            try:
-                uploaded = genai.upload_file(audio_path)
-                
-                # Esperar a que esté listo
-                for _ in range(40):
-                    if genai.get_file(uploaded.name).state.name == "ACTIVE":
-                        break
-                    time.sleep(2)
-                
-                response = model.generate_content([
-                    "Transcribe completamente este audio. Usa [HABLANTE X] para múltiples voces. Solo el texto.",
-                    uploaded
-                ])
-                
-                transcript = response.text.strip() if response.text else None
-                
-                # Limpieza en la nube
-                genai.delete_file(uploaded.name)
-                
-                # Limpieza local
-                if os.path.exists(audio_path):
-                    os.unlink(audio_path)
-                
-                if not transcript or len(transcript) < 50:
-                    st.error("⚠️ La transcripción fue muy corta o falló.")
-                    return None
-                
-                return transcript
-                
-            except Exception as e:
-                st.error(f"⚠️ Error Gemini: {str(e)[:100]}")
-                return None
+            if not transcript or len(transcript) < MIN_TRANSCRIPT_CHARS:
+                return fail("⚠️ La transcripción fue muy corta o falló.")
+            save_transcript(transcript, cache_key, job)
+            
+            # Limpieza local (nunca el archivo original del usuario)
+            if audio_path != source and os.path.exists(audio_path):
+                os.unlink(audio_path)
+            
+            return transcript
+        
+        except Exception as e:
+            return fail(f"⚠️ Error Gemini: {str(e)[:100]}")
     
     except Exception as e:
-        st.error(f"❌ Error General: {str(e)}")
-        return None
-
+        return fail(f"❌ Error General: {str(e)}")